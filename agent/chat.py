@@ -1,61 +1,17 @@
-import os
 import random
-import json
+from typing import Optional
 from dotenv import load_dotenv
-from typing import TypedDict
 from langgraph.graph import StateGraph, END
-from langchain_groq import ChatGroq
-from langchain.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
+from core.personas import Persona, State, motor
 
 # ========================
 # 1. Configuración
 # ========================
 load_dotenv()
-api_key = os.getenv("GROQ_API_KEY")
-if not api_key:
-    raise ValueError("en el .env no hay una api valida")
-
-# LLM principal: Groq
-llm = ChatGroq(
-    model="Llama-3.1-8B-Instant",
-    api_key=api_key,
-    temperature=0.4,
-    max_tokens=110 
-)
 
-# LLM de respaldo: Hugging Face (gratuito)
-from langchain.chat_models import ChatOpenAI
-from langchain.schema import HumanMessage
-
-def llm_huggingface_fallback(prompt_text: str) -> str:
-    """
-    Fallback a Hugging Face usando API Key
-    """
-    try:
-        from transformers import pipeline
-        hf_api_key = os.getenv("HUGGINGFACE_API_KEY")
-        if not hf_api_key:
-            raise ValueError("No se encontró HUGGINGFACE_API_KEY en el .env")
-        
-        # Inicializamos pipeline usando la API
-        generator = pipeline(
-            "text-generation",
-            model="tiiuae/falcon-7b-instruct",
-            device=-1,  # CPU local, pero con token la llamada va a HuggingFace Hub
-            use_auth_token=hf_api_key
-        )
-
-        output = generator(
-            prompt_text,
-            max_length=150,
-            do_sample=True,
-            top_p=0.95
-        )
-        return output[0]["generated_text"]
-    except Exception as e:
-        print("❌ Error fallback Hugging Face:", e)
-        return "Lo siento, no pude generar la respuesta."
+# Agente de chat principal: mapeo de procesos para la auditoría.
+# El turno (memoria, recuperación, cascada, presupuesto, persistencia) es el
+# motor compartido de core/personas.py; aquí solo se declara la persona.
 
 # ========================
 # 2. Prompt optimizado para tokenización
@@ -90,95 +46,44 @@ Eres GLY-AI, agente de GLYNNE. Tu misión: conducir una conversación con el usu
 RESPUESTA:
 """
 
-
-prompt = PromptTemplate(
-    input_variables=["rol", "mensaje", "historial"],
-    template=Prompt_estructura.strip(),
-)
-
 # ========================
-# 3. Estado global
+# 3. Persona (LLMs del pool compartido, presupuesto según el límite de palabras del prompt)
 # ========================
-class State(TypedDict):
-    mensaje: str
-    rol: str
-    historial: str
-    respuesta: str
-    user_id: str
+persona = Persona(
+    "chat",
+    Prompt_estructura,
+    modelo="Llama-3.1-8B-Instant",
+    modelo_grande="llama-3.3-70b-versatile",  # modo cascada (GLY_CASCADA): escala al 70B solo en turnos difíciles
+    por_defecto="pequeno",
+    ventana=2,
+    archivo="conversacion_temp.json",
+    fallback_local=True,  # ante un error de Groq responde el modelo local (core/inferencia_local.py)
+    rol="auditor",
+)
+motor.registrar(persona)
 
-# memoria por usuario
-usuarios = {}
+# memoria por usuario (reinicio O(1) por generaciones, ver core/sesiones.py), compartida con el motor
+usuarios = motor.usuarios("chat")
+indices = motor.indices("chat")
 
 def get_memory(user_id: str):
-    if user_id not in usuarios:
-        # limitar memoria para reducir tokens: solo guardar últimos 2 mensajes
-        usuarios[user_id] = ConversationBufferMemory(
-            memory_key="historial",
-            input_key="mensaje",
-            output_key="respuesta",
-            k=2
-        )
-    return usuarios[user_id]
+    return usuarios.obtener(user_id)
 
 # ========================
-# 4. Función de almacenamiento temporal en JSON
+# 4. Transcripción para los auditores (core/transcripciones.py)
 # ========================
-TEMP_JSON_PATH = "conversacion_temp.json"
-
-# inicializa archivo vacío al iniciar si no existe
-if not os.path.exists(TEMP_JSON_PATH):
-    with open(TEMP_JSON_PATH, "w", encoding="utf-8") as f:
-        json.dump([], f)
-
-def guardar_conversacion(user_msg: str, ai_resp: str):
-    """Guarda cada intercambio de la conversación en un solo JSON temporal"""
-    if not os.path.exists(TEMP_JSON_PATH):
-        # crea archivo vacío si no existe
-        with open(TEMP_JSON_PATH, "w", encoding="utf-8") as f:
-            json.dump([], f)
-
-    with open(TEMP_JSON_PATH, "r+", encoding="utf-8") as f:
-        try:
-            data = json.load(f)
-            if not isinstance(data, list):
-                data = []
-        except json.JSONDecodeError:
-            data = []
-        data.append({"user": user_msg, "ai": ai_resp})
-        f.seek(0)
-        json.dump(data, f, ensure_ascii=False, indent=2)
-        f.truncate()  # elimina contenido residual si existía
+TEMP_JSON_PATH = persona.archivo  # nombre de la transcripción (el del antiguo JSON temporal)
+
+def guardar_conversacion(user_msg: str, ai_resp: str, user_id: Optional[str] = None):
+    """Guarda cada intercambio de la conversación en la transcripción compartida"""
+    motor.persistencia(TEMP_JSON_PATH).guardar(user_msg, ai_resp, user_id)
 
 # ========================
 # 5. Nodo principal
 # ========================
 def agente_node(state: State) -> State:
-    memory = get_memory(state.get("user_id", "default"))
-    historial = memory.load_memory_variables({}).get("historial", "")
-
-    texto_prompt = prompt.format(
-        rol=state["rol"],
-        mensaje=state["mensaje"],
-        historial=historial
-    )
-
-    try:
-        # Intentamos Groq primero
-        respuesta = llm.invoke(texto_prompt).content
-    except Exception as e:
-        print("❌ Error en Groq LLM:", e)
-        respuesta = llm_huggingface_fallback(texto_prompt)
-
-    # guardar en memoria
-    memory.save_context({"mensaje": state["mensaje"]}, {"respuesta": respuesta})
-
-    # guardar en JSON temporal
-    guardar_conversacion(state["mensaje"], respuesta)
-
-    # actualizar estado
-    state["respuesta"] = respuesta
-    state["historial"] = historial
-    return state
+    # se pide al motor en cada turno: recoge la versión recargada si personas/chat.json la reemplaza
+    return motor.obtener("chat").turno(state)
 
 # ========================
 # 6. Construcción del grafo
@@ -197,4 +102,4 @@ print("LLM iniciado con LangGraph")
 user_id = str(random.randint(10000, 90000))
 print(f"tu user id es {user_id}")
 
-rol = "auditor"
\ No newline at end of file
+rol = "auditor"
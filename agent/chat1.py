@@ -1,28 +1,17 @@
-import os
 import random
-import json
+from typing import Optional
 from dotenv import load_dotenv
-from typing import TypedDict
-from datetime import datetime
 from langgraph.graph import StateGraph, END
-from langchain_groq import ChatGroq
-from langchain.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
+from core.personas import Persona, State, motor
 
 # ========================
 # 1. Configuración
 # ========================
 load_dotenv()
-api_key = os.getenv("GROQ_API_KEY")
-if not api_key:
-    raise ValueError("en el .env no hay una api valida")
-
-llm = ChatGroq(
-    model="llama-3.3-70b-versatile",
-    api_key=api_key,
-    temperature=0.4,
-     
-)
+
+# Agente guía de IA (chat1): responde dudas, no recolecta datos.
+# El turno (memoria, recuperación, cascada, presupuesto, persistencia) es el
+# motor compartido de core/personas.py; aquí solo se declara la persona.
 
 # ========================
 # 2. Prompt optimizado para tokenización
@@ -43,90 +32,44 @@ Consulta: {mensaje}
 [RESPUESTA COMO {rol}]
 """
 
-prompt = PromptTemplate(
-    input_variables=["rol", "mensaje", "historial", "fecha"],
-    template=Prompt_estructura.strip(),
-)
-
 # ========================
-# 3. Estado global
+# 3. Persona (LLMs del pool compartido, presupuesto según el límite de palabras del prompt)
 # ========================
-class State(TypedDict):
-    mensaje: str
-    rol: str
-    historial: str
-    respuesta: str
-    user_id: str
+persona = Persona(
+    "chat1",
+    Prompt_estructura,
+    modelo="Llama-3.1-8B-Instant",  # modo cascada (GLY_CASCADA): turnos simples al 8B
+    modelo_grande="llama-3.3-70b-versatile",
+    por_defecto="grande",
+    ventana=3,
+    recorte_lineas=6,  # últimos 3 intercambios (≈ 2 líneas cada uno)
+    archivo="conversacion_temp.json",
+    rol="auditor",
+)
+motor.registrar(persona)
 
-# memoria por usuario
-usuarios = {}
+# memoria por usuario (reinicio O(1) por generaciones, ver core/sesiones.py), compartida con el motor
+usuarios = motor.usuarios("chat1")
+indices = motor.indices("chat1")
 
 def get_memory(user_id: str):
-    if user_id not in usuarios:
-        # limitar memoria para reducir tokens: solo últimos 3 mensajes
-        usuarios[user_id] = ConversationBufferMemory(
-            memory_key="historial",
-            input_key="mensaje",
-            output_key="respuesta",
-            k=3
-        )
-    return usuarios[user_id]
+    return usuarios.obtener(user_id)
 
 # ========================
-# 4. Función de almacenamiento temporal en JSON
+# 4. Transcripción para los auditores (core/transcripciones.py)
 # ========================
-TEMP_JSON_PATH = "conversacion_temp.json"
-
-if not os.path.exists(TEMP_JSON_PATH):
-    with open(TEMP_JSON_PATH, "w", encoding="utf-8") as f:
-        json.dump([], f)
-
-def guardar_conversacion(user_msg: str, ai_resp: str):
-    with open(TEMP_JSON_PATH, "r+", encoding="utf-8") as f:
-        try:
-            data = json.load(f)
-            if not isinstance(data, list):
-                data = []
-        except json.JSONDecodeError:
-            data = []
-        data.append({"user": user_msg, "ai": ai_resp})
-        f.seek(0)
-        json.dump(data, f, ensure_ascii=False, indent=2)
-        f.truncate()
+TEMP_JSON_PATH = persona.archivo  # nombre de la transcripción (el del antiguo JSON temporal)
+
+def guardar_conversacion(user_msg: str, ai_resp: str, user_id: Optional[str] = None):
+    """Guarda cada intercambio de la conversación en la transcripción compartida"""
+    motor.persistencia(TEMP_JSON_PATH).guardar(user_msg, ai_resp, user_id)
 
 # ========================
 # 5. Nodo principal
 # ========================
 def agente_node(state: State) -> State:
-    memory = get_memory(state.get("user_id", "default"))
-    historial = memory.load_memory_variables({}).get("historial", "")
-
-    # limitar historial a últimos 3 mensajes (si k falla)
-    if historial:
-        lineas = historial.strip().split("\n")
-        if len(lineas) > 6:  # cada intercambio ≈ 2 líneas
-            historial = "\n".join(lineas[-6:])
-
-    fecha_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    texto_prompt = prompt.format(
-        rol=state["rol"],
-        mensaje=state["mensaje"],
-        historial=historial,
-        fecha=fecha_actual
-    )
-
-    respuesta = llm.invoke(texto_prompt).content
-
-    # guardar en memoria
-    memory.save_context({"mensaje": state["mensaje"]}, {"respuesta": respuesta})
-
-    # guardar en JSON temporal
-    guardar_conversacion(state["mensaje"], respuesta)
-
-    state["respuesta"] = respuesta
-    state["historial"] = historial
-    return state
+    # se pide al motor en cada turno: recoge la versión recargada si personas/chat1.json la reemplaza
+    return motor.obtener("chat1").turno(state)
 
 # ========================
 # 6. Construcción del grafo
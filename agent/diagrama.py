@@ -2,20 +2,18 @@
 import os
 import random
 from dotenv import load_dotenv
-from typing import TypedDict
+from typing import Optional, TypedDict
 from langgraph.graph import StateGraph, END
-from langchain_groq import ChatGroq
+from core import consumo
+from core.key_pool import pool
 from langchain.prompts import PromptTemplate
 from langchain.memory import ConversationBufferMemory
 
 load_dotenv()
-api_key = os.getenv("GROQ_API_KEY")
-if not api_key:
-    raise ValueError("en el .env no hay una api valida")
 
-llm = ChatGroq(
+llm = pool.llm(
+    agente="diagrama",
     model="llama-3.3-70b-versatile",
-    api_key=api_key,
     temperature=0.4,
 )
 
@@ -37,12 +35,12 @@ Cada relación conecta dos nodos (source → target) con una descripción de có
 
 [FORMATO DE SALIDA]
 Devuelve ÚNICAMENTE un JSON con esta estructura:
-{
-  "ecosistema": {
+{{
+  "ecosistema": {{
     "nodos": [...],
     "relaciones": [...]
-  }
-}
+  }}
+}}
 
 [ENTRADA: CONVERSACIÓN AUDITADA]
 {conversacion}
@@ -58,9 +56,11 @@ prompt = PromptTemplate(
 # ========================
 # Generador de Ecosistema
 # ========================
-def generar_ecosistema(conversacion: str) -> dict:
+def generar_ecosistema(conversacion: str, user_id: Optional[str] = None) -> dict:
     texto_prompt = prompt.format(conversacion=conversacion)
-    respuesta = llm.invoke(texto_prompt).content
+    # tokens al libro de consumo del usuario (y sujetos a su cuota, ver core/consumo.py)
+    with consumo.usuario(user_id):
+        respuesta = llm.invoke(texto_prompt).content
 
     try:
         import json
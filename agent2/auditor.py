@@ -1,32 +1,35 @@
 # auditor.py
 import os
-import json
 from datetime import datetime
+from typing import Optional
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
+from core.key_pool import pool
+from core import consumo, inferencia_local, metrics, tracing
+from core.secciones import DocumentoPorSecciones, modo_secciones
+from core.borradores import Borradores, huella_pendientes, registrar as registrar_borradores
+from core.auditorias import SeccionAuditada, crear_almacen, huella, rangos
+from core.recuperacion import IndiceBM25, TOKENS_DOCUMENTO, recuperacion_activa
+from core.transcripciones import transcripcion
+from core.turnos import turnos
 from langchain.prompts import PromptTemplate
 
 # ========================
 # 1. Cargar entorno y API
 # ========================
 load_dotenv()
-api_key = os.getenv('GROQ_API_KEY2')
 hf_api_key = os.getenv('HUGGINGFACE_API_KEY2')
 
-if not api_key:
-    raise ValueError('No hay una API key válida de Groq en el .env')
-
 if not hf_api_key:
     raise ValueError('No hay una API key válida de Hugging Face en el .env')
 
 # ========================
 # 2. Inicializar LLM principal (Groq)
 # ========================
-llm = ChatGroq(
+# comparte el pool de keys con los agentes de chat (GROQ_API_KEY, GROQ_API_KEY2, ...)
+llm = pool.llm(
+    agente="plan",
     model="Llama-3.1-8B-Instant",
-    api_key=api_key,
     temperature=0.7,
-
 )
 
 # ========================
@@ -34,26 +37,11 @@ llm = ChatGroq(
 # ========================
 def llm_huggingface_fallback(prompt_text: str) -> str:
     """
-    Fallback a Hugging Face usando API Key
+    Fallback al modelo de Hugging Face en CPU local, compartido con los demás
+    agentes y generado en lote (core/inferencia_local.py)
     """
     try:
-        from transformers import pipeline
-
-        generator = pipeline(
-            "text-generation",
-            model="tiiuae/falcon-7b-instruct",
-            device=-1,
-            use_auth_token=hf_api_key
-        )
-
-        output = generator(
-            prompt_text,
-            max_length=500,
-            do_sample=True,
-            top_p=0.95
-        )
-        return output[0]["generated_text"]
-
+        return inferencia_local.generar(prompt_text, max_nuevos=500)
     except Exception as e:
         print("❌ Error fallback Hugging Face:", e)
         return "Lo siento, no pude generar la auditoría."
@@ -122,47 +110,239 @@ prompt_template = PromptTemplate(
 )
 
 # ========================
-# 4. Función para generar auditoría
+# 3b. Generación por apartados en paralelo (GLY_DOCUMENTO_MODO=secciones)
 # ========================
-def generar_auditoria():
-    json_path = "conversacion_temp2.json"
-    if not os.path.exists(json_path):
-        raise FileNotFoundError(f"No se encontró el archivo: {json_path}")
+SECCIONES = [
+    ("Portada", "Título: *“Guía de Adaptación Estratégica a la Inteligencia Artificial”*; subtítulo: nombre del usuario (o empresa si la menciona); autor: GLYNNE; fecha del reporte."),
+    ("Resumen Personal", "Describe brevemente quién es el usuario según el historial: su profesión, intereses, fortalezas y nivel de relación con la IA."),
+    ("Visión Estratégica", "Explica cómo la inteligencia artificial puede integrarse en su vida o trabajo según su contexto actual, creencias y aspiraciones."),
+    ("Oportunidades de Aprendizaje", "Enumera áreas de conocimiento o habilidades clave que debería explorar (automatización, modelos de lenguaje, creatividad asistida, herramientas de IA, etc.)."),
+    ("Adaptación Profesional", "Expón cómo sus habilidades actuales pueden evolucionar o complementarse con IA. Incluye ejemplos de aplicaciones posibles dentro de su campo."),
+    ("Propuesta de Ruta Inicial", "Diseña un plan progresivo con pasos concretos para iniciar su transición hacia un entorno más automatizado e inteligente (aprendizaje, práctica, implementación real)."),
+    ("Recursos Sugeridos", "Indica tipos de recursos, herramientas o metodologías que encajen con su perfil (sin mencionar nombres de cursos específicos si no están en el historial)."),
+    ("Estrategia de Crecimiento", "Describe cómo mantener una evolución sostenible en su desarrollo personal o profesional mediante el uso estratégico de la IA."),
+    ("Conclusión", "Cierra con una reflexión positiva sobre los beneficios que obtendrá al integrar la inteligencia artificial en su vida y carrera."),
+]
+
+# el historial va antes de la instrucción del apartado para que todos los
+# prompts compartan el mismo prefijo
+Prompt_seccion = """
+[META]
+Fecha del reporte: {fecha}
+
+Eres GLY-AI, asistente analítico de GLYNNE.
+Estás redactando una guía estratégica personalizada basada exclusivamente en la información del usuario contenida en el historial, para ayudarle a adaptarse al nuevo entorno impulsado por la inteligencia artificial.
+No menciones la conversación ni cómo fue obtenida la información. No inventes ni agregues detalles fuera del historial.
+
+La guía completa tiene estos apartados:
+{indice}
+
+[TONO Y ESTILO]
+- Lenguaje claro, consultivo e inspirador.
+- Enfocado en acción, transformación y visión.
+- Evita tecnicismos innecesarios.
+
+[ENTRADA DEL USUARIO]
+Historial: {historial}
+
+[APARTADO A REDACTAR]
+Redacta únicamente el apartado {numero}. {titulo}: {instruccion}
+Empieza con el título del apartado. No redactes los demás apartados.
+"""
+
+prompt_seccion = PromptTemplate(
+    input_variables=["historial", "fecha", "indice", "numero", "titulo", "instruccion"],
+    template=Prompt_seccion.strip()
+)
 
-    # Leer conversación
-    with open(json_path, "r", encoding="utf-8") as f:
-        conversacion = json.load(f)
+# apartados que dependen solo de parte del historial (regex sobre el mensaje del usuario);
+# los que no figuran se redactan con todo el historial
+DEPENDENCIAS = {
+    "Portada": r"nombre|llamo|soy|empresa|negocio",
+    "Oportunidades de Aprendizaje": r"aprend|curso|estudi|habilidad|conocimiento|\bia\b|inteligencia",
+    "Adaptación Profesional": r"trabaj|profesi|carrera|empleo|rol|oficio|habilidad",
+    "Recursos Sugeridos": r"herramienta|aprend|curso|tiempo|recurso|libro",
+    "Estrategia de Crecimiento": r"meta|objetivo|futuro|crecer|crecimiento|visi[oó]n|plan",
+}
 
-    # Formatear conversación
+# ========================
+# 4. Función para generar auditoría
+# ========================
+def formatear_historial(conversacion: list) -> str:
+    """Convierte la lista de intercambios del JSON temporal en texto para el prompt"""
     historial_texto = ""
     for intercambio in conversacion:
         historial_texto += f"Usuario: {intercambio.get('user', '')}\n"
         historial_texto += f"GLY-AI: {intercambio.get('ai', '')}\n"
+    return historial_texto
 
-    # Obtener fecha actual
-    fecha_actual = datetime.now().strftime("%d/%m/%Y")
-
-    # Crear prompt con fecha
-    prompt_text = prompt_template.format(historial=historial_texto, fecha=fecha_actual)
-
-    # Llamar LLM principal con fallback
-    try:
-        respuesta = llm.invoke(prompt_text)
-        texto_final = respuesta.content if hasattr(respuesta, "content") else str(respuesta)
-    except Exception as e:
-        print("❌ Error en Groq LLM:", e)
-        texto_final = llm_huggingface_fallback(prompt_text)
-
-    # === Limpiar el archivo JSON después de usarlo ===
-    try:
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump([], f, ensure_ascii=False, indent=2)
-        print("✅ Archivo de conversación limpiado después de generar la auditoría.")
-    except Exception as e:
-        print("❌ Error al limpiar el archivo JSON:", e)
+documento = DocumentoPorSecciones(
+    "plan", llm, prompt_seccion, SECCIONES,
+    fallback=llm_huggingface_fallback,
+    dependencias=DEPENDENCIAS,
+    formatear=formatear_historial,
+)
 
+# versiones por usuario para re-auditar solo los apartados que cambiaron
+auditorias = crear_almacen()
+
+# transcripción que alimenta el documento (la de los agentes de chat que lo comparten)
+ARCHIVO = "conversacion_temp2.json"
+
+def _leer_conversacion(archivo: str, user_id: Optional[str] = None) -> list:
+    transcripcion_ = transcripcion(archivo)
+    if not transcripcion_.existe():
+        raise FileNotFoundError(f"No se encontró la transcripción: {archivo}")
+
+    # Leer intercambios pendientes del usuario (solo sus particiones y segmentos)
+    with tracing.span("conversacion.leer") as s:
+        conversacion = transcripcion_.pendientes(user_id)
+        s.set(intercambios=len(conversacion))
+    return conversacion
+
+def _limpiar_conversacion(archivo: str, consumidos: list):
+    # === Marcar como auditados los intercambios usados ===
+    # solo los leídos: los de otros usuarios y los que llegaron durante la generación quedan pendientes
+    with tracing.span("conversacion.limpiar"):
+        try:
+            transcripcion(archivo).consumir(consumidos)
+            print("✅ Intercambios marcados como auditados después de generar la auditoría.")
+        except Exception as e:
+            print("❌ Error al marcar la transcripción como auditada:", e)
+
+def _contexto(conversacion: list) -> dict:
+    """Contexto compartido por el prompt completo y por cada apartado"""
+    with tracing.span("prompt.formatear"):
+        return {
+            "historial": formatear_historial(conversacion),
+            "fecha": datetime.now().strftime("%d/%m/%Y"),
+        }
+
+def generar_auditoria(modo: Optional[str] = None, user_id: Optional[str] = None, confirmar: bool = True):
+    """
+    Genera el documento. modo="secciones" redacta los apartados en paralelo;
+    por defecto se usa GLY_DOCUMENTO_MODO. Con user_id la auditoría queda
+    versionada y una re-auditoría reutiliza lo que no cambió. Con
+    confirmar=False es de solo lectura: no guarda versión ni marca los
+    intercambios como auditados.
+    """
+    # una auditoría a la vez por usuario: dos en paralelo consumirían los mismos intercambios
+    with consumo.usuario(user_id, agente="plan"), turnos.turno(("plan", user_id), agente="plan"):
+        return _generar_auditoria(modo, user_id, confirmar)
+
+def _modo_documento(modo: Optional[str]) -> str:
+    return "secciones" if modo == "secciones" or (modo is None and modo_secciones()) else "completo"
+
+def _clave_borrador(user_id: str, nuevos: list, modo: Optional[str]) -> tuple:
+    """Todo lo que determina el documento: un borrador solo se entrega si coincide"""
+    previa = auditorias.ultima(user_id)
+    return (
+        _modo_documento(modo), huella_pendientes(nuevos),
+        previa.version if previa is not None else 0, datetime.now().strftime("%d/%m/%Y"),
+    )
+
+def _redactar(user_id: Optional[str], nuevos: list, modo: Optional[str] = None, seguir=None):
+    """
+    Redacta el documento sin guardarlo; devuelve (texto, partes, modo).
+    `seguir()` se consulta entre apartados: si devuelve False se abandonan
+    los pendientes y se devuelve None (borrador invalidado).
+    """
+    previa = auditorias.ultima(user_id) if user_id is not None else None
+    conversacion = auditorias.transcripcion(user_id, nuevos) if user_id is not None else nuevos
+    contexto = _contexto(conversacion)
+
+    if _modo_documento(modo) == "secciones":
+        partes = []
+        with tracing.span("llm", agent="plan", modo="secciones"):
+            secciones = documento.generar_secciones(contexto, conversacion, previa)
+            try:
+                for seccion in secciones:
+                    partes.append(seccion)
+                    if seguir is not None and not seguir():
+                        return None
+            finally:
+                secciones.close()
+        return "\n\n".join(p.texto for p in partes), partes, "secciones"
+
+    indices = list(range(len(conversacion)))
+    if recuperacion_activa("plan"):
+        # historial acotado: lo más relevante para los apartados + lo más reciente
+        consulta = " ".join(f"{titulo} {instruccion}" for titulo, instruccion in SECCIONES)
+        indices = IndiceBM25.desde(conversacion).seleccionar(consulta, TOKENS_DOCUMENTO, rellenar=True)
+        contexto = dict(contexto, historial=formatear_historial([conversacion[i] for i in indices]))
+    firma = huella(conversacion, indices, contexto["fecha"])
+    if previa is not None and previa.modo == "completo" and previa.secciones[0].huella == firma:
+        # sin intercambios nuevos: se devuelve la versión anterior
+        metrics.auditoria_secciones.inc(agent="plan", result="reutilizado")
+        texto_final = previa.texto
+    else:
+        # Crear prompt con fecha
+        prompt_text = prompt_template.format(**contexto)
+
+        # Llamar LLM principal con fallback
+        with tracing.span("llm", agent="plan") as s:
+            try:
+                respuesta = llm.invoke(prompt_text)
+                texto_final = respuesta.content if hasattr(respuesta, "content") else str(respuesta)
+            except Exception as e:
+                print("❌ Error en Groq LLM:", e)
+                metrics.fallbacks.inc(agent="plan")
+                s.set(fallback=True)
+                texto_final = llm_huggingface_fallback(prompt_text)
+                firma = ""
+        metrics.auditoria_secciones.inc(agent="plan", result="generado")
+    return texto_final, [SeccionAuditada("Documento", texto_final, rangos(indices), firma)], "completo"
+
+def _confirmar(user_id: Optional[str], nuevos: list, partes: list, modo_doc: str):
+    """Guarda la versión y marca como auditados los intercambios usados"""
+    if user_id is not None:
+        auditorias.guardar(user_id, nuevos, partes, modo_doc)
+    _limpiar_conversacion(ARCHIVO, nuevos)
+
+def _generar_auditoria(modo: Optional[str], user_id: Optional[str], confirmar: bool = True):
+    nuevos = _leer_conversacion(ARCHIVO, user_id)
+    # redactado en segundo plano mientras la sesión estaba inactiva (core/borradores.py)
+    # el borrador se consume al tomarlo: solo lo usa una generación que confirma
+    borrador = borradores.tomar(user_id, nuevos, modo) if confirmar else None
+    if borrador is not None:
+        texto_final, partes, modo_doc = borrador.texto, borrador.partes, borrador.modo
+    else:
+        texto_final, partes, modo_doc = _redactar(user_id, nuevos, modo)
+    if confirmar:
+        _confirmar(user_id, nuevos, partes, modo_doc)
     return texto_final
 
+def generar_auditoria_stream(user_id: Optional[str] = None):
+    """Versión en streaming por apartados: emite cada uno, en orden, apenas está listo"""
+    # cada paso del stream corre en otro hilo: el usuario a cobrar se fija en cada uno
+    return consumo.por_usuario(user_id, _generar_auditoria_stream(user_id), agente="plan")
+
+def _generar_auditoria_stream(user_id: Optional[str]):
+    with turnos.turno(("plan", user_id), agente="plan"):
+        nuevos = _leer_conversacion(ARCHIVO, user_id)
+        borrador = borradores.tomar(user_id, nuevos, "secciones")
+        if borrador is not None:
+            partes = borrador.partes
+            for seccion in partes:
+                yield seccion.texto + "\n\n"
+        else:
+            previa = auditorias.ultima(user_id) if user_id is not None else None
+            conversacion = auditorias.transcripcion(user_id, nuevos) if user_id is not None else nuevos
+            contexto = _contexto(conversacion)
+            partes = []
+            for seccion in documento.generar_secciones(contexto, conversacion, previa):
+                partes.append(seccion)
+                yield seccion.texto + "\n\n"
+        _confirmar(user_id, nuevos, partes, "secciones")
+
+# redacción anticipada cuando la sesión queda inactiva (GLY_BORRADOR_INACTIVIDAD_S)
+borradores = registrar_borradores(ARCHIVO, Borradores(
+    "plan",
+    leer=lambda user_id: _leer_conversacion(ARCHIVO, user_id),
+    clave=_clave_borrador,
+    redactar=_redactar,
+))
+
 # ========================
 # 5. CLI opcional para pruebas
 # ========================
@@ -0,0 +1,243 @@
+# bench/carga.py
+"""
+Prueba de carga offline de main:app con el proveedor LLM falso.
+
+Levanta uvicorn en un subproceso (directorio temporal propio, sin red ni
+cuota de Groq), lanza requests concurrentes contra los endpoints de chat y
+de auditoría/plan y reporta throughput, latencias p50/p95/p99, crecimiento
+de RSS del servidor y tiempo de I/O de persistencia (leído de /metrics).
+
+Uso:
+    python bench/carga.py --concurrencia 16 --requests 400
+    python bench/carga.py --endpoints chat,chat2 --latencia 0.3 --tokens-s 250 --json reporte.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import random
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ========================
+# 1. Escenarios por endpoint
+# ========================
+MENSAJES = [
+    "hola",
+    "trabajo en una empresa de logística con 40 empleados",
+    "el proceso de facturación lo hacemos a mano en excel y tarda dos días",
+    "usamos un ERP viejo y correos para coordinar los despachos",
+    "¿qué tipo de automatización recomiendas para inventario?",
+]
+
+ENDPOINTS = {
+    "chat": ("POST", "/chat"),
+    "chat1": ("POST", "/chat1"),
+    "chat2": ("POST", "/chat2"),
+    "auditoria": ("POST", "/generar_auditoria"),
+    "plan": ("POST", "/generar_plan"),
+}
+
+# peso relativo de cada endpoint en la mezcla (las auditorías son raras)
+PESOS = {"chat": 10, "chat1": 5, "chat2": 10, "auditoria": 1, "plan": 1}
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    idx = min(len(ordenados) - 1, max(0, int(round(p / 100.0 * (len(ordenados) - 1)))))
+    return ordenados[idx]
+
+
+def rss_kb(pid: int):
+    """RSS del proceso en KB (solo Linux; None si no está disponible)"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ========================
+# 2. Servidor
+# ========================
+def arrancar_servidor(args, directorio: str):
+    puerto = puerto_libre()
+    entorno = dict(
+        os.environ,
+        PYTHONPATH=RAIZ + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        GLY_LLM_PROVIDER="fake",
+        GLY_FAKE_KEYS=str(args.keys),
+        GLY_FAKE_RPM=str(args.rpm),
+        GLY_FAKE_LATENCIA=str(args.latencia),
+        GLY_FAKE_SIGMA=str(args.sigma),
+        GLY_FAKE_TOKENS_S=str(args.tokens_s),
+        GLY_FAKE_TOKENS_SALIDA=str(args.tokens_salida),
+        GLY_FAKE_SEED=str(args.semilla),
+        HUGGINGFACE_API_KEY2=os.environ.get("HUGGINGFACE_API_KEY2", "bench"),
+    )
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(puerto), "--log-level", "warning"],
+        cwd=directorio, env=entorno,
+        stdout=subprocess.DEVNULL if not args.verbose else None,
+        stderr=subprocess.DEVNULL if not args.verbose else None,
+    )
+    base = f"http://127.0.0.1:{puerto}"
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError("El servidor terminó al arrancar (usa --verbose para ver el error)")
+        try:
+            if requests.get(base + "/metrics", timeout=1).status_code == 200:
+                return proceso, base
+        except requests.RequestException:
+            time.sleep(0.2)
+    proceso.terminate()
+    raise RuntimeError("El servidor no respondió en 60s")
+
+
+def persistencia_segundos(base: str) -> float:
+    """Suma del histograma gly_persistence_duration_seconds de /metrics"""
+    texto = requests.get(base + "/metrics", timeout=5).text
+    return sum(float(v) for v in re.findall(r"^gly_persistence_duration_seconds_sum\{[^}]*\} (\S+)$", texto, re.M))
+
+
+# ========================
+# 3. Carga
+# ========================
+def ejecutar(args):
+    rng = random.Random(args.semilla)
+    elegidos = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    for e in elegidos:
+        if e not in ENDPOINTS:
+            raise SystemExit(f"Endpoint desconocido: {e} (opciones: {', '.join(ENDPOINTS)})")
+    pesos = [PESOS[e] for e in elegidos]
+    plan = [rng.choices(elegidos, weights=pesos)[0] for _ in range(args.requests)]
+    usuarios = [f"bench-{i}" for i in range(args.usuarios)]
+    mensajes = [(rng.choice(usuarios), rng.choice(MENSAJES)) for _ in range(args.requests)]
+
+    with tempfile.TemporaryDirectory(prefix="gly-bench-") as directorio:
+        proceso, base = arrancar_servidor(args, directorio)
+        sesion = requests.Session()
+        adaptador = requests.adapters.HTTPAdapter(pool_connections=args.concurrencia, pool_maxsize=args.concurrencia)
+        sesion.mount("http://", adaptador)
+        try:
+            # calentamiento: carga perezosa de módulos y primer usuario
+            sesion.post(base + "/chat", json={"mensaje": "hola", "user_id": "warmup"}, timeout=60)
+            rss_inicial = rss_kb(proceso.pid)
+            io_inicial = persistencia_segundos(base)
+
+            def una(i):
+                nombre = plan[i]
+                metodo, ruta = ENDPOINTS[nombre]
+                user_id, mensaje = mensajes[i]
+                inicio = time.perf_counter()
+                try:
+                    if nombre in ("auditoria", "plan"):
+                        r = sesion.request(metodo, base + ruta, params={"user_id": user_id}, timeout=args.timeout)
+                    else:
+                        r = sesion.request(metodo, base + ruta, json={"mensaje": mensaje, "user_id": user_id}, timeout=args.timeout)
+                    status = r.status_code
+                except requests.RequestException:
+                    status = 0
+                return nombre, status, time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrencia) as pool:
+                resultados = list(pool.map(una, range(args.requests)))
+            total = time.perf_counter() - inicio
+
+            rss_final = rss_kb(proceso.pid)
+            io_final = persistencia_segundos(base)
+        finally:
+            proceso.terminate()
+            try:
+                proceso.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+
+    latencias = defaultdict(list)
+    errores = defaultdict(int)
+    for nombre, status, duracion in resultados:
+        latencias[nombre].append(duracion)
+        latencias["total"].append(duracion)
+        if status != 200:
+            errores[nombre] += 1
+            errores["total"] += 1
+
+    reporte = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "verbose")},
+        "duracion_s": round(total, 3),
+        "throughput_rps": round(len(resultados) / total, 2) if total else 0.0,
+        "rss_inicial_kb": rss_inicial,
+        "rss_final_kb": rss_final,
+        "rss_crecimiento_kb": (rss_final - rss_inicial) if rss_inicial and rss_final else None,
+        "persistencia_io_s": round(io_final - io_inicial, 4),
+        "endpoints": {},
+    }
+    for nombre, valores in latencias.items():
+        reporte["endpoints"][nombre] = {
+            "requests": len(valores),
+            "errores": errores.get(nombre, 0),
+            "p50_ms": round(percentil(valores, 50) * 1000, 2),
+            "p95_ms": round(percentil(valores, 95) * 1000, 2),
+            "p99_ms": round(percentil(valores, 99) * 1000, 2),
+        }
+    return reporte
+
+
+def imprimir(reporte):
+    print(f"\nDuración: {reporte['duracion_s']}s   Throughput: {reporte['throughput_rps']} req/s")
+    print(f"RSS: {reporte['rss_inicial_kb']} KB -> {reporte['rss_final_kb']} KB (Δ {reporte['rss_crecimiento_kb']} KB)")
+    print(f"I/O de persistencia: {reporte['persistencia_io_s']}s\n")
+    print(f"{'endpoint':<12}{'req':>7}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for nombre, d in sorted(reporte["endpoints"].items(), key=lambda x: x[0] == "total"):
+        print(f"{nombre:<12}{d['requests']:>7}{d['errores']:>6}{d['p50_ms']:>10}{d['p95_ms']:>10}{d['p99_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline de GLYNNE LLM API")
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--usuarios", type=int, default=20)
+    parser.add_argument("--endpoints", default="chat,chat1,chat2,auditoria,plan")
+    parser.add_argument("--latencia", type=float, default=0.2, help="mediana del tiempo hasta el primer token (s)")
+    parser.add_argument("--sigma", type=float, default=0.3, help="dispersión lognormal de la latencia")
+    parser.add_argument("--tokens-s", type=float, default=300.0, help="velocidad de decodificación simulada")
+    parser.add_argument("--tokens-salida", type=int, default=60)
+    parser.add_argument("--keys", type=int, default=2)
+    parser.add_argument("--rpm", type=int, default=1_000_000, help="cuota por key del proveedor falso")
+    parser.add_argument("--semilla", type=int, default=1234)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="ruta donde guardar el reporte en JSON")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    reporte = ejecutar(args)
+    imprimir(reporte)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
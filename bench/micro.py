@@ -0,0 +1,261 @@
+# bench/micro.py
+"""
+Micro-benchmarks de los caminos O(n) que crecen con la sesión.
+
+Mide, para sesiones de 10 a 100k intercambios:
+  - guardar_conversacion   (agent/chat.py): añadir un intercambio a la transcripción
+  - leer_pendientes        (core/transcripciones.py): cargar lo pendiente de un usuario para auditar
+  - formatear_historial    (agent/auditor.py): armar el texto del prompt de auditoría
+  - load_memory_variables  (ConversationBufferMemory): renderizar el historial
+
+Publica la curva de escalamiento (tabla + gráfico ASCII, y opcionalmente
+JSON/CSV) y marca como super-lineal cualquier camino cuyo exponente
+ajustado en log-log supere el umbral.
+
+Tolerancia: cada tamaño se mide en `--rondas` rondas (mejor tiempo de varias
+repeticiones en cada una), se ajusta un exponente por ronda y decide la
+mediana. El GC queda apagado mientras se cronometra, como en timeit. Aun
+así un camino lineal no da 1.0: entre 1k y 100k intercambios los datos dejan
+de caber en la caché y el ajuste sube hasta ≈ 1.3 según la máquina y lo que
+ya haya en el heap. El umbral por defecto (1.5, o GLY_MICRO_UMBRAL) deja ese
+margen y sigue marcando un camino cuadrático (≈ 2).
+
+Uso:
+    python bench/micro.py
+    python bench/micro.py --max 10000 --json curvas.json --csv curvas.csv
+    python bench/micro.py --rondas 7 --umbral 1.4
+    GLY_MICRO_UMBRAL=1.6 python bench/micro.py
+"""
+import os
+import sys
+import gc
+import csv
+import json
+import math
+import time
+import argparse
+import tempfile
+import statistics
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TAMANOS = [10, 100, 1_000, 10_000, 100_000]
+RONDAS = 5
+UMBRAL = float(os.getenv("GLY_MICRO_UMBRAL", "1.5"))
+
+INTERCAMBIO = {
+    "user": "el proceso de facturación lo hacemos a mano en excel y tarda dos días",
+    "ai": "Entiendo, ese proceso parece consumir bastante tiempo. ¿Cuántas personas participan en él cada semana?",
+}
+
+
+# ========================
+# 1. Carga de módulos con el proveedor falso
+# ========================
+def cargar_modulos(directorio: str):
+    """Importa los agentes sin red: proveedor falso y transcripciones en `directorio`"""
+    os.environ["GLY_LLM_PROVIDER"] = "fake"
+    os.environ.setdefault("HUGGINGFACE_API_KEY2", "bench")
+    os.chdir(directorio)
+    sys.path.insert(0, RAIZ)
+    import agent.chat as chat
+    import agent.auditor as auditor
+    return chat, auditor
+
+
+def cronometrar(funcion, repeticiones: int, rondas: int = RONDAS) -> list:
+    """Mejor tiempo (s) de `repeticiones` ejecuciones, una cifra por ronda"""
+    tiempos = []
+    # como timeit: sin el GC, cuyas pasadas crecen con todo el heap del proceso y no con el caso
+    habilitado = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(rondas):
+            mejor = float("inf")
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                funcion()
+                mejor = min(mejor, time.perf_counter() - inicio)
+            tiempos.append(mejor)
+    finally:
+        if habilitado:
+            gc.enable()
+    return tiempos
+
+
+def repeticiones_para(n: int) -> int:
+    # los tamaños chicos duran microsegundos: con pocas repeticiones el ruido mueve el ajuste
+    if n >= 100_000:
+        return 5
+    if n >= 10_000:
+        return 10
+    if n >= 1_000:
+        return 50
+    return 200
+
+
+# ========================
+# 2. Casos
+# ========================
+def _transcripcion_con(chat, n: int):
+    """Transcripción con n intercambios del usuario de prueba y n de otros usuarios"""
+    from core.transcripciones import transcripcion
+
+    t = transcripcion(chat.TEMP_JSON_PATH)
+    t.vaciar()
+    t.importar([dict(INTERCAMBIO, user_id="bench")] * n)
+    t.importar([dict(INTERCAMBIO, user_id=f"otro-{i % 100}") for i in range(n)])
+    t.compactar(cerrar_abiertos=True)
+    return t
+
+
+def bench_guardar_conversacion(chat, n: int, rondas: int = RONDAS) -> list:
+    _transcripcion_con(chat, n)
+    return cronometrar(
+        lambda: chat.guardar_conversacion(INTERCAMBIO["user"], INTERCAMBIO["ai"], "bench"),
+        repeticiones_para(n), rondas,
+    )
+
+
+def bench_leer_pendientes(chat, n: int, rondas: int = RONDAS) -> list:
+    t = _transcripcion_con(chat, n)
+    return cronometrar(lambda: t.pendientes("bench"), repeticiones_para(n), rondas)
+
+
+def bench_formatear_historial(auditor, n: int, rondas: int = RONDAS) -> list:
+    conversacion = [dict(INTERCAMBIO) for _ in range(n)]
+    return cronometrar(lambda: auditor.formatear_historial(conversacion), repeticiones_para(n), rondas)
+
+
+def bench_load_memory_variables(chat, n: int, rondas: int = RONDAS) -> list:
+    from langchain.schema import HumanMessage, AIMessage
+
+    memoria = chat.get_memory(f"bench-{n}")
+    mensajes = []
+    for _ in range(n):
+        mensajes.append(HumanMessage(content=INTERCAMBIO["user"]))
+        mensajes.append(AIMessage(content=INTERCAMBIO["ai"]))
+    memoria.chat_memory.messages = mensajes
+    try:
+        return cronometrar(lambda: memoria.load_memory_variables({}), repeticiones_para(n), rondas)
+    finally:
+        chat.usuarios.reset_usuario(f"bench-{n}")
+
+
+CASOS = {
+    "guardar_conversacion": ("chat", bench_guardar_conversacion),
+    "leer_pendientes": ("chat", bench_leer_pendientes),
+    "formatear_historial": ("auditor", bench_formatear_historial),
+    "load_memory_variables": ("chat", bench_load_memory_variables),
+}
+
+
+# ========================
+# 3. Análisis de escalamiento
+# ========================
+def exponente(puntos):
+    """Pendiente de la recta log(t) = a + b·log(n) por mínimos cuadrados"""
+    pares = [(math.log(n), math.log(t)) for n, t in puntos if t > 0]
+    if len(pares) < 2:
+        return None
+    mx = sum(x for x, _ in pares) / len(pares)
+    my = sum(y for _, y in pares) / len(pares)
+    num = sum((x - mx) * (y - my) for x, y in pares)
+    den = sum((x - mx) ** 2 for x, _ in pares)
+    return num / den if den else None
+
+
+def exponente_mediano(mediciones) -> tuple:
+    """
+    (mediana, exponentes por ronda) a partir de [(n, [t por ronda])]. El
+    ajuste usa los tres tamaños más grandes: los chicos están dominados por
+    costo fijo, y con solo dos puntos un salto de caché decide el veredicto
+    """
+    grandes = mediciones[-3:]
+    rondas = min(len(t) for _, t in grandes)
+    exponentes = sorted(
+        b for b in (exponente([(n, t[r]) for n, t in grandes]) for r in range(rondas)) if b is not None
+    )
+    return (statistics.median(exponentes) if exponentes else None), exponentes
+
+
+def grafico_ascii(puntos, ancho: int = 50) -> str:
+    """Barras en escala log del tiempo por tamaño"""
+    if not puntos:
+        return ""
+    logs = [math.log10(max(t, 1e-9)) for _, t in puntos]
+    minimo, maximo = min(logs), max(logs)
+    rango = (maximo - minimo) or 1.0
+    lineas = []
+    for (n, t), lt in zip(puntos, logs):
+        barra = "#" * max(1, int((lt - minimo) / rango * ancho))
+        lineas.append(f"  {n:>8} | {barra} {t * 1000:.3f} ms")
+    return "\n".join(lineas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de escalamiento por tamaño de sesión")
+    parser.add_argument("--max", type=int, default=TAMANOS[-1], help="tamaño máximo de sesión")
+    parser.add_argument("--casos", default=",".join(CASOS))
+    parser.add_argument("--umbral", type=float, default=UMBRAL,
+                        help="exponente (mediana de las rondas) a partir del cual se marca super-lineal")
+    parser.add_argument("--rondas", type=int, default=RONDAS, help="ajustes independientes por caso")
+    parser.add_argument("--json", help="ruta para guardar las curvas en JSON")
+    parser.add_argument("--csv", help="ruta para guardar las curvas en CSV")
+    args = parser.parse_args()
+
+    salida_json = os.path.abspath(args.json) if args.json else None
+    salida_csv = os.path.abspath(args.csv) if args.csv else None
+    tamanos = [n for n in TAMANOS if n <= args.max]
+    casos = [c.strip() for c in args.casos.split(",") if c.strip()]
+
+    directorio_original = os.getcwd()
+    curvas = {}
+    superlineales = []
+    with tempfile.TemporaryDirectory(prefix="gly-micro-") as directorio:
+        chat, auditor = cargar_modulos(directorio)
+        modulos = {"chat": chat, "auditor": auditor}
+        for caso in casos:
+            nombre_modulo, funcion = CASOS[caso]
+            mediciones = [(n, funcion(modulos[nombre_modulo], n, max(1, args.rondas))) for n in tamanos]
+            # la curva publicada es el mejor tiempo de todas las rondas; el veredicto, la mediana de los ajustes
+            puntos = [(n, min(t)) for n, t in mediciones]
+            b, exponentes = exponente_mediano(mediciones)
+            curvas[caso] = {"puntos": puntos, "exponente": b, "exponentes": exponentes}
+            marca = ""
+            if b is not None and b > args.umbral:
+                marca = "  ⚠️ SUPER-LINEAL"
+                superlineales.append(caso)
+            rango = f", rondas {exponentes[0]:.2f}–{exponentes[-1]:.2f}" if len(exponentes) > 1 else ""
+            print(f"\n{caso}  (exponente ≈ {b:.2f}{rango}){marca}" if b is not None else f"\n{caso}")
+            print(grafico_ascii(puntos))
+    os.chdir(directorio_original)
+
+    if salida_json:
+        with open(salida_json, "w", encoding="utf-8") as f:
+            json.dump({
+                "umbral": args.umbral,
+                "rondas": args.rondas,
+                "curvas": {
+                    c: {"exponente": d["exponente"], "exponentes": d["exponentes"], "puntos": [{"n": n, "segundos": t} for n, t in d["puntos"]]}
+                    for c, d in curvas.items()
+                },
+                "superlineales": superlineales,
+            }, f, ensure_ascii=False, indent=2)
+    if salida_csv:
+        with open(salida_csv, "w", encoding="utf-8", newline="") as f:
+            escritor = csv.writer(f)
+            escritor.writerow(["caso", "n", "segundos"])
+            for caso, d in curvas.items():
+                for n, t in d["puntos"]:
+                    escritor.writerow([caso, n, f"{t:.9f}"])
+
+    if superlineales:
+        print(f"\n❌ Caminos super-lineales: {', '.join(superlineales)}")
+        sys.exit(1)
+    print("\n✅ Todos los caminos escalan como máximo de forma lineal")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+# core/__init__.py
+# Infraestructura compartida por los agentes de agent/ y agent2/
+# (pool de API keys, proveedor LLM falso para pruebas, etc.).
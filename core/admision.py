@@ -0,0 +1,189 @@
+# core/admision.py
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Dict, Optional
+
+from starlette.responses import JSONResponse
+
+from core import metrics
+
+# ========================
+# 1. Configuración
+# ========================
+# GLY_ADMISION=0 desactiva el control de admisión.
+# Por grupo de rutas (CHAT, DOCUMENTO):
+#   GLY_ADMISION_<GRUPO>_CONCURRENCIA  requests atendiéndose a la vez
+#   GLY_ADMISION_<GRUPO>_COLA          requests esperando turno como máximo
+#   GLY_ADMISION_<GRUPO>_ESPERA        segundos máximos de espera en la cola
+# Los valores por defecto dejan margen en el threadpool de Starlette (40 hilos).
+POR_DEFECTO = {
+    "chat": (24, 48, 5.0),
+    "documento": (4, 8, 15.0),
+}
+
+
+def admision_activa() -> bool:
+    return os.getenv("GLY_ADMISION", "1").strip().lower() not in ("0", "false", "no")
+
+
+class Rechazo(Exception):
+    def __init__(self, status: int, retry_after: int, motivo: str):
+        super().__init__(motivo)
+        self.status = status
+        self.retry_after = retry_after
+        self.motivo = motivo
+
+
+# ========================
+# 2. Límite por grupo
+# ========================
+class Limite:
+    """
+    Semáforo con cola acotada y plazo de espera, en el event loop.
+
+    - Hay cupo: entra directo.
+    - Cola llena: 429 inmediato.
+    - La espera estimada (posición en la cola × tiempo medio de servicio /
+      concurrencia) supera el plazo: 503 inmediato, sin ocupar la cola.
+    - Se cumple el plazo esperando: 503.
+    Los rechazos llevan Retry-After con la espera estimada.
+    """
+
+    ALFA = 0.2  # peso de la última muestra en el promedio móvil del tiempo de servicio
+
+    def __init__(self, grupo: str, concurrencia: int, cola: int, espera: float):
+        self.grupo = grupo
+        self.concurrencia = max(1, concurrencia)
+        self.cola = max(0, cola)
+        self.espera = espera
+        self.en_curso = 0
+        self._esperando: deque = deque()
+        self._servicio = 1.0
+
+    @classmethod
+    def desde_entorno(cls, grupo: str) -> "Limite":
+        concurrencia, cola, espera = POR_DEFECTO[grupo]
+        prefijo = f"GLY_ADMISION_{grupo.upper()}_"
+        return cls(
+            grupo,
+            int(os.getenv(prefijo + "CONCURRENCIA", concurrencia)),
+            int(os.getenv(prefijo + "COLA", cola)),
+            float(os.getenv(prefijo + "ESPERA", espera)),
+        )
+
+    def espera_estimada(self, posicion: int) -> float:
+        return posicion * self._servicio / self.concurrencia
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.espera_estimada(len(self._esperando) + 1)))
+
+    async def adquirir(self):
+        if self.en_curso < self.concurrencia and not self._esperando:
+            self.en_curso += 1
+            return
+        if len(self._esperando) >= self.cola:
+            raise Rechazo(429, self._retry_after(), "cola_llena")
+        if self.espera_estimada(len(self._esperando) + 1) > self.espera:
+            raise Rechazo(503, self._retry_after(), "espera_estimada")
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._esperando.append(futuro)
+        try:
+            await asyncio.wait_for(futuro, timeout=self.espera)
+        except asyncio.TimeoutError:
+            raise Rechazo(503, self._retry_after(), "plazo_vencido")
+        except BaseException:
+            # el cliente se fue mientras esperaba; si ya tenía el cupo, se devuelve
+            if futuro.done() and not futuro.cancelled():
+                self.liberar()
+            raise
+        finally:
+            try:
+                self._esperando.remove(futuro)
+            except ValueError:
+                pass
+
+    def liberar(self, duracion: Optional[float] = None):
+        if duracion is not None:
+            self._servicio += self.ALFA * (duracion - self._servicio)
+        # el cupo pasa directo al primero de la cola que siga esperando
+        while self._esperando:
+            futuro = self._esperando.popleft()
+            if not futuro.done():
+                futuro.set_result(True)
+                return
+        self.en_curso -= 1
+
+    def estado(self) -> dict:
+        return {
+            "concurrencia": self.concurrencia,
+            "en_curso": self.en_curso,
+            "esperando": len(self._esperando),
+            "cola": self.cola,
+            "espera_max_s": self.espera,
+            "servicio_medio_s": round(self._servicio, 3),
+        }
+
+
+# ========================
+# 3. Middleware ASGI
+# ========================
+class AdmisionASGI:
+    """
+    Middleware ASGI (no BaseHTTPMiddleware) para que el cupo se mantenga
+    hasta que termina el cuerpo de la respuesta, incluidas las respuestas en
+    streaming. Las rutas que no figuran en `rutas` (ruta exacta) ni empiezan
+    por uno de `prefijos` pasan sin control.
+    """
+
+    def __init__(self, app, rutas: Dict[str, str], limites: Dict[str, Limite],
+                 prefijos: Optional[Dict[str, str]] = None):
+        self.app = app
+        self.rutas = rutas
+        self.limites = limites
+        self.prefijos = prefijos or {}
+
+    def grupo_de(self, path: str) -> Optional[str]:
+        grupo = self.rutas.get(path)
+        if grupo is None:
+            for prefijo, grupo_prefijo in self.prefijos.items():
+                if path.startswith(prefijo):
+                    return grupo_prefijo
+        return grupo
+
+    async def __call__(self, scope, receive, send):
+        grupo = self.grupo_de(scope.get("path", "")) if scope["type"] == "http" else None
+        if grupo is None or not admision_activa():
+            await self.app(scope, receive, send)
+            return
+
+        limite = self.limites[grupo]
+        inicio = time.perf_counter()
+        try:
+            await limite.adquirir()
+        except Rechazo as r:
+            metrics.admision_rechazos.inc(group=grupo, reason=r.motivo)
+            respuesta = JSONResponse(
+                {"detail": "Servidor saturado, reintenta más tarde", "motivo": r.motivo},
+                status_code=r.status,
+                headers={"Retry-After": str(r.retry_after)},
+            )
+            await respuesta(scope, receive, send)
+            return
+
+        metrics.admision_espera.observe(time.perf_counter() - inicio, group=grupo)
+        atendido = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limite.liberar(time.perf_counter() - atendido)
+
+
+def crear_limites() -> Dict[str, Limite]:
+    limites = {grupo: Limite.desde_entorno(grupo) for grupo in POR_DEFECTO}
+    for grupo, limite in limites.items():
+        metrics.admision_en_curso.set_funcion(lambda l=limite: l.en_curso, group=grupo)
+    return limites
@@ -0,0 +1,146 @@
+# core/auditorias.py
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+# ========================
+# 1. Utilidades
+# ========================
+def rangos(indices: List[int]) -> List[Tuple[int, int]]:
+    """[0, 1, 2, 5, 6] -> [(0, 3), (5, 7)] (intervalos semiabiertos)"""
+    resultado = []
+    for i in sorted(indices):
+        if resultado and resultado[-1][1] == i:
+            resultado[-1] = (resultado[-1][0], i + 1)
+        else:
+            resultado.append((i, i + 1))
+    return resultado
+
+
+def huella(conversacion: list, indices: List[int], extra: str = "") -> str:
+    """Hash de los intercambios que alimentan un apartado"""
+    h = hashlib.sha1(extra.encode("utf-8"))
+    for i in indices:
+        intercambio = conversacion[i]
+        h.update(json.dumps([intercambio.get("user", ""), intercambio.get("ai", "")], ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+# ========================
+# 2. Versiones de auditoría
+# ========================
+class SeccionAuditada:
+    __slots__ = ("titulo", "texto", "rangos", "huella")
+
+    def __init__(self, titulo: str, texto: str, rangos_: List[Tuple[int, int]], huella_: str):
+        self.titulo = titulo
+        self.texto = texto
+        self.rangos = rangos_
+        self.huella = huella_
+
+    def a_dict(self) -> dict:
+        return {"titulo": self.titulo, "rangos": self.rangos, "huella": self.huella, "caracteres": len(self.texto)}
+
+
+class VersionAuditoria:
+    def __init__(self, version: int, intercambios: int, secciones: List[SeccionAuditada], modo: str):
+        self.version = version
+        self.intercambios = intercambios
+        self.secciones = secciones
+        self.modo = modo
+
+    @property
+    def texto(self) -> str:
+        return "\n\n".join(s.texto for s in self.secciones)
+
+    def seccion(self, numero: int) -> Optional[SeccionAuditada]:
+        if 1 <= numero <= len(self.secciones):
+            return self.secciones[numero - 1]
+        return None
+
+    def a_dict(self) -> dict:
+        return {
+            "version": self.version,
+            "intercambios": self.intercambios,
+            "modo": self.modo,
+            "secciones": [s.a_dict() for s in self.secciones],
+        }
+
+
+class _Registro:
+    __slots__ = ("transcripcion", "versiones")
+
+    def __init__(self):
+        self.transcripcion: list = []
+        self.versiones: List[VersionAuditoria] = []
+
+
+# ========================
+# 3. Almacén versionado por usuario
+# ========================
+class AlmacenAuditorias:
+    """
+    Guarda por usuario la transcripción ya auditada y las últimas versiones
+    del documento, con los rangos de intercambios y la huella que alimentó
+    cada apartado. En una re-auditoría solo se regeneran los apartados cuya
+    huella cambió. Acotado en usuarios (LRU) y en versiones por usuario.
+    """
+
+    def __init__(self, max_usuarios: int = 1000, max_versiones: int = 5):
+        self.max_usuarios = max_usuarios
+        self.max_versiones = max_versiones
+        self._registros: "OrderedDict[str, _Registro]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _registro(self, user_id: str) -> _Registro:
+        registro = self._registros.get(user_id)
+        if registro is None:
+            registro = self._registros[user_id] = _Registro()
+            while len(self._registros) > self.max_usuarios:
+                self._registros.popitem(last=False)
+        self._registros.move_to_end(user_id)
+        return registro
+
+    def transcripcion(self, user_id: str, nuevos: list) -> list:
+        """
+        Transcripción completa del usuario: lo ya auditado más los intercambios
+        nuevos (el JSON temporal se limpia tras cada auditoría).
+        """
+        with self._lock:
+            registro = self._registros.get(user_id)
+            return (list(registro.transcripcion) if registro else []) + list(nuevos)
+
+    def ultima(self, user_id: str) -> Optional[VersionAuditoria]:
+        with self._lock:
+            registro = self._registros.get(user_id)
+            return registro.versiones[-1] if registro and registro.versiones else None
+
+    def guardar(self, user_id: str, nuevos: list, secciones: List[SeccionAuditada], modo: str) -> VersionAuditoria:
+        """Registra la versión y consolida los intercambios nuevos en la transcripción"""
+        with self._lock:
+            registro = self._registro(user_id)
+            registro.transcripcion.extend(nuevos)
+            numero = registro.versiones[-1].version + 1 if registro.versiones else 1
+            version = VersionAuditoria(numero, len(registro.transcripcion), secciones, modo)
+            registro.versiones.append(version)
+            del registro.versiones[:-self.max_versiones]
+            return version
+
+    def versiones(self, user_id: str) -> List[dict]:
+        with self._lock:
+            registro = self._registros.get(user_id)
+            return [v.a_dict() for v in registro.versiones] if registro else []
+
+    def olvidar(self, user_id: str):
+        with self._lock:
+            self._registros.pop(user_id, None)
+
+
+def crear_almacen() -> AlmacenAuditorias:
+    return AlmacenAuditorias(
+        max_usuarios=int(os.getenv("GLY_AUDITORIAS_MAX_USUARIOS", "1000")),
+        max_versiones=int(os.getenv("GLY_AUDITORIAS_MAX_VERSIONES", "5")),
+    )
@@ -0,0 +1,280 @@
+# core/borradores.py
+import os
+import time
+import heapq
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from core import consumo, metrics, tracing
+from core.servidor import estado as estado_servidor
+from core.turnos import turnos
+
+# ========================
+# 1. Configuración
+# ========================
+# GLY_BORRADOR_INACTIVIDAD_S: segundos sin turnos tras los que se redacta en
+#   segundo plano la auditoría/plan del usuario (0 desactiva los borradores).
+# GLY_BORRADOR_MIN_INTERCAMBIOS: intercambios pendientes mínimos para redactar.
+# GLY_BORRADORES_CONCURRENCIA: borradores redactándose a la vez en el proceso.
+# GLY_BORRADOR_CHAT_OCUPADO: fracción del cupo de chat en uso a partir de la
+#   cual los borradores se postergan para no competir con los turnos.
+# GLY_BORRADOR_TTL_S: vida máxima de un borrador sin usar.
+INACTIVIDAD = float(os.getenv("GLY_BORRADOR_INACTIVIDAD_S", "20"))
+MIN_INTERCAMBIOS = int(os.getenv("GLY_BORRADOR_MIN_INTERCAMBIOS", "3"))
+CONCURRENCIA = max(1, int(os.getenv("GLY_BORRADORES_CONCURRENCIA", "1")))
+CHAT_OCUPADO = float(os.getenv("GLY_BORRADOR_CHAT_OCUPADO", "0.5"))
+TTL = float(os.getenv("GLY_BORRADOR_TTL_S", "1800"))
+MAX_USUARIOS = 1000
+
+
+def huella_pendientes(nuevos: list) -> str:
+    """Identifica los intercambios pendientes sobre los que se redactó"""
+    h = hashlib.sha1()
+    for c in nuevos:
+        h.update(f"{c.get('ts', '')}\x00{c.get('user', '')}\x00{c.get('ai', '')}\x01".encode("utf-8"))
+    return h.hexdigest()
+
+
+class Borrador:
+    __slots__ = ("clave", "texto", "partes", "modo", "gasto", "creado")
+
+    def __init__(self, clave: Hashable, texto: str, partes: list, modo: str, gasto: consumo.Gasto):
+        self.clave = clave
+        self.texto = texto
+        self.partes = partes
+        self.modo = modo
+        self.gasto = gasto
+        self.creado = time.monotonic()
+
+
+# ========================
+# 2. Borradores de un documento (auditoría o plan)
+# ========================
+class Borradores:
+    """
+    Redacta por adelantado el documento de un usuario cuando su sesión queda
+    en silencio, para que el endpoint lo entregue al instante.
+
+    El auditor aporta tres funciones:
+      leer(user_id) -> intercambios pendientes
+      clave(user_id, nuevos, modo) -> identifica la entrada exacta del documento
+      redactar(user_id, nuevos, modo, seguir) -> (texto, partes, modo) o None
+    `redactar` no tiene efectos: no guarda versiones ni marca la transcripción;
+    eso lo hace el endpoint al entregar el borrador, igual que si lo generara.
+
+    Un turno nuevo del usuario invalida su borrador y cancela el que esté en
+    curso (`seguir()` pasa a False; en modo secciones no se lanzan los
+    apartados pendientes). Se redacta con el cerrojo del documento del usuario
+    tomado: si el endpoint llega a mitad de la redacción, espera el borrador
+    en lugar de generar otro igual.
+
+    El gasto de un borrador queda en el libro como `<agente>:borrador`, fuera
+    de la cuota del usuario; pasa a su cuenta solo si el borrador se entrega.
+    Las generaciones viven en un LRU con el mismo tope que los borradores.
+    """
+
+    def __init__(self, agente: str, leer: Callable, clave: Callable, redactar: Callable):
+        self.agente = agente
+        self.leer = leer
+        self.clave = clave
+        self.redactar = redactar
+        self._lock = threading.Lock()
+        # contador único: una generación no se repite aunque el usuario salga del LRU y vuelva
+        self._contador = 0
+        self._generacion: "OrderedDict[str, int]" = OrderedDict()
+        self._listos: "OrderedDict[str, Borrador]" = OrderedDict()
+
+    def activo(self) -> bool:
+        return INACTIVIDAD > 0
+
+    # --- eventos ---
+    def actividad(self, user_id: Optional[str]):
+        """Un turno del usuario: invalida su borrador y reprograma la redacción"""
+        if user_id is None or not self.activo():
+            return
+        with self._lock:
+            self._contador += 1
+            generacion = self._contador
+            self._generacion[user_id] = generacion
+            self._generacion.move_to_end(user_id)
+            while len(self._generacion) > MAX_USUARIOS:
+                # el usuario inactivo hace más tiempo: su plazo pendiente deja de estar vigente
+                viejo, _ = self._generacion.popitem(last=False)
+                self._listos.pop(viejo, None)
+            if self._listos.pop(user_id, None) is not None:
+                metrics.borradores.inc(agent=self.agente, result="invalidado")
+        programador.programar(time.monotonic() + INACTIVIDAD, self, user_id, generacion)
+
+    def vigente(self, user_id: str, generacion: int) -> bool:
+        with self._lock:
+            return self._generacion.get(user_id, 0) == generacion
+
+    def tomar(self, user_id: Optional[str], nuevos: list, modo: str) -> Optional[Borrador]:
+        """El borrador del usuario si se redactó exactamente sobre esta entrada; se consume"""
+        if user_id is None or not self.activo():
+            return None
+        with self._lock:
+            borrador = self._listos.pop(user_id, None)
+        if borrador is None:
+            metrics.borradores.inc(agent=self.agente, result="sin_borrador")
+            return None
+        if time.monotonic() - borrador.creado > TTL or borrador.clave != self.clave(user_id, nuevos, modo):
+            metrics.borradores.inc(agent=self.agente, result="desactualizado")
+            return None
+        metrics.borradores.inc(agent=self.agente, result="entregado")
+        consumo.libro.trasladar(borrador.gasto, user_id)
+        return borrador
+
+    # --- redacción en segundo plano ---
+    def _redactar(self, user_id: str, generacion: int) -> str:
+        """Corre en el pool de borradores; devuelve el resultado para las métricas"""
+        if not self.vigente(user_id, generacion):
+            return "cancelado"
+        try:
+            # la cuota se revisa igual: no se redacta para quien ya no podría pedirlo
+            with consumo.usuario(user_id, agente=self.agente), consumo.especulativo() as gasto, \
+                    turnos.turno((self.agente, user_id), agente=self.agente), \
+                    tracing.traza(f"borrador {self.agente}", user_id=user_id):
+                if not self.vigente(user_id, generacion):
+                    return "cancelado"
+                nuevos = self.leer(user_id)
+                if len(nuevos) < MIN_INTERCAMBIOS:
+                    return "sin_datos"
+                seguir = lambda: self.vigente(user_id, generacion) and not programador.deteniendo()
+                # modo por defecto (GLY_DOCUMENTO_MODO): el de los endpoints sin modo explícito
+                resultado = self.redactar(user_id, nuevos, None, seguir)
+                if resultado is None or not seguir():
+                    return "cancelado"
+                texto, partes, modo_doc = resultado
+                if any(not p.huella for p in partes):
+                    # hubo fallback: no se guarda, el endpoint reintentará con Groq
+                    return "fallback"
+                borrador = Borrador(self.clave(user_id, nuevos, modo_doc), texto, partes, modo_doc, gasto)
+                with self._lock:
+                    if self._generacion.get(user_id, 0) != generacion:
+                        return "cancelado"
+                    self._listos[user_id] = borrador
+                    self._listos.move_to_end(user_id)
+                    while len(self._listos) > MAX_USUARIOS:
+                        self._listos.popitem(last=False)
+                return "redactado"
+        except consumo.CuotaExcedida:
+            return "sin_cuota"
+        except FileNotFoundError:
+            return "sin_datos"
+
+
+# ========================
+# 3. Programador: inactividad y presupuesto de concurrencia
+# ========================
+class Programador:
+    """
+    Un hilo con un heap de plazos (user_id, generación). Al vencer uno cuya
+    generación sigue vigente, el borrador se encola en un pool de
+    GLY_BORRADORES_CONCURRENCIA hilos. Si el chat está ocupado (ver
+    `ocupado_con`) se posterga otro período de inactividad.
+    """
+
+    def __init__(self, concurrencia: int = CONCURRENCIA):
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[float, int, Borradores, str, int]] = []
+        self._orden = 0
+        self._cupo = threading.Semaphore(concurrencia)
+        self._ocupado: Callable[[], bool] = lambda: False
+        self._hilo: Optional[threading.Thread] = None
+
+    def ocupado_con(self, funcion: Callable[[], bool]):
+        """funcion() -> True mientras el tráfico interactivo deba tener prioridad"""
+        self._ocupado = funcion
+
+    def deteniendo(self) -> bool:
+        # al drenar no se empiezan borradores y los en curso se cortan en el próximo apartado
+        return estado_servidor.drenando
+
+    def programar(self, plazo: float, borradores: Borradores, user_id: str, generacion: int):
+        with self._cond:
+            self._orden += 1
+            heapq.heappush(self._heap, (plazo, self._orden, borradores, user_id, generacion))
+            self._cond.notify()
+        self._arrancar()
+
+    def _arrancar(self):
+        if self._hilo is None:
+            with self._cond:
+                if self._hilo is None:
+                    self._hilo = threading.Thread(target=self._bucle, name="borradores", daemon=True)
+                    self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    espera = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(espera)
+                _, _, borradores, user_id, generacion = heapq.heappop(self._heap)
+            if self.deteniendo() or not borradores.vigente(user_id, generacion):
+                continue  # llegó otro turno: hay un plazo más nuevo en el heap
+            if self._ocupado():
+                metrics.borradores.inc(agent=borradores.agente, result="postergado")
+                self.programar(time.monotonic() + INACTIVIDAD, borradores, user_id, generacion)
+                continue
+            # presupuesto: el hilo del programador espera cupo, así los plazos no se acumulan en hilos
+            self._cupo.acquire()
+            threading.Thread(
+                target=self._ejecutar, args=(borradores, user_id, generacion),
+                name=f"borrador-{borradores.agente}", daemon=True,
+            ).start()
+
+    def _ejecutar(self, borradores: Borradores, user_id: str, generacion: int):
+        inicio = time.perf_counter()
+        resultado = "error"
+        try:
+            resultado = borradores._redactar(user_id, generacion)
+        except Exception as e:
+            print(f"❌ Error al redactar el borrador de {borradores.agente} para {user_id}:", e)
+        finally:
+            self._cupo.release()
+            metrics.borradores.inc(agent=borradores.agente, result=resultado)
+            metrics.borrador_duracion.observe(time.perf_counter() - inicio, agent=borradores.agente)
+
+    def estado(self) -> dict:
+        with self._cond:
+            programados = len(self._heap)
+        return {
+            "inactividad_s": INACTIVIDAD,
+            "concurrencia": CONCURRENCIA,
+            "programados": programados,
+            "redactando": CONCURRENCIA - self._cupo._value,
+        }
+
+
+programador = Programador()
+
+
+# ========================
+# 4. Registro por transcripción
+# ========================
+# los turnos se anuncian por transcripción: cada auditor registra los borradores
+# del documento que se genera a partir de ella
+_por_archivo: Dict[str, List[Borradores]] = {}
+
+
+def registrar(archivo: str, borradores: Borradores) -> Borradores:
+    _por_archivo.setdefault(archivo, []).append(borradores)
+    return borradores
+
+
+def actividad(archivo: str, user_id: Optional[str]):
+    """Un turno del usuario en la transcripción `archivo`"""
+    for borradores in _por_archivo.get(archivo, ()):
+        borradores.actividad(user_id)
+
+
+def estado() -> dict:
+    datos = programador.estado()
+    datos["listos"] = {
+        b.agente: len(b._listos) for lista in _por_archivo.values() for b in lista
+    }
+    return datos
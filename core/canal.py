@@ -0,0 +1,230 @@
+# core/canal.py
+import os
+import json
+import time
+import asyncio
+from typing import Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from core import consumo, emision, metrics, tracing
+from core.serializacion import dumps
+
+# ========================
+# 1. Configuración
+# ========================
+# GLY_WS_PING: segundos entre latidos del servidor.
+# GLY_WS_TIMEOUT: segundos sin noticias del cliente antes de cerrar la conexión.
+# GLY_WS_COLA: fragmentos en vuelo por conexión; con la cola llena el turno
+# espera al cliente (backpressure) en lugar de acumular tokens en memoria.
+PING = float(os.getenv("GLY_WS_PING", "20"))
+TIMEOUT = float(os.getenv("GLY_WS_TIMEOUT", "60"))
+COLA = int(os.getenv("GLY_WS_COLA", "64"))
+
+_FIN = object()
+
+
+# ========================
+# 2. Canal de chat por WebSocket
+# ========================
+class CanalChat:
+    """
+    Una conexión por sesión: el user_id (y con él la memoria del agente) queda
+    fijado al abrir el socket y cada turno solo envía lo nuevo.
+
+    Cliente -> servidor:
+        {"tipo": "mensaje", "mensaje": "...", "rol": "auditor"}
+        {"tipo": "historial"}   historial completo, p. ej. al reconectar
+        {"tipo": "pong"}        respuesta al latido
+    Servidor -> cliente:
+        {"tipo": "listo", "user_id": ..., "mensajes": n}
+        {"tipo": "delta", "texto": "..."}   fragmentos de la respuesta
+        {"tipo": "reinicio"}                descartar los deltas del turno
+        {"tipo": "fin", "respuesta": "...", "mensajes": n}  texto definitivo
+        {"tipo": "historial", "historial": {...}}
+        {"tipo": "ping"} / {"tipo": "error", "detalle": "..."}
+    """
+
+    def __init__(self, websocket: WebSocket, agente: str, nodo: Callable[[dict], dict],
+                 get_memory: Callable[[str], object]):
+        self.websocket = websocket
+        self.agente = agente
+        self.nodo = nodo
+        self.get_memory = get_memory
+        self.user_id: Optional[str] = None
+        self._envio = asyncio.Lock()
+        self._ultimo = time.monotonic()
+        self._abierto = True
+        self._en_turno = False
+
+    async def enviar(self, mensaje: dict) -> bool:
+        """
+        Único punto de envío. Si el cliente ya se fue, el envío no lanza:
+        marca el canal como cerrado y devuelve False (según el servidor ASGI
+        un socket cerrado da WebSocketDisconnect, RuntimeError o un error de
+        conexión cerrada de la librería de websockets).
+        """
+        if not self._abierto:
+            return False
+        try:
+            async with self._envio:
+                await self.websocket.send_text(dumps(mensaje))
+            return True
+        except Exception:
+            self._abierto = False
+            return False
+
+    async def _enviar_turno(self, mensaje: dict):
+        # dentro de un turno, un envío fallido corta el turno como una desconexión
+        if not await self.enviar(mensaje):
+            raise WebSocketDisconnect(code=1006)
+
+    async def _cerrar(self, code: int, reason: str = ""):
+        self._abierto = False
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass  # ya estaba cerrado
+
+    def _mensajes(self) -> int:
+        memoria = self.get_memory(self.user_id)
+        return len(getattr(getattr(memoria, "chat_memory", None), "messages", []) or [])
+
+    async def _latido(self):
+        """Latido del servidor; cierra la conexión si el cliente dejó de responder"""
+        while self._abierto:
+            await asyncio.sleep(PING)
+            # durante un turno el cliente no responde latidos: no cuenta como inactivo
+            if not self._en_turno and time.monotonic() - self._ultimo > TIMEOUT:
+                await self._cerrar(1001)
+                return
+            if not await self.enviar({"tipo": "ping"}):
+                return
+
+    async def _recibir(self):
+        """Siguiente frame como JSON; None si no es JSON de texto (la conexión sigue abierta)"""
+        try:
+            # un frame binario no trae "text": starlette lanza KeyError
+            texto = await self.websocket.receive_text()
+        except KeyError:
+            return None
+        try:
+            return json.loads(texto)
+        except ValueError:
+            return None
+
+    async def atender(self):
+        await self.websocket.accept()
+        self.user_id = self.websocket.query_params.get("user_id")
+        if not self.user_id:
+            await self._cerrar(1008, "user_id es obligatorio")
+            return
+
+        await self.enviar({"tipo": "listo", "user_id": self.user_id, "mensajes": self._mensajes()})
+        latido = asyncio.create_task(self._latido())
+        try:
+            while self._abierto:
+                datos = await self._recibir()
+                self._ultimo = time.monotonic()
+                if datos is None:
+                    await self.enviar({"tipo": "error", "detalle": "JSON inválido"})
+                    continue
+                tipo = datos.get("tipo", "mensaje") if isinstance(datos, dict) else None
+                if tipo == "pong":
+                    continue
+                if tipo == "historial":
+                    memoria = self.get_memory(self.user_id).load_memory_variables({})
+                    await self.enviar({"tipo": "historial", "historial": memoria})
+                elif tipo == "mensaje" and datos.get("mensaje"):
+                    self._en_turno = True
+                    try:
+                        await self._turno(datos["mensaje"], datos.get("rol") or "auditor")
+                    finally:
+                        self._en_turno = False
+                        self._ultimo = time.monotonic()
+                else:
+                    await self.enviar({"tipo": "error", "detalle": "mensaje no reconocido"})
+        except (WebSocketDisconnect, RuntimeError, ConnectionError):
+            # el cliente se fue: receive tras el cierre da RuntimeError en starlette
+            pass
+        finally:
+            self._abierto = False
+            latido.cancel()
+
+    async def _turno(self, mensaje: str, rol: str):
+        loop = asyncio.get_running_loop()
+        cola: asyncio.Queue = asyncio.Queue(maxsize=COLA)
+        inicio = time.perf_counter()
+
+        def poner(item):
+            # bloquea el hilo del turno mientras la cola está llena; si el
+            # cliente se fue, el turno sigue (se guarda en memoria) sin enviar
+            if self._abierto:
+                asyncio.run_coroutine_threadsafe(cola.put(item), loop).result()
+
+        def recibir(tipo: str, texto: Optional[str]):
+            poner((tipo, texto))
+
+        def ejecutar():
+            state = {"mensaje": mensaje, "rol": rol, "historial": "", "respuesta": "", "user_id": self.user_id}
+            try:
+                with tracing.traza(f"WS /ws/{self.agente}", request_id=None) as raiz, emision.receptor(recibir):
+                    raiz.set(agent=self.agente)
+                    return self.nodo(state)
+            finally:
+                poner(_FIN)
+
+        resultado = asyncio.ensure_future(run_in_threadpool(ejecutar))
+        status = "200"
+        try:
+            terminado = False
+            while not terminado:
+                item = await cola.get()
+                if item is _FIN:
+                    break
+                tipo, texto = item
+                if tipo == emision.REINICIO:
+                    await self._enviar_turno({"tipo": "reinicio"})
+                    continue
+                # agrupa los fragmentos ya disponibles en un solo frame
+                partes = [texto]
+                while not cola.empty():
+                    siguiente = cola.get_nowait()
+                    if siguiente is _FIN:
+                        terminado = True
+                        break
+                    if siguiente[0] == emision.REINICIO:
+                        partes = []
+                        await self._enviar_turno({"tipo": "reinicio"})
+                        continue
+                    partes.append(siguiente[1])
+                if partes:
+                    await self._enviar_turno({"tipo": "delta", "texto": "".join(partes)})
+
+            state = await resultado
+            # la versión se leyó dentro del turno (state["delta"]): otro turno no la adelanta
+            mensajes = state.get("delta", {}).get("version", self._mensajes())
+            await self._enviar_turno({"tipo": "fin", "respuesta": state.get("respuesta", ""), "mensajes": mensajes})
+        except WebSocketDisconnect:
+            self._abierto = False
+            status = "499"
+            raise
+        except consumo.CuotaExcedida as e:
+            status = "429"
+            await self.enviar({"tipo": "error", "detalle": str(e), "reintentar_s": round(e.reintentar)})
+        except Exception as e:
+            status = "500"
+            print(f"❌ Error en /ws/{self.agente}:", e)
+            await self.enviar({"tipo": "error", "detalle": f"Error interno: {str(e)}"})
+        finally:
+            if not resultado.done():
+                # el cliente ya no lee: se libera el hilo del turno si quedó
+                # esperando espacio en la cola y el resto se descarta
+                self._abierto = False
+                while not cola.empty():
+                    cola.get_nowait()
+            metrics.http_latencia.observe(
+                time.perf_counter() - inicio,
+                agent=self.agente, endpoint=f"/ws/{self.agente}", method="WS", status=status,
+            )
@@ -0,0 +1,129 @@
+# core/cascada.py
+import os
+import re
+from typing import Tuple
+
+from core import emision, metrics, tracing
+
+# ========================
+# 1. Configuración
+# ========================
+# GLY_CASCADA: agentes con cascada activa, separados por comas ("chat,chat1,chat2")
+# o "all". GLY_CASCADA_UMBRAL: puntaje de complejidad desde el que se usa el modelo grande.
+MODELO_PEQUENO = "Llama-3.1-8B-Instant"
+MODELO_GRANDE = "llama-3.3-70b-versatile"
+UMBRAL = float(os.getenv("GLY_CASCADA_UMBRAL", "0.5"))
+
+
+def cascada_activa(agente: str) -> bool:
+    valor = os.getenv("GLY_CASCADA", "").strip().lower()
+    if valor in ("all", "1", "true", "todos"):
+        return True
+    return agente in {a.strip() for a in valor.split(",") if a.strip()}
+
+
+# ========================
+# 2. Clasificador local de complejidad
+# ========================
+_SALUDOS = re.compile(r"^\s*(hola|buenas|buenos d[ií]as|buenas tardes|buenas noches|hey|qu[eé] tal|c[oó]mo vas|c[oó]mo est[aá]s|gracias|ok|vale|listo|s[ií]|no)\b", re.I)
+_INTERROGATIVOS_DIFICILES = re.compile(
+    r"\b(por qu[eé]|c[oó]mo (?:puedo|podr[ií]a|hago|funciona|implemento)|explica|expl[ií]came|diferencia|compara|"
+    r"recomienda|recomiendas|ventajas|desventajas|estrategia|arquitectura|implementar|integrar|c[oó]digo|"
+    r"presupuesto|costo|roi|paso a paso|analiza)\b",
+    re.I,
+)
+_DATOS = re.compile(r"\d")
+
+
+def clasificar(mensaje: str, historial: str = "") -> Tuple[float, str]:
+    """
+    Puntaje de complejidad del turno entre 0 y 1 y el motivo principal.
+    Usa solo señales baratas: longitud, tipo de pregunta y profundidad del historial.
+    """
+    texto = (mensaje or "").strip()
+    palabras = len(texto.split())
+    if palabras <= 4 and _SALUDOS.match(texto):
+        return 0.0, "saludo"
+
+    puntaje = 0.0
+    motivo = "corto"
+    if palabras > 25:
+        puntaje += 0.35
+        motivo = "largo"
+    elif palabras > 12:
+        puntaje += 0.2
+        motivo = "medio"
+
+    dificiles = len(_INTERROGATIVOS_DIFICILES.findall(texto))
+    if dificiles:
+        puntaje += min(0.45, 0.3 * dificiles)
+        motivo = "pregunta_compleja"
+    if texto.count("?") > 1:
+        puntaje += 0.15
+        motivo = "varias_preguntas"
+    if _DATOS.search(texto):
+        puntaje += 0.1
+
+    profundidad = historial.count("Human:") if historial else 0
+    if profundidad >= 3:
+        puntaje += 0.1
+    return min(1.0, puntaje), motivo
+
+
+_BAJA_CONFIANZA = re.compile(
+    r"(no estoy segur|no s[eé]\b|no tengo (?:suficiente )?informaci[oó]n|no puedo ayudar|no entiendo|lo siento)",
+    re.I,
+)
+
+
+def baja_confianza(respuesta: str) -> bool:
+    """Heurística sobre la salida del modelo pequeño para decidir si escalar"""
+    texto = (respuesta or "").strip()
+    if len(texto.split()) < 4:
+        return True
+    return bool(_BAJA_CONFIANZA.search(texto[:200]))
+
+
+# ========================
+# 3. LLM en cascada
+# ========================
+class Cascada:
+    """
+    Envía los turnos simples al modelo pequeño y escala al grande en turnos
+    difíciles o cuando la salida del pequeño es de baja confianza. Con la
+    cascada apagada usa siempre el modelo `por_defecto` del agente.
+    """
+
+    def __init__(self, agente: str, pequeno, grande, por_defecto: str = "grande", umbral: float = UMBRAL):
+        self.agente = agente
+        self.pequeno = pequeno
+        self.grande = grande
+        self.por_defecto = por_defecto
+        self.umbral = umbral
+
+    def invoke(self, texto_prompt: str, mensaje: str = "", historial: str = ""):
+        if not cascada_activa(self.agente):
+            llm = self.grande if self.por_defecto == "grande" else self.pequeno
+            return llm.invoke(texto_prompt)
+
+        puntaje, motivo = clasificar(mensaje, historial)
+        metrics.cascada_complejidad.observe(puntaje, agent=self.agente)
+
+        with tracing.span("cascada", puntaje=round(puntaje, 3), motivo=motivo) as s:
+            if puntaje >= self.umbral:
+                metrics.cascada_decisiones.inc(agent=self.agente, route="grande", reason=motivo)
+                s.set(ruta="grande")
+                return self.grande.invoke(texto_prompt)
+
+            respuesta = self.pequeno.invoke(texto_prompt)
+            contenido = respuesta.content if hasattr(respuesta, "content") else str(respuesta)
+            if baja_confianza(contenido):
+                metrics.cascada_decisiones.inc(agent=self.agente, route="escalado", reason="baja_confianza")
+                s.set(ruta="escalado")
+                # lo que ya se envió del modelo pequeño se descarta en el cliente
+                emision.reiniciar()
+                return self.grande.invoke(texto_prompt)
+
+            metrics.cascada_decisiones.inc(agent=self.agente, route="pequeno", reason=motivo)
+            s.set(ruta="pequeno")
+            return respuesta
@@ -0,0 +1,425 @@
+# core/consumo.py
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core import metrics
+from core.turnos import bloqueo_archivo
+
+# ========================
+# 1. Configuración
+# ========================
+# GLY_CONSUMO_DIR: carpeta del libro de consumo (un JSON por día UTC; "" = solo en memoria).
+# GLY_CONSUMO_S: segundos entre volcados del libro a disco.
+# GLY_CUOTA_TOKENS_DIA: tokens (prompt + completion) por usuario y día UTC; 0 = sin cuota.
+# GLY_CUOTAS: JSON {user_id: tokens_por_dia} con cuotas propias (0 = sin cuota); se relee al cambiar.
+DIRECTORIO = os.getenv("GLY_CONSUMO_DIR", "consumo")
+INTERVALO = float(os.getenv("GLY_CONSUMO_S", "30"))
+CUOTA_DIA = int(os.getenv("GLY_CUOTA_TOKENS_DIA", "0"))
+CUOTAS = os.getenv("GLY_CUOTAS", "cuotas.json")
+REVISION = 2.0  # segundos mínimos entre revisiones del archivo de cuotas
+
+ANONIMO = "-"  # llamadas sin usuario en contexto (CLI, precalentamiento, tareas internas)
+ESPECULATIVO = ":borrador"  # sufijo del agente para el gasto de borradores aún no entregados
+
+
+class CuotaExcedida(Exception):
+    """El usuario agotó su cuota de tokens del día; main.py la responde con 429"""
+
+    def __init__(self, user_id: str, usados: int, limite: int, reintentar: float):
+        super().__init__(f"Cuota diaria de tokens agotada para {user_id} ({usados}/{limite})")
+        self.user_id = user_id
+        self.usados = usados
+        self.limite = limite
+        self.reintentar = reintentar
+
+
+# ========================
+# 2. Usuario del contexto actual
+# ========================
+# Los agentes marcan a quién se cobra la llamada; PooledLLM (core/key_pool.py)
+# lo lee sin cambiar la firma de ningún .invoke(). Se restaura con set() y no
+# con reset(token) porque en los generadores de streaming cada next() corre
+# en una copia distinta del contexto.
+_usuario: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("gly_consumo_usuario", default=None)
+_admitido: contextvars.ContextVar[bool] = contextvars.ContextVar("gly_consumo_admitido", default=False)
+_gasto: contextvars.ContextVar[Optional["Gasto"]] = contextvars.ContextVar("gly_consumo_gasto", default=None)
+
+
+class Gasto:
+    """Tokens de un trabajo especulativo (borrador), por agente y modelo, hasta saber si se usa"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.filas: Dict[Tuple[str, str], List[int]] = {}
+
+    def sumar(self, agente: str, modelo: str, tokens_prompt: int, tokens_completion: int):
+        with self._lock:
+            fila = self.filas.setdefault((agente, modelo), [0, 0, 0])
+            fila[0] += 1
+            fila[1] += tokens_prompt
+            fila[2] += tokens_completion
+
+
+@contextmanager
+def usuario(user_id: Optional[str], agente: Optional[str] = None, admitido: bool = False):
+    """
+    Cobra a `user_id` las llamadas del bloque. Con `agente` la cuota se revisa
+    una sola vez al entrar: un turno o un documento ya empezado termina
+    aunque en el camino supere la cuota, en lugar de cortarse a la mitad.
+    """
+    if agente is not None:
+        libro.verificar(agente, user_id)
+        admitido = True
+    previo = (_usuario.get(), _admitido.get())
+    _usuario.set(None if user_id is None else str(user_id))
+    _admitido.set(admitido)
+    try:
+        yield
+    finally:
+        _usuario.set(previo[0])
+        _admitido.set(previo[1])
+
+
+@contextmanager
+def especulativo():
+    """
+    Las llamadas del bloque (un borrador en segundo plano) se anotan bajo
+    `<agente>:borrador` y no cuentan para la cuota del usuario; si el
+    borrador se entrega, `libro.trasladar(gasto)` las pasa a su agente real.
+    """
+    gasto = Gasto()
+    previo = _gasto.get()
+    _gasto.set(gasto)
+    try:
+        yield gasto
+    finally:
+        _gasto.set(previo)
+
+
+def especulativo_agente(agente: str) -> bool:
+    return agente.endswith(ESPECULATIVO)
+
+
+def por_usuario(user_id: Optional[str], generador: Iterator, agente: Optional[str] = None) -> Iterator:
+    """Itera un generador cobrando a `user_id` cada paso (respuestas en streaming)"""
+    try:
+        primero = True
+        while True:
+            with usuario(user_id, agente if primero else None, admitido=not primero):
+                primero = False
+                try:
+                    elemento = next(generador)
+                except StopIteration:
+                    return
+            yield elemento
+    finally:
+        # si el cliente corta el stream, el generador interno libera lo suyo enseguida
+        generador.close()
+
+
+def usuario_actual() -> Optional[str]:
+    return _usuario.get()
+
+
+def _dia(ts: Optional[float] = None) -> str:
+    return datetime.fromtimestamp(time.time() if ts is None else ts, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _hasta_medianoche() -> float:
+    ahora = datetime.now(timezone.utc)
+    manana = (ahora + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (manana - ahora).total_seconds()
+
+
+# ========================
+# 3. Libro de consumo
+# ========================
+Clave = Tuple[str, str, str]  # (user_id, agente, modelo)
+
+
+class LibroConsumo:
+    """
+    Tokens por (día, usuario, agente, modelo). Cada llamada suma en memoria;
+    un hilo vuelca los deltas al JSON del día bajo el lock del archivo y
+    relee el total, así varios workers comparten el libro y las cuotas ven
+    (con hasta GLY_CONSUMO_S de atraso) lo que gastaron los demás.
+    """
+
+    def __init__(self, directorio: str = DIRECTORIO, cuota_dia: int = CUOTA_DIA, cuotas: str = CUOTAS):
+        self.directorio = directorio
+        self.cuota_dia = cuota_dia
+        self.ruta_cuotas = cuotas
+        self._lock = threading.Lock()
+        self._dia = _dia()
+        self._total: Dict[Clave, List[int]] = {}      # del día: disco + propio
+        self._pendiente: Dict[Clave, List[int]] = {}  # aún no volcado
+        self._por_usuario: Dict[str, int] = {}        # tokens del día por usuario (para la cuota)
+        self._cuotas: Dict[str, int] = {}
+        self._cuotas_mtime = None
+        self._cuotas_revisadas = 0.0
+        self._rezagados: Optional[Tuple[str, Dict[Clave, List[int]]]] = None  # deltas de ayer sin volcar
+        self._hilo: Optional[threading.Thread] = None
+        self._cargado = False
+
+    # --- archivos ---
+    def _ruta(self, dia: str) -> str:
+        return os.path.join(self.directorio, f"{dia}.json")
+
+    def _leer(self, dia: str) -> Dict[Clave, List[int]]:
+        if not self.directorio:
+            return {}
+        try:
+            with open(self._ruta(dia), "r", encoding="utf-8") as f:
+                registros = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        return {
+            (r["user_id"], r["agent"], r["model"]): [r["llamadas"], r["prompt"], r["completion"]]
+            for r in registros
+        }
+
+    @staticmethod
+    def _registros(datos: Dict[Clave, List[int]]) -> List[dict]:
+        return [
+            {"user_id": u, "agent": a, "model": m, "llamadas": v[0], "prompt": v[1], "completion": v[2]}
+            for (u, a, m), v in sorted(datos.items()) if any(v)
+        ]
+
+    def _recalcular(self):
+        por_usuario: Dict[str, int] = {}
+        for (u, a, _), v in self._total.items():
+            if not especulativo_agente(a):
+                por_usuario[u] = por_usuario.get(u, 0) + v[1] + v[2]
+        self._por_usuario = por_usuario
+
+    def _asegurar_dia(self):
+        """Con lock tomado: carga el día en curso o rota al cambiar de día"""
+        hoy = _dia()
+        if self._cargado and hoy == self._dia:
+            return
+        if self._cargado and self._pendiente and self.directorio:
+            # los deltas del día anterior se vuelcan fuera del lock, en el próximo volcado
+            self._rezagados = (self._dia, self._pendiente)
+        self._dia, self._pendiente = hoy, {}
+        self._total = self._leer(hoy)
+        self._recalcular()
+        self._cargado = True
+
+    # --- cuotas ---
+    def _revisar_cuotas(self):
+        ahora = time.monotonic()
+        if not self.ruta_cuotas or ahora - self._cuotas_revisadas < REVISION:
+            return
+        self._cuotas_revisadas = ahora
+        try:
+            mtime = os.stat(self.ruta_cuotas).st_mtime_ns
+        except FileNotFoundError:
+            self._cuotas, self._cuotas_mtime = {}, None
+            return
+        if mtime == self._cuotas_mtime:
+            return
+        try:
+            with open(self.ruta_cuotas, "r", encoding="utf-8") as f:
+                cuotas = {str(u): int(v) for u, v in json.load(f).items()}
+            self._cuotas, self._cuotas_mtime = cuotas, mtime
+        except Exception as e:
+            print(f"❌ Archivo de cuotas inválido ({self.ruta_cuotas}), se mantienen las anteriores:", e)
+            self._cuotas_mtime = mtime
+
+    def limite(self, user_id: str) -> int:
+        with self._lock:
+            self._revisar_cuotas()
+            return self._cuotas.get(user_id, self.cuota_dia)
+
+    def verificar(self, agente: str = "api", user_id: Optional[str] = None):
+        """Antes de llamar al LLM: lanza CuotaExcedida si el usuario ya agotó su cuota del día"""
+        if user_id is None:
+            if _admitido.get():
+                return  # dentro de un turno o documento ya admitido
+            user_id = usuario_actual()
+        if user_id is None:
+            return
+        with self._lock:
+            self._revisar_cuotas()
+            limite = self._cuotas.get(user_id, self.cuota_dia)
+            if limite <= 0:
+                return
+            self._asegurar_dia()
+            usados = self._por_usuario.get(user_id, 0)
+        if usados >= limite:
+            metrics.cuota_rechazos.inc(agent=agente)
+            raise CuotaExcedida(user_id, usados, limite, _hasta_medianoche())
+
+    # --- registro ---
+    def _sumar(self, clave: Clave, v: List[int]):
+        """Con lock tomado"""
+        for tabla in (self._total, self._pendiente):
+            fila = tabla.setdefault(clave, [0, 0, 0])
+            for i in range(3):
+                fila[i] += v[i]
+        if not especulativo_agente(clave[1]):
+            self._por_usuario[clave[0]] = self._por_usuario.get(clave[0], 0) + v[1] + v[2]
+
+    def registrar(self, agente: str, modelo: Optional[str], tokens_prompt: int, tokens_completion: int,
+                  user_id: Optional[str] = None):
+        user_id = user_id if user_id is not None else (usuario_actual() or ANONIMO)
+        modelo = modelo or "-"
+        gasto = _gasto.get()
+        tipo = ""
+        if gasto is not None:
+            gasto.sumar(agente, modelo, tokens_prompt, tokens_completion)
+            agente, tipo = agente + ESPECULATIVO, "borrador_"
+        with self._lock:
+            self._asegurar_dia()
+            self._sumar((user_id, agente, modelo), [1, tokens_prompt, tokens_completion])
+        metrics.tokens_consumidos.inc(tokens_prompt, agent=agente, model=modelo, kind=tipo + "prompt")
+        metrics.tokens_consumidos.inc(tokens_completion, agent=agente, model=modelo, kind=tipo + "completion")
+
+    def trasladar(self, gasto: Optional[Gasto], user_id: str):
+        """Un borrador entregado: su gasto pasa de `<agente>:borrador` al agente real y a la cuota"""
+        if gasto is None:
+            return
+        with gasto._lock:
+            filas = {c: list(v) for c, v in gasto.filas.items()}
+            gasto.filas.clear()
+        with self._lock:
+            self._asegurar_dia()
+            for (agente, modelo), v in filas.items():
+                self._sumar((user_id, agente + ESPECULATIVO, modelo), [-x for x in v])
+                self._sumar((user_id, agente, modelo), v)
+
+    # --- persistencia ---
+    def _volcar_dia(self, dia: str, deltas: Dict[Clave, List[int]]) -> Dict[Clave, List[int]]:
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = self._ruta(dia)
+        with bloqueo_archivo(ruta):
+            datos = self._leer(dia)
+            for clave, v in deltas.items():
+                fila = datos.setdefault(clave, [0, 0, 0])
+                for i in range(3):
+                    fila[i] += v[i]
+            temporal = f"{ruta}.{os.getpid()}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(self._registros(datos), f, ensure_ascii=False)
+            os.replace(temporal, ruta)
+        return datos
+
+    def volcar(self):
+        """Suma lo pendiente al JSON del día y adopta el total de todos los workers"""
+        if not self.directorio:
+            return
+        with self._lock:
+            self._asegurar_dia()
+            dia, deltas, self._pendiente = self._dia, self._pendiente, {}
+            rezagados, self._rezagados = self._rezagados, None
+        try:
+            if rezagados:
+                self._volcar_dia(*rezagados)
+            datos = self._volcar_dia(dia, deltas)
+        except Exception as e:
+            print("❌ Error al volcar el libro de consumo:", e)
+            with self._lock:
+                # se reintenta en el próximo volcado
+                for clave, v in deltas.items():
+                    fila = self._pendiente.setdefault(clave, [0, 0, 0])
+                    for i in range(3):
+                        fila[i] += v[i]
+            return
+        with self._lock:
+            if self._dia == dia:
+                # total = disco (ya incluye lo volcado) + lo registrado mientras se volcaba
+                total = {c: list(v) for c, v in datos.items()}
+                for clave, v in self._pendiente.items():
+                    fila = total.setdefault(clave, [0, 0, 0])
+                    for i in range(3):
+                        fila[i] += v[i]
+                self._total = total
+                self._recalcular()
+
+    def _bucle(self):
+        while True:
+            time.sleep(INTERVALO)
+            self.volcar()
+
+    def arrancar(self):
+        if self.directorio and INTERVALO > 0 and self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name="consumo", daemon=True)
+            self._hilo.start()
+
+    # --- consultas ---
+    def _datos(self, dia: str) -> Dict[Clave, List[int]]:
+        with self._lock:
+            self._asegurar_dia()
+            if dia == self._dia:
+                return {c: list(v) for c, v in self._total.items()}
+        return self._leer(dia)
+
+    def _dias(self, dias: int) -> List[str]:
+        hoy = datetime.now(timezone.utc)
+        return [(hoy - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(max(1, dias))]
+
+    def usuario(self, user_id: str, dias: int = 7) -> dict:
+        """Consumo de un usuario por día, agente y modelo, más el estado de su cuota"""
+        por_dia = []
+        for dia in self._dias(dias):
+            filas = [
+                {"agent": a, "model": m, "llamadas": v[0], "prompt": v[1], "completion": v[2]}
+                for (u, a, m), v in sorted(self._datos(dia).items()) if u == user_id and any(v)
+            ]
+            if filas:
+                # los borradores no entregados figuran en el detalle pero no en el total del usuario
+                tokens = sum(f["prompt"] + f["completion"] for f in filas if not especulativo_agente(f["agent"]))
+                por_dia.append({"dia": dia, "tokens": tokens, "detalle": filas})
+        limite = self.limite(user_id)
+        with self._lock:
+            self._asegurar_dia()
+            hoy = self._por_usuario.get(user_id, 0)
+        return {
+            "user_id": user_id,
+            "cuota": {
+                "limite_dia": limite or None,
+                "usados_hoy": hoy,
+                "restantes_hoy": max(0, limite - hoy) if limite > 0 else None,
+            },
+            "dias": por_dia,
+        }
+
+    def resumen(self, dias: int = 1, top: int = 20) -> dict:
+        """Totales por agente y modelo y los usuarios que más consumen, para planificar capacidad"""
+        por_agente: Dict[Tuple[str, str], List[int]] = {}
+        por_usuario: Dict[str, int] = {}
+        tokens_especulativos = 0
+        for dia in self._dias(dias):
+            for (u, a, m), v in self._datos(dia).items():
+                if not any(v):
+                    continue
+                fila = por_agente.setdefault((a, m), [0, 0, 0])
+                for i in range(3):
+                    fila[i] += v[i]
+                if especulativo_agente(a):
+                    tokens_especulativos += v[1] + v[2]
+                else:
+                    por_usuario[u] = por_usuario.get(u, 0) + v[1] + v[2]
+        return {
+            "dias": dias,
+            "por_agente": [
+                {"agent": a, "model": m, "llamadas": v[0], "prompt": v[1], "completion": v[2]}
+                for (a, m), v in sorted(por_agente.items(), key=lambda x: -(x[1][1] + x[1][2]))
+            ],
+            # borradores redactados que nadie pidió (o aún no entregados)
+            "tokens_especulativos": tokens_especulativos,
+            "usuarios": len(por_usuario),
+            "top_usuarios": [
+                {"user_id": u, "tokens": t}
+                for u, t in sorted(por_usuario.items(), key=lambda x: -x[1])[:max(0, top)]
+            ],
+        }
+
+
+libro = LibroConsumo()
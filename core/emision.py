@@ -0,0 +1,41 @@
+# core/emision.py
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+# ========================
+# 1. Receptor de tokens del turno en curso
+# ========================
+# Los LLM que generan por streaming (core/presupuesto.py) avisan cada fragmento
+# al receptor del contexto actual, si lo hay. Un canal (p. ej. el WebSocket)
+# lo instala alrededor del nodo del agente sin cambiar su firma.
+DELTA = "delta"
+REINICIO = "reinicio"  # lo emitido hasta ahora se descarta (p. ej. la cascada escala)
+
+_receptor: contextvars.ContextVar = contextvars.ContextVar("gly_receptor", default=None)
+
+
+@contextmanager
+def receptor(funcion: Callable[[str, Optional[str]], None]):
+    """funcion(tipo, texto) recibe DELTA con cada fragmento y REINICIO sin texto"""
+    token = _receptor.set(funcion)
+    try:
+        yield
+    finally:
+        _receptor.reset(token)
+
+
+def activo() -> bool:
+    return _receptor.get() is not None
+
+
+def emitir(fragmento: str):
+    funcion = _receptor.get()
+    if funcion is not None and fragmento:
+        funcion(DELTA, fragmento)
+
+
+def reiniciar():
+    funcion = _receptor.get()
+    if funcion is not None:
+        funcion(REINICIO, None)
@@ -0,0 +1,251 @@
+# core/fake_llm.py
+import os
+import time
+import random
+import threading
+from typing import Dict, List, Optional
+
+# ========================
+# 1. Respuestas y errores del proveedor falso
+# ========================
+class FakeRespuesta:
+    """Imita el objeto AIMessage que devuelve ChatGroq.invoke()"""
+
+    def __init__(self, content: str, model: str, prompt_tokens: int, completion_tokens: int):
+        self.content = content
+        self.response_metadata = {
+            "model_name": model,
+            "token_usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+        self.usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+
+class FakeChunk:
+    """Imita un AIMessageChunk de ChatGroq.stream()"""
+
+    def __init__(self, content: str, usage_metadata: Optional[dict] = None):
+        self.content = content
+        self.usage_metadata = usage_metadata
+
+
+class _FakeHTTPResponse:
+    def __init__(self, headers: dict):
+        self.status_code = 429
+        self.headers = headers
+
+
+class FakeRateLimitError(Exception):
+    """Equivalente local de groq.RateLimitError"""
+
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit alcanzado, reintentar en {retry_after:.2f}s")
+        self.response = _FakeHTTPResponse({"retry-after": f"{retry_after:.3f}"})
+
+
+# frases con las que se arma el texto simulado (terminan en punto para
+# que el corte por fin de oración tenga límites reales)
+FRASES = [
+    "Entiendo, ese proceso parece consumir bastante tiempo de tu equipo.",
+    "La automatización con IA podría reducir los errores manuales.",
+    "Sería útil conocer qué herramientas usan hoy para ese registro.",
+    "Cuéntame cuántas personas participan en esa tarea cada semana.",
+    "¿Cuál es la parte del proceso que más retrasos genera?",
+]
+
+
+# ========================
+# 2. Proveedor con cuota por key
+# ========================
+class FakeGroqProvider:
+    """
+    Proveedor LLM local para pruebas y benchmarks: cada key tiene un límite
+    de requests por ventana, reporta cabeceras x-ratelimit-* al pool como lo
+    haría Groq y lanza FakeRateLimitError al agotar la cuota. La latencia se
+    reproduce de forma determinista (semilla fija): tiempo hasta el primer
+    token con distribución lognormal de mediana `latencia`, más la decodificación
+    de `tokens_salida` tokens a `tokens_por_segundo`. No usa red.
+    """
+
+    def __init__(self, keys: List[str], limite_requests: int = 30, ventana: float = 60.0, latencia: float = 0.0,
+                 sigma: float = 0.3, tokens_por_segundo: float = 0.0, tokens_salida: int = 40, semilla: int = 1234):
+        self.keys = list(keys)
+        self.limite_requests = limite_requests
+        self.ventana = ventana
+        self.latencia = latencia
+        self.sigma = sigma
+        self.tokens_por_segundo = tokens_por_segundo
+        self.tokens_salida = tokens_salida
+        self._rng = random.Random(semilla)
+        self._lock = threading.Lock()
+        self._usos: Dict[str, List[float]] = {k: [] for k in self.keys}
+
+    @classmethod
+    def desde_entorno(cls) -> "FakeGroqProvider":
+        n_keys = int(os.getenv("GLY_FAKE_KEYS", "2"))
+        return cls(
+            keys=[f"fake-key-{i}" for i in range(1, n_keys + 1)],
+            limite_requests=int(os.getenv("GLY_FAKE_RPM", "30")),
+            latencia=float(os.getenv("GLY_FAKE_LATENCIA", "0")),
+            sigma=float(os.getenv("GLY_FAKE_SIGMA", "0.3")),
+            tokens_por_segundo=float(os.getenv("GLY_FAKE_TOKENS_S", "0")),
+            tokens_salida=int(os.getenv("GLY_FAKE_TOKENS_SALIDA", "40")),
+            semilla=int(os.getenv("GLY_FAKE_SEED", "1234")),
+        )
+
+    def muestrear(self, max_tokens: Optional[int] = None):
+        """(segundos hasta el primer token, tokens de salida, segundos por token)"""
+        with self._lock:
+            ttft = self._rng.lognormvariate(0.0, self.sigma) * self.latencia if self.latencia else 0.0
+            tokens = max(1, int(self._rng.gauss(self.tokens_salida, self.tokens_salida * 0.2)))
+        if max_tokens:
+            tokens = min(tokens, max_tokens)
+        por_token = 1.0 / self.tokens_por_segundo if self.tokens_por_segundo else 0.0
+        return ttft, tokens, por_token
+
+    @staticmethod
+    def texto(tokens: int) -> str:
+        """Texto determinista de ~`tokens` palabras"""
+        palabras = []
+        i = 0
+        while len(palabras) < tokens:
+            palabras.extend(FRASES[i % len(FRASES)].split())
+            i += 1
+        return " ".join(palabras[:tokens])
+
+    def _consumir(self, key: str):
+        with self._lock:
+            ahora = time.monotonic()
+            usos = [t for t in self._usos[key] if ahora - t < self.ventana]
+            if len(usos) >= self.limite_requests:
+                self._usos[key] = usos
+                raise FakeRateLimitError(self.ventana - (ahora - usos[0]))
+            usos.append(ahora)
+            self._usos[key] = usos
+            restantes = self.limite_requests - len(usos)
+            reset = self.ventana - (ahora - usos[0])
+        return {
+            "x-ratelimit-limit-requests": str(self.limite_requests),
+            "x-ratelimit-remaining-requests": str(restantes),
+            "x-ratelimit-reset-requests": f"{reset:.2f}s",
+        }
+
+    def factory(self, key: str, pool=None, **params):
+        """Firma compatible con KeyPool(factory=...)"""
+        return FakeChat(self, key, pool=pool, **params)
+
+
+# ========================
+# 3. Cliente falso
+# ========================
+class FakeChat:
+    """Cliente con la interfaz .invoke() de ChatGroq"""
+
+    def __init__(self, proveedor: FakeGroqProvider, key: str, pool=None, model: str = "fake", **params):
+        self.proveedor = proveedor
+        self.key = key
+        self.pool = pool
+        self.model_name = model
+        self.params = params
+
+    def invoke(self, entrada, **kwargs):
+        texto = entrada if isinstance(entrada, str) else str(entrada)
+        headers = self.proveedor._consumir(self.key)
+        if self.pool is not None:
+            self.pool.registrar_cabeceras(self.key, headers)
+        ttft, tokens, por_token = self.proveedor.muestrear(self.params.get("max_tokens"))
+        if ttft or por_token:
+            time.sleep(ttft + tokens * por_token)
+        contenido = f"Respuesta simulada ({self.model_name}). " + self.proveedor.texto(tokens)
+        return FakeRespuesta(contenido, self.model_name, len(texto.split()), tokens)
+
+    def stream(self, entrada, **kwargs):
+        """Emite subpalabras (como los tokens de Groq) al ritmo de tokens_por_segundo"""
+        texto = entrada if isinstance(entrada, str) else str(entrada)
+        headers = self.proveedor._consumir(self.key)
+        if self.pool is not None:
+            self.pool.registrar_cabeceras(self.key, headers)
+        max_tokens = kwargs.get("max_tokens") or self.params.get("max_tokens")
+        ttft, tokens, por_token = self.proveedor.muestrear(max_tokens)
+        if ttft:
+            time.sleep(ttft)
+        # `tokens` es el largo en chunks, igual que max_tokens en Groq
+        fragmentos = trocear(self.proveedor.texto(tokens))[:tokens]
+        for fragmento in fragmentos:
+            if por_token:
+                time.sleep(por_token)
+            yield FakeChunk(fragmento)
+        yield FakeChunk("", usage_metadata={
+            "input_tokens": len(texto.split()),
+            "output_tokens": len(fragmentos),
+            "total_tokens": len(texto.split()) + len(fragmentos),
+        })
+
+
+def trocear(texto: str, largo: int = 4) -> List[str]:
+    """Parte el texto en subpalabras de hasta `largo` caracteres; el espacio va al inicio de la palabra"""
+    fragmentos = []
+    for i, palabra in enumerate(texto.split()):
+        piezas = [palabra[j:j + largo] for j in range(0, len(palabra), largo)]
+        if i:
+            piezas[0] = " " + piezas[0]
+        fragmentos.extend(piezas)
+    return fragmentos
+
+
+# ========================
+# 4. Motor local falso (fallback en CPU)
+# ========================
+class MotorLocalFalso:
+    """
+    Motor con la interfaz que usa core/inferencia_local.ProgramadorLotes,
+    sin modelo: cada pasada de decodificación cuesta `paso` segundos sea
+    cual sea el tamaño del lote (como una CPU que no satura con lotes
+    chicos) y el prefill `prefill` segundos por secuencia. Sirve para medir
+    el rendimiento del programador con varias peticiones concurrentes.
+    """
+
+    def __init__(self, paso: float = 0.01, prefill: float = 0.0):
+        self.paso = paso
+        self.prefill_s = prefill
+        self.eos = None
+        self.pasos = 0
+        self._vocabulario = " ".join(FRASES).split()
+
+    @classmethod
+    def desde_entorno(cls) -> "MotorLocalFalso":
+        return cls(
+            paso=float(os.getenv("GLY_FAKE_LOCAL_PASO_MS", "10")) / 1000.0,
+            prefill=float(os.getenv("GLY_FAKE_LOCAL_PREFILL_MS", "0")) / 1000.0,
+        )
+
+    def preparar(self):
+        pass
+
+    def codificar(self, texto: str) -> List[int]:
+        return list(range(len(texto.split())))
+
+    def texto(self, ids: List[int]) -> str:
+        return " ".join(self._vocabulario[i % len(self._vocabulario)] for i in ids)
+
+    def prefill(self, secuencias):
+        for sec in secuencias:
+            if self.prefill_s:
+                time.sleep(self.prefill_s)
+            sec.generados.append(0)
+
+    def decodificar(self, secuencias):
+        if self.paso:
+            time.sleep(self.paso)
+        self.pasos += 1
+        for sec in secuencias:
+            sec.generados.append(len(sec.generados))
@@ -0,0 +1,169 @@
+# core/idempotencia.py
+import os
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+
+from starlette.responses import JSONResponse
+
+from core import metrics
+
+# ========================
+# 1. Configuración
+# ========================
+# GLY_IDEMPOTENCIA_MAX: respuestas guardadas como máximo (LRU).
+# GLY_IDEMPOTENCIA_TTL: segundos durante los que se repite una respuesta guardada.
+MAX_ENTRADAS = int(os.getenv("GLY_IDEMPOTENCIA_MAX", "1000"))
+TTL = float(os.getenv("GLY_IDEMPOTENCIA_TTL", "3600"))
+
+CABECERA = b"idempotency-key"
+
+
+class _Entrada:
+    __slots__ = ("huella", "listo", "status", "headers", "cuerpo", "creada")
+
+    def __init__(self, huella: str, listo: asyncio.Future):
+        self.huella = huella
+        self.listo = listo  # True: respuesta guardada, False: el original falló
+        self.status = 0
+        self.headers = []
+        self.cuerpo = b""
+        self.creada = time.monotonic()
+
+
+def guardable(status: int) -> bool:
+    """No se guardan errores transitorios: el reintento debe poder ejecutarse de nuevo"""
+    return status < 500 and status not in (408, 425, 429)
+
+
+def reentregar(cuerpo: bytes, receive):
+    """
+    receive() que entrega una vez el cuerpo ya leído y después delega en el
+    original: StreamingResponse espera ahí el http.disconnect, y devolver el
+    cuerpo en cada llamada lo dejaría girando sin ceder el event loop.
+    """
+    entregado = False
+
+    async def recibir():
+        nonlocal entregado
+        if not entregado:
+            entregado = True
+            return {"type": "http.request", "body": cuerpo, "more_body": False}
+        return await receive()
+
+    return recibir
+
+
+# ========================
+# 2. Middleware ASGI
+# ========================
+class IdempotenciaASGI:
+    """
+    Soporte opcional de la cabecera Idempotency-Key en los POST.
+
+    - Primera vez: se ejecuta y se guarda la respuesta (status, cabeceras, cuerpo).
+    - Duplicado mientras el original sigue en curso: espera al original y
+      recibe su misma respuesta, sin volver a llamar al LLM.
+    - Duplicado ya completado: se repite la respuesta guardada.
+    - Misma key con otro cuerpo: 422.
+    Si el original falla (5xx, 429 o excepción) la entrada se descarta y los
+    duplicados que esperaban se ejecutan por su cuenta.
+    """
+
+    def __init__(self, app, max_entradas: int = MAX_ENTRADAS, ttl: float = TTL):
+        self.app = app
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas: "OrderedDict[tuple, _Entrada]" = OrderedDict()
+
+    def _vigente(self, clave: tuple) -> Optional[_Entrada]:
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        if entrada.listo.done() and time.monotonic() - entrada.creada > self.ttl:
+            del self._entradas[clave]
+            return None
+        self._entradas.move_to_end(clave)
+        return entrada
+
+    def _guardar(self, clave: tuple, entrada: _Entrada):
+        self._entradas[clave] = entrada
+        # se descartan primero las más viejas ya completadas
+        while len(self._entradas) > self.max_entradas:
+            vieja_clave, vieja = next(iter(self._entradas.items()))
+            if not vieja.listo.done():
+                break
+            del self._entradas[vieja_clave]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        key = dict(scope.get("headers") or []).get(CABECERA)
+        if not key:
+            await self.app(scope, receive, send)
+            return
+
+        # el cuerpo se lee completo para la huella y se vuelve a entregar a la app
+        partes = []
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] != "http.request":
+                break
+            partes.append(mensaje.get("body", b""))
+            if not mensaje.get("more_body"):
+                break
+        cuerpo = b"".join(partes)
+        huella = hashlib.sha256(cuerpo).hexdigest()
+
+        clave = (scope["path"], scope.get("query_string", b""), key)
+        entrada = self._vigente(clave)
+        if entrada is not None:
+            if entrada.huella != huella:
+                respuesta = JSONResponse(
+                    {"detail": "Idempotency-Key reutilizada con un cuerpo distinto"}, status_code=422
+                )
+                await respuesta(scope, reentregar(cuerpo, receive), send)
+                return
+            en_curso = not entrada.listo.done()
+            if await asyncio.shield(entrada.listo):
+                metrics.idempotencia.inc(result="en_curso" if en_curso else "repetida")
+                await self._repetir(entrada, send)
+                return
+            # el original falló: este duplicado se ejecuta como uno nuevo
+            await self.app(scope, reentregar(cuerpo, receive), send)
+            return
+
+        entrada = _Entrada(huella, asyncio.get_running_loop().create_future())
+        self._guardar(clave, entrada)
+        metrics.idempotencia.inc(result="nueva")
+        cuerpo_respuesta = []
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                entrada.status = mensaje["status"]
+                entrada.headers = list(mensaje.get("headers") or [])
+            elif mensaje["type"] == "http.response.body":
+                cuerpo_respuesta.append(mensaje.get("body", b""))
+            await send(mensaje)
+
+        ok = False
+        try:
+            await self.app(scope, reentregar(cuerpo, receive), enviar)
+            ok = guardable(entrada.status)
+        finally:
+            if ok:
+                entrada.cuerpo = b"".join(cuerpo_respuesta)
+                entrada.creada = time.monotonic()
+            elif self._entradas.get(clave) is entrada:
+                del self._entradas[clave]
+            entrada.listo.set_result(ok)
+
+    async def _repetir(self, entrada: _Entrada, send):
+        headers = [(k, v) for k, v in entrada.headers if k.lower() not in (b"content-length", b"idempotent-replayed")]
+        headers.append((b"content-length", str(len(entrada.cuerpo)).encode()))
+        headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": entrada.status, "headers": headers})
+        await send({"type": "http.response.body", "body": entrada.cuerpo, "more_body": False})
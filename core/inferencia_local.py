@@ -0,0 +1,609 @@
+# core/inferencia_local.py
+import os
+import sys
+import time
+import queue
+import socket
+import threading
+import subprocess
+from multiprocessing.connection import Connection
+from typing import Callable, Dict, List, Optional
+
+from core import metrics
+
+# ========================
+# 1. Configuración
+# ========================
+# GLY_LOCAL_MODELO: modelo de Hugging Face del fallback en CPU (para pruebas,
+#   uno diminuto como "sshleifer/tiny-gpt2").
+# GLY_LOCAL_LOTE: secuencias que se decodifican juntas como máximo.
+# GLY_LOCAL_ESPERA_MS: con el motor ocioso, cuánto se espera a que lleguen
+#   más prompts antes de arrancar el primer lote.
+# GLY_LOCAL_MAX_PROMPT: tokens de prompt que se conservan (los últimos).
+# GLY_LOCAL_TIMEOUT_S: espera máxima de quien pide una generación.
+# GLY_LOCAL_PRECARGAR=1: carga el modelo al arrancar el servidor.
+MODELO = os.getenv("GLY_LOCAL_MODELO", "tiiuae/falcon-7b-instruct")
+MAX_LOTE = max(1, int(os.getenv("GLY_LOCAL_LOTE", "8")))
+ESPERA = float(os.getenv("GLY_LOCAL_ESPERA_MS", "20")) / 1000.0
+MAX_PROMPT = int(os.getenv("GLY_LOCAL_MAX_PROMPT", "1536"))
+TIMEOUT = float(os.getenv("GLY_LOCAL_TIMEOUT_S", "120"))
+TOP_P = float(os.getenv("GLY_LOCAL_TOP_P", "0.95"))
+TEMPERATURA = float(os.getenv("GLY_LOCAL_TEMPERATURA", "1.0"))
+PRECARGAR = os.getenv("GLY_LOCAL_PRECARGAR", "0").strip().lower() in ("1", "true", "si", "sí")
+
+
+class Secuencia:
+    """Una petición de generación: prompt, tokens generados y su caché KV"""
+
+    __slots__ = ("ids", "max_nuevos", "generados", "cache", "listo", "texto", "error", "cancelada", "llegada",
+                 "al_terminar")
+
+    def __init__(self, ids: List[int], max_nuevos: int, al_terminar: Optional[Callable] = None):
+        self.ids = ids
+        self.max_nuevos = max(1, max_nuevos)
+        self.generados: List[int] = []
+        self.cache = None
+        self.listo = threading.Event()
+        self.texto = ""
+        self.error: Optional[BaseException] = None
+        self.cancelada = False
+        self.llegada = time.monotonic()
+        self.al_terminar = al_terminar
+
+
+# ========================
+# 2. Motor sobre transformers (paso a paso, caché KV por secuencia)
+# ========================
+class MotorTransformers:
+    """
+    Carga el modelo una sola vez y expone los dos pasos que combina el
+    programador: `prefill` (el prompt de cada secuencia nueva, de a una y sin
+    relleno) y `decodificar` (un token para todas las secuencias activas en
+    una sola pasada). Para decodificar en lote, las cachés KV de distinto
+    largo se rellenan por la izquierda, con la máscara de atención en 0 sobre
+    el relleno y la posición real de cada secuencia en position_ids; después
+    cada secuencia recupera su parte sin el relleno. Así una secuencia puede
+    entrar o salir del lote en cualquier paso.
+    transformers y torch solo se importan al cargar el modelo.
+    """
+
+    def __init__(self, modelo: str = MODELO, top_p: float = TOP_P, temperatura: float = TEMPERATURA):
+        self.nombre = modelo
+        self.top_p = top_p
+        self.temperatura = temperatura
+        self.token = os.getenv("HUGGINGFACE_API_KEY") or os.getenv("HUGGINGFACE_API_KEY2")
+        self.eos = None
+        self._lock = threading.Lock()
+        self._torch = None
+        self._tokenizer = None
+        self._modelo = None
+
+    def preparar(self):
+        with self._lock:
+            if self._modelo is not None:
+                return
+            import torch
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+
+            inicio = time.perf_counter()
+            tokenizer = AutoTokenizer.from_pretrained(self.nombre, token=self.token)
+            modelo = AutoModelForCausalLM.from_pretrained(self.nombre, token=self.token)
+            modelo.eval()
+            self._torch = torch
+            self._tokenizer = tokenizer
+            self.eos = tokenizer.eos_token_id
+            self._modelo = modelo
+            print(f"✅ Modelo local {self.nombre} cargado en {time.perf_counter() - inicio:.1f}s")
+
+    def codificar(self, texto: str) -> List[int]:
+        ids = self._tokenizer(texto)["input_ids"]
+        return ids[-MAX_PROMPT:]
+
+    def texto(self, ids: List[int]) -> str:
+        return self._tokenizer.decode(ids, skip_special_tokens=True)
+
+    def _muestrear(self, logits) -> List[int]:
+        """Muestreo top-p por fila (greedy con temperatura 0)"""
+        torch = self._torch
+        if self.temperatura <= 0:
+            return logits.argmax(-1).tolist()
+        probs = torch.softmax(logits.float() / self.temperatura, dim=-1)
+        orden, indices = torch.sort(probs, descending=True, dim=-1)
+        # fuera del núcleo: tokens cuya probabilidad acumulada previa ya supera top_p
+        orden[(orden.cumsum(-1) - orden) > self.top_p] = 0.0
+        elegidos = torch.multinomial(orden, 1)
+        return indices.gather(-1, elegidos).squeeze(-1).tolist()
+
+    def prefill(self, secuencias: List[Secuencia]):
+        torch = self._torch
+        with torch.no_grad():
+            for sec in secuencias:
+                salida = self._modelo(input_ids=torch.tensor([sec.ids]), use_cache=True)
+                sec.cache = _a_tuplas(salida.past_key_values)
+                sec.generados.append(self._muestrear(salida.logits[:, -1, :])[0])
+
+    def decodificar(self, secuencias: List[Secuencia]):
+        torch = self._torch
+        pad = torch.nn.functional.pad
+        # tokens ya en caché: el prompt y todos los generados menos el último
+        largos = [len(sec.ids) + len(sec.generados) - 1 for sec in secuencias]
+        maximo = max(largos)
+        pasado = []
+        for capa in range(len(secuencias[0].cache)):
+            ks, vs = [], []
+            for sec, largo in zip(secuencias, largos):
+                k, v = sec.cache[capa]
+                relleno = maximo - largo
+                if relleno:
+                    # [1, cabezas, largo, dim] -> relleno a la izquierda del eje del largo
+                    k, v = pad(k, (0, 0, relleno, 0)), pad(v, (0, 0, relleno, 0))
+                ks.append(k)
+                vs.append(v)
+            pasado.append((torch.cat(ks), torch.cat(vs)))
+
+        mascara = torch.tensor([[0] * (maximo - largo) + [1] * (largo + 1) for largo in largos])
+        with torch.no_grad():
+            salida = self._modelo(
+                input_ids=torch.tensor([[sec.generados[-1]] for sec in secuencias]),
+                attention_mask=mascara,
+                position_ids=torch.tensor([[largo] for largo in largos]),
+                past_key_values=_a_cache(pasado),
+                use_cache=True,
+            )
+        nuevo = _a_tuplas(salida.past_key_values)
+        siguientes = self._muestrear(salida.logits[:, -1, :])
+        for i, (sec, largo) in enumerate(zip(secuencias, largos)):
+            desde = maximo - largo
+            sec.cache = tuple((k[i:i + 1, :, desde:, :], v[i:i + 1, :, desde:, :]) for k, v in nuevo)
+            sec.generados.append(siguientes[i])
+
+
+def _a_tuplas(past_key_values):
+    """Caché de transformers (DynamicCache o tuplas) -> tuplas (k, v) por capa"""
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return tuple(past_key_values)
+
+
+def _a_cache(capas):
+    try:
+        from transformers import DynamicCache
+        return DynamicCache.from_legacy_cache(tuple(capas))
+    except (ImportError, AttributeError):
+        return tuple(capas)
+
+
+# ========================
+# 3. Programador con batching continuo
+# ========================
+class ProgramadorLotes:
+    """
+    Un hilo dueño del modelo que agrupa las generaciones concurrentes de todos
+    los agentes. Cada iteración admite secuencias nuevas hasta `max_lote`
+    (prefill), cierra las terminadas y decodifica un token para todas las
+    activas en una sola pasada: las que llegan con el lote en marcha entran
+    en el siguiente paso, sin esperar a que termine el lote anterior.
+    Con el motor ocioso, la primera petición espera hasta `espera` segundos
+    a que lleguen otras, para arrancar con un lote en vez de una secuencia.
+    """
+
+    def __init__(self, motor, max_lote: int = MAX_LOTE, espera: float = ESPERA):
+        self.motor = motor
+        self.max_lote = max(1, max_lote)
+        self.espera = espera
+        self._cola: "queue.Queue[Secuencia]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._hilo: Optional[threading.Thread] = None
+        self.activas = 0
+
+    def enviar(self, prompt: str, max_nuevos: int = 150, al_terminar: Optional[Callable] = None) -> Secuencia:
+        """Encola sin bloquear; `al_terminar(sec)` se llama desde el hilo del programador"""
+        self.motor.preparar()
+        self._arrancar()
+        sec = Secuencia(self.motor.codificar(prompt), max_nuevos, al_terminar)
+        self._cola.put(sec)
+        return sec
+
+    def generar(self, prompt: str, max_nuevos: int = 150, timeout: Optional[float] = TIMEOUT) -> str:
+        """Bloquea el hilo que llama hasta tener el texto generado (sin el prompt)"""
+        sec = self.enviar(prompt, max_nuevos)
+        if not sec.listo.wait(timeout):
+            sec.cancelada = True  # el programador la descarta en el próximo paso
+            raise TimeoutError(f"el modelo local no respondió en {timeout}s")
+        if sec.error is not None:
+            raise sec.error
+        return sec.texto
+
+    def pendientes(self) -> int:
+        return self._cola.qsize()
+
+    def _arrancar(self):
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name="inferencia-local", daemon=True)
+                self._hilo.start()
+
+    def _recoger(self, activas: int) -> List[Secuencia]:
+        libres = self.max_lote - activas
+        nuevas: List[Secuencia] = []
+        if libres <= 0:
+            return nuevas
+        if activas == 0:
+            nuevas.append(self._cola.get())  # ocioso: se bloquea hasta la próxima petición
+            limite = time.monotonic() + self.espera
+            while len(nuevas) < libres:
+                resto = limite - time.monotonic()
+                if resto <= 0:
+                    break
+                try:
+                    nuevas.append(self._cola.get(timeout=resto))
+                except queue.Empty:
+                    break
+            return nuevas
+        while len(nuevas) < libres:
+            try:
+                nuevas.append(self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return nuevas
+
+    def _cerrar_terminadas(self, secuencias: List[Secuencia]) -> List[Secuencia]:
+        vivas = []
+        for sec in secuencias:
+            if sec.cancelada:
+                continue
+            ultimo = sec.generados[-1] if sec.generados else None
+            if ultimo is not None and (ultimo == self.motor.eos or len(sec.generados) >= sec.max_nuevos):
+                generados = sec.generados[:-1] if ultimo == self.motor.eos else sec.generados
+                sec.texto = self.motor.texto(generados)
+                self._terminar(sec)
+                continue
+            vivas.append(sec)
+        return vivas
+
+    @staticmethod
+    def _terminar(sec: Secuencia):
+        sec.cache = None
+        sec.listo.set()
+        if sec.al_terminar is not None:
+            sec.al_terminar(sec)
+
+    def _bucle(self):
+        activas: List[Secuencia] = []
+        while True:
+            nuevas = [sec for sec in self._recoger(len(activas)) if not sec.cancelada]
+            try:
+                if nuevas:
+                    ahora = time.monotonic()
+                    for sec in nuevas:
+                        metrics.local_espera.observe(ahora - sec.llegada)
+                    self.motor.prefill(nuevas)
+                    activas.extend(nuevas)
+                activas = self._cerrar_terminadas(activas)
+                if activas:
+                    metrics.local_lote.observe(len(activas))
+                    self.motor.decodificar(activas)
+            except Exception as e:
+                print("❌ Error en el lote del modelo local:", e)
+                for sec in {id(s): s for s in activas + nuevas}.values():
+                    sec.error = e
+                    self._terminar(sec)
+                activas = []
+            self.activas = len(activas)
+
+
+# ========================
+# 4. Procesos de inferencia
+# ========================
+# GLY_LOCAL_PROCESOS: procesos con su propia copia del modelo (1 por defecto;
+#   0 = en un hilo del propio servidor, como en Windows).
+# GLY_LOCAL_RECICLAR: peticiones tras las que un proceso se reemplaza por uno
+#   nuevo (libera la memoria que fragmentan las cachés KV).
+# GLY_LOCAL_TIMEOUTS_MAX: timeouts seguidos tras los que un proceso se da por
+#   colgado y se mata.
+PROCESOS = max(0, int(os.getenv("GLY_LOCAL_PROCESOS", "1")))
+RECICLAR = max(1, int(os.getenv("GLY_LOCAL_RECICLAR", "500")))
+TIMEOUTS_MAX = max(1, int(os.getenv("GLY_LOCAL_TIMEOUTS_MAX", "3")))
+PLAZO_CARGA = float(os.getenv("GLY_LOCAL_PLAZO_CARGA_S", "900"))
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Pedido:
+    __slots__ = ("listo", "texto", "error")
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.texto = ""
+        self.error: Optional[str] = None
+
+
+class ProcesoInferencia:
+    """
+    Un proceso hijo (`python -m core.inferencia_local`) con su propio modelo y
+    ProgramadorLotes. Se lanza como módulo y no con multiprocessing para que
+    el hijo no vuelva a importar main.py (y con él todos los agentes). Por el
+    socket viajan solo el prompt y el texto generado (unos KB); la
+    tokenización, los tensores y las cachés KV nunca salen del hijo.
+    Un hilo lector resuelve las respuestas; si el hijo muere, las peticiones
+    pendientes fallan enseguida en lugar de esperar su timeout.
+    """
+
+    def __init__(self, nombre: str):
+        padre, hijo = socket.socketpair()
+        self.nombre = nombre
+        self.proceso = subprocess.Popen(
+            [sys.executable, "-m", "core.inferencia_local", str(hijo.fileno())],
+            pass_fds=(hijo.fileno(),),
+            cwd=RAIZ,
+        )
+        hijo.close()
+        self.conexion = Connection(padre.detach())
+        self.pendientes: Dict[int, _Pedido] = {}
+        self.atendidas = 0
+        self.timeouts_seguidos = 0
+        self.retirado = False
+        self._cerrado = False
+        self._lock = threading.Lock()
+        self._envio = threading.Lock()
+        self._lector = threading.Thread(target=self._leer, name=f"{nombre}-lector", daemon=True)
+        self._lector.start()
+
+    def vivo(self) -> bool:
+        return not self._cerrado and self.proceso.poll() is None
+
+    def enviar(self, id_: int, mensaje: tuple) -> _Pedido:
+        pedido = _Pedido()
+        with self._lock:
+            self.pendientes[id_] = pedido
+            self.atendidas += 1
+        self._mandar(mensaje)
+        return pedido
+
+    def olvidar(self, id_: int):
+        """El que pidió dejó de esperar: el hijo descarta la secuencia en el próximo paso"""
+        with self._lock:
+            self.pendientes.pop(id_, None)
+            vacio = not self.pendientes
+        self._mandar(("cancelar", id_))
+        if self.retirado and vacio:
+            self.cerrar()
+
+    def retirar(self):
+        """No recibe más peticiones; se cierra al terminar las que tiene"""
+        with self._lock:
+            self.retirado = True
+            vacio = not self.pendientes
+        if vacio:
+            self.cerrar()
+
+    def cerrar(self):
+        self._mandar(("fin",))
+
+    def matar(self):
+        try:
+            self.proceso.kill()
+        except OSError:
+            pass
+
+    def _mandar(self, mensaje: tuple):
+        try:
+            with self._envio:
+                self.conexion.send(mensaje)
+        except (OSError, ValueError):
+            pass  # el hijo ya no está: el lector resuelve los pendientes
+
+    def _leer(self):
+        while True:
+            try:
+                tipo, id_, dato = self.conexion.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                pedido = self.pendientes.pop(id_, None)
+                vacio = not self.pendientes
+            self.timeouts_seguidos = 0
+            if pedido is not None:
+                if tipo == "ok":
+                    pedido.texto = dato
+                else:
+                    pedido.error = dato
+                pedido.listo.set()
+            if self.retirado and vacio:
+                self.cerrar()
+
+        self._cerrado = True
+        self.conexion.close()
+        with self._lock:
+            pendientes, self.pendientes = self.pendientes, {}
+        for pedido in pendientes.values():
+            pedido.error = f"el proceso {self.nombre} terminó"
+            pedido.listo.set()
+        self.proceso.wait()
+
+
+class PoolInferencia:
+    """
+    Reparte las generaciones entre los procesos de inferencia (el que tenga
+    menos pendientes). Cada proceso hace su propio batching continuo, así que
+    las peticiones concurrentes que caen en el mismo proceso comparten pasos.
+    Reemplaza los procesos muertos, los que llegaron a `reciclar` peticiones
+    (el viejo termina lo suyo antes de salir) y los colgados.
+    El servidor solo espera en un Event: ni el GIL ni el event loop se ven
+    afectados mientras el modelo trabaja.
+    """
+
+    def __init__(self, procesos: int = PROCESOS, reciclar: int = RECICLAR, timeouts_max: int = TIMEOUTS_MAX):
+        self.procesos = max(1, procesos)
+        self.reciclar = reciclar
+        self.timeouts_max = timeouts_max
+        self._lock = threading.Lock()
+        self._trabajadores: List[ProcesoInferencia] = []
+        self._creados = 0
+        self._ids = 0
+
+    def _activos(self) -> List[ProcesoInferencia]:
+        return [t for t in self._trabajadores if t.vivo() and not t.retirado]
+
+    def _elegir(self) -> ProcesoInferencia:
+        with self._lock:
+            self._trabajadores = [t for t in self._trabajadores if t.vivo()]
+            activos = self._activos()
+            while len(activos) < self.procesos:
+                if self._creados >= self.procesos:
+                    metrics.local_reinicios.inc(reason="reemplazo")
+                self._creados += 1
+                nuevo = ProcesoInferencia(f"inferencia-local-{self._creados}")
+                self._trabajadores.append(nuevo)
+                activos.append(nuevo)
+            return min(activos, key=lambda t: len(t.pendientes))
+
+    def _siguiente_id(self) -> int:
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+    def _esperar(self, trabajador: ProcesoInferencia, id_: int, pedido: _Pedido, timeout: Optional[float]) -> str:
+        if not pedido.listo.wait(timeout):
+            trabajador.olvidar(id_)
+            trabajador.timeouts_seguidos += 1
+            if trabajador.timeouts_seguidos >= self.timeouts_max:
+                print(f"❌ {trabajador.nombre} no responde tras {trabajador.timeouts_seguidos} timeouts, se reinicia")
+                metrics.local_reinicios.inc(reason="colgado")
+                trabajador.matar()
+            raise TimeoutError(f"el modelo local no respondió en {timeout}s")
+        if pedido.error is not None:
+            raise RuntimeError(pedido.error)
+        return pedido.texto
+
+    def generar(self, prompt: str, max_nuevos: int = 150, timeout: Optional[float] = TIMEOUT) -> str:
+        trabajador = self._elegir()
+        id_ = self._siguiente_id()
+        pedido = trabajador.enviar(id_, ("generar", id_, prompt, max_nuevos))
+        if trabajador.atendidas >= self.reciclar and not trabajador.retirado:
+            metrics.local_reinicios.inc(reason="reciclado")
+            trabajador.retirar()
+        return self._esperar(trabajador, id_, pedido, timeout)
+
+    def preparar(self):
+        """Arranca los procesos y espera a que todos tengan el modelo cargado"""
+        self._elegir()
+        with self._lock:
+            activos = self._activos()
+        for trabajador in activos:
+            id_ = self._siguiente_id()
+            pedido = trabajador.enviar(id_, ("preparar", id_, None, None))
+            self._esperar(trabajador, id_, pedido, PLAZO_CARGA)
+
+    def pendientes(self) -> int:
+        with self._lock:
+            return sum(len(t.pendientes) for t in self._trabajadores)
+
+    def vivos(self) -> int:
+        with self._lock:
+            return sum(1 for t in self._trabajadores if t.vivo())
+
+
+def _servir(fd: int):
+    """Bucle del proceso hijo: recibe peticiones por el socket y responde al terminar cada una"""
+    conexion = Connection(fd)
+    programador = ProgramadorLotes(crear_motor())
+    secuencias: Dict[int, Secuencia] = {}
+    envio = threading.Lock()
+
+    def responder(mensaje: tuple):
+        try:
+            with envio:
+                conexion.send(mensaje)
+        except (OSError, ValueError):
+            pass
+
+    def al_terminar(id_: int, sec: Secuencia):
+        secuencias.pop(id_, None)
+        if sec.error is not None:
+            responder(("error", id_, repr(sec.error)))
+        else:
+            responder(("ok", id_, sec.texto))
+
+    while True:
+        try:
+            mensaje = conexion.recv()
+        except (EOFError, OSError):
+            break  # el servidor se fue
+        tipo = mensaje[0]
+        if tipo == "fin":
+            break
+        id_ = mensaje[1]
+        if tipo == "cancelar":
+            sec = secuencias.pop(id_, None)
+            if sec is not None:
+                sec.cancelada = True
+            continue
+        try:
+            if tipo == "preparar":
+                programador.motor.preparar()
+                responder(("ok", id_, ""))
+            elif tipo == "generar":
+                secuencias[id_] = programador.enviar(
+                    mensaje[2], mensaje[3], al_terminar=lambda sec, id_=id_: al_terminar(id_, sec)
+                )
+        except Exception as e:
+            print("❌ Error en el proceso de inferencia local:", e)
+            responder(("error", id_, repr(e)))
+
+
+# ========================
+# 5. Instancia compartida por los agentes
+# ========================
+_programador: Optional[ProgramadorLotes] = None
+_pool: Optional[PoolInferencia] = None
+_programador_lock = threading.Lock()
+
+
+def crear_motor():
+    if os.getenv("GLY_LLM_PROVIDER", "groq") == "fake":
+        from core.fake_llm import MotorLocalFalso
+        return MotorLocalFalso.desde_entorno()
+    return MotorTransformers()
+
+
+def programador() -> ProgramadorLotes:
+    global _programador
+    with _programador_lock:
+        if _programador is None:
+            _programador = ProgramadorLotes(crear_motor())
+            metrics.local_pendientes.set_funcion(_programador.pendientes)
+        return _programador
+
+
+def en_procesos() -> bool:
+    # pass_fds no existe en Windows: ahí el modelo corre en un hilo del servidor
+    return PROCESOS > 0 and os.name == "posix"
+
+
+def pool_procesos() -> PoolInferencia:
+    global _pool
+    with _programador_lock:
+        if _pool is None:
+            _pool = PoolInferencia()
+            metrics.local_pendientes.set_funcion(_pool.pendientes)
+            metrics.local_procesos.set_funcion(_pool.vivos)
+        return _pool
+
+
+def generar(prompt: str, max_nuevos: int = 150) -> str:
+    """Generación en el modelo local compartido (fallback cuando Groq falla)"""
+    if en_procesos():
+        return pool_procesos().generar(prompt, max_nuevos)
+    return programador().generar(prompt, max_nuevos)
+
+
+def precargar():
+    if en_procesos():
+        pool_procesos().preparar()
+    else:
+        programador().motor.preparar()
+
+
+if __name__ == "__main__":
+    _servir(int(sys.argv[1]))
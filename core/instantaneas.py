@@ -0,0 +1,378 @@
+# core/instantaneas.py
+import os
+import mmap
+import time
+import zlib
+import struct
+import hashlib
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from core import metrics
+from core.turnos import bloqueo_archivo
+
+# ========================
+# 1. Configuración
+# ========================
+# GLY_INSTANTANEA: archivo de la instantánea de sesiones ("" la desactiva).
+# GLY_INSTANTANEA_S: segundos entre instantáneas (0 = solo al apagar).
+# GLY_INSTANTANEA_TTL_H: horas sin actividad tras las que una sesión guardada se descarta.
+RUTA = os.getenv("GLY_INSTANTANEA", "sesiones.snap")
+INTERVALO = float(os.getenv("GLY_INSTANTANEA_S", "60"))
+TTL = float(os.getenv("GLY_INSTANTANEA_TTL_H", "168")) * 3600
+
+# ========================
+# 2. Formato binario
+# ========================
+# cabecera: magia, cantidad de sesiones, offset del índice
+# bloques:  [u16 largo clave][clave utf-8][mensajes comprimidos con zlib]
+#           mensajes = ([u8 tipo][u32 largo][texto utf-8])*
+# índice:   una entrada de ancho fijo por sesión, ordenada por hash de la clave:
+#           [u64 hash][u64 offset][u32 largo][u32 última actividad][u32 mensajes]
+# Abrir la instantánea solo lee la cabecera: el índice se recorre con búsqueda
+# binaria directamente sobre el mmap y cada bloque se descomprime recién
+# cuando su usuario vuelve.
+MAGIA = b"GLYSNAP1"
+CABECERA = struct.Struct("<8sIIQ")
+ENTRADA = struct.Struct("<QQIII")
+LARGO_CLAVE = struct.Struct("<H")
+MENSAJE = struct.Struct("<BI")
+
+TIPOS = {"human": 0, "ai": 1, "system": 2}
+TIPOS_INVERSO = {v: k for k, v in TIPOS.items()}
+
+
+def clave_de(espacio: str, user_id: str) -> str:
+    return f"{espacio}\x00{user_id}"
+
+
+def hash_clave(clave: str) -> int:
+    return int.from_bytes(hashlib.blake2b(clave.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def codificar(clave: str, mensajes: List[Tuple[str, str]]) -> bytes:
+    partes = []
+    for tipo, texto in mensajes:
+        datos = texto.encode("utf-8")
+        partes.append(MENSAJE.pack(TIPOS.get(tipo, 1), len(datos)))
+        partes.append(datos)
+    clave_b = clave.encode("utf-8")
+    return LARGO_CLAVE.pack(len(clave_b)) + clave_b + zlib.compress(b"".join(partes), 1)
+
+
+def _clave_del_bloque(bloque) -> str:
+    (largo,) = LARGO_CLAVE.unpack_from(bloque, 0)
+    return bytes(bloque[LARGO_CLAVE.size:LARGO_CLAVE.size + largo]).decode("utf-8")
+
+
+def decodificar(bloque) -> List[Tuple[str, str]]:
+    (largo,) = LARGO_CLAVE.unpack_from(bloque, 0)
+    datos = zlib.decompress(bloque[LARGO_CLAVE.size + largo:])
+    mensajes, i = [], 0
+    while i < len(datos):
+        tipo, n = MENSAJE.unpack_from(datos, i)
+        i += MENSAJE.size
+        mensajes.append((TIPOS_INVERSO.get(tipo, "ai"), datos[i:i + n].decode("utf-8")))
+        i += n
+    return mensajes
+
+
+def escribir(ruta: str, bloques: List[Tuple[str, bytes, int, int]]):
+    """bloques: (clave, bytes, última actividad, mensajes). Escritura atómica con os.replace"""
+    entradas = sorted(((hash_clave(c), b, ts, n) for c, b, ts, n in bloques), key=lambda e: e[0])
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(b"\0" * CABECERA.size)
+        indice = []
+        offset = CABECERA.size
+        for h, bloque, ts, n in entradas:
+            f.write(bloque)
+            indice.append(ENTRADA.pack(h, offset, len(bloque), ts, n))
+            offset += len(bloque)
+        f.write(b"".join(indice))
+        f.seek(0)
+        f.write(CABECERA.pack(MAGIA, len(entradas), 0, offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+
+class Instantanea:
+    """Instantánea abierta con mmap; las búsquedas no cargan nada más en memoria"""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        # lectores en curso: una instantánea reemplazada se cierra cuando suelta el último
+        self._uso = threading.Lock()
+        self._lectores = 0
+        self._retirada = False
+        self._archivo = open(ruta, "rb")
+        try:
+            self._mapa = mmap.mmap(self._archivo.fileno(), 0, access=mmap.ACCESS_READ)
+            magia, self.n, _, self._indice = CABECERA.unpack_from(self._mapa, 0)
+            if magia != MAGIA or self._indice + self.n * ENTRADA.size > len(self._mapa):
+                raise ValueError("cabecera inválida")
+        except Exception:
+            self._archivo.close()
+            raise
+
+    @classmethod
+    def abrir(cls, ruta: str) -> Optional["Instantanea"]:
+        if not ruta or not os.path.exists(ruta):
+            return None
+        try:
+            return cls(ruta)
+        except Exception as e:
+            print(f"❌ Instantánea de sesiones ilegible ({ruta}), se ignora:", e)
+            return None
+
+    def _entrada(self, i: int) -> tuple:
+        return ENTRADA.unpack_from(self._mapa, self._indice + i * ENTRADA.size)
+
+    def _bloque(self, offset: int, largo: int) -> memoryview:
+        return memoryview(self._mapa)[offset:offset + largo]
+
+    def buscar(self, clave: str) -> Optional[Tuple[memoryview, int, int]]:
+        """(bloque, última actividad, mensajes) por búsqueda binaria sobre el índice"""
+        h = hash_clave(clave)
+        bajo, alto = 0, self.n
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if self._entrada(medio)[0] < h:
+                bajo = medio + 1
+            else:
+                alto = medio
+        # entradas con el mismo hash (colisión): se compara la clave guardada
+        while bajo < self.n:
+            hash_, offset, largo, ts, n = self._entrada(bajo)
+            if hash_ != h:
+                break
+            bloque = self._bloque(offset, largo)
+            if _clave_del_bloque(bloque) == clave:
+                return bloque, ts, n
+            bajo += 1
+        return None
+
+    def mensajes(self, clave: str) -> Optional[List[Tuple[str, str]]]:
+        encontrado = self.buscar(clave)
+        return decodificar(encontrado[0]) if encontrado else None
+
+    def bloques(self) -> Iterator[Tuple[str, bytes, int, int]]:
+        for i in range(self.n):
+            _, offset, largo, ts, n = self._entrada(i)
+            bloque = self._bloque(offset, largo)
+            yield _clave_del_bloque(bloque), bytes(bloque), ts, n
+
+    def tomar(self):
+        with self._uso:
+            self._lectores += 1
+
+    def soltar(self):
+        with self._uso:
+            self._lectores -= 1
+            cerrar = self._retirada and self._lectores == 0
+        if cerrar:
+            self.cerrar()
+
+    def retirar(self):
+        """Reemplazada por una más nueva: se cierra ahora o al terminar su último lector"""
+        with self._uso:
+            self._retirada = True
+            cerrar = self._lectores == 0
+        if cerrar:
+            self.cerrar()
+
+    def cerrar(self):
+        try:
+            self._mapa.close()
+        except BufferError:
+            pass  # quedan memoryviews vivas: el mapa se libera con ellas
+        self._archivo.close()
+
+
+# ========================
+# 3. Gestor: restauración perezosa e instantáneas periódicas
+# ========================
+class GestorInstantaneas:
+    """
+    Conecta los AlmacenSesiones de los agentes con la instantánea en disco.
+
+    - Al registrar un almacén se le da una función de restauración: nada se
+      lee al arrancar, cada sesión se reconstruye cuando su usuario vuelve.
+    - Cada `intervalo` segundos (y al apagar) se escribe una instantánea
+      nueva: las sesiones en memoria (reutilizando el bloque anterior si no
+      cambió) más las guardadas que aún no volvieron, salvo las reiniciadas
+      o vencidas. Se escribe bajo el lock del archivo partiendo de lo que haya
+      en disco, así varios workers no se pisan las sesiones.
+    """
+
+    def __init__(self, ruta: str = RUTA, intervalo: float = INTERVALO, ttl: float = TTL):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._escritura = threading.Lock()
+        self._memorias: Dict[str, object] = {}
+        self._indices: Dict[str, object] = {}
+        self._snap: Optional[Instantanea] = None
+        # clave -> (memoria, mensajes) de lo que este proceso escribió en la última instantánea
+        self._escritas: Dict[str, tuple] = {}
+        self._abierta = False
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def activo(self) -> bool:
+        return bool(self.ruta)
+
+    def _actual(self) -> Optional[Instantanea]:
+        # con self._lock tomado
+        if not self._abierta:
+            self._abierta = True
+            self._snap = Instantanea.abrir(self.ruta)
+        return self._snap
+
+    def _instantanea(self) -> Optional[Instantanea]:
+        with self._lock:
+            return self._actual()
+
+    # --- registro de almacenes ---
+    def registrar(self, espacio: str, usuarios):
+        """Almacén de memorias de conversación de un agente: entra en las instantáneas y se restaura de ellas"""
+        if not self.activo():
+            return
+        with self._lock:
+            self._memorias[espacio] = usuarios
+        usuarios.restaurar_con(lambda uid: self._restaurar_memoria(espacio, uid, usuarios.factory))
+
+    def registrar_indices(self, espacio: str, indices, desde: Callable):
+        """Índices derivados de la memoria (BM25): no se guardan, se reconstruyen con `desde(intercambios)`"""
+        if not self.activo():
+            return
+        with self._lock:
+            self._indices[espacio] = indices
+        indices.restaurar_con(lambda uid: self._restaurar_indice(espacio, uid, desde))
+
+    def _mensajes(self, espacio: str, user_id: str) -> Optional[List[Tuple[str, str]]]:
+        # se toma bajo el lock: guardar() no puede cerrar el mapa mientras se lee
+        with self._lock:
+            snap = self._actual()
+            if snap is None:
+                return None
+            snap.tomar()
+        try:
+            return snap.mensajes(clave_de(espacio, user_id))
+        except Exception as e:
+            print(f"❌ No se pudo restaurar la sesión {espacio}/{user_id}:", e)
+            return None
+        finally:
+            snap.soltar()
+
+    def _restaurar_memoria(self, espacio: str, user_id: str, factory: Callable):
+        mensajes = self._mensajes(espacio, user_id)
+        if not mensajes:
+            return None
+        from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+        clases = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+        memoria = factory()
+        memoria.chat_memory.messages = [clases[tipo](content=texto) for tipo, texto in mensajes]
+        metrics.sesiones_restauradas.inc(agent=espacio)
+        return memoria
+
+    def _restaurar_indice(self, espacio: str, user_id: str, indice_desde: Callable):
+        mensajes = self._mensajes(espacio, user_id)
+        if not mensajes:
+            return None
+        intercambios = []
+        for tipo, texto in mensajes:
+            if tipo == "human":
+                intercambios.append({"user": texto, "ai": ""})
+            elif tipo == "ai" and intercambios:
+                intercambios[-1]["ai"] = texto
+        return indice_desde(intercambios)
+
+    # --- escritura ---
+    def guardar(self) -> int:
+        """Escribe una instantánea nueva; devuelve cuántas sesiones contiene"""
+        if not self.activo():
+            return 0
+        with self._escritura, bloqueo_archivo(self.ruta):
+            inicio = time.perf_counter()
+            ahora = int(time.time())
+            with self._lock:
+                memorias = dict(self._memorias)
+                indices = dict(self._indices)
+            marcas = {id(a): a.marca() for a in list(memorias.values()) + list(indices.values())}
+            disco = Instantanea.abrir(self.ruta)  # la última, quizá escrita por otro worker
+            try:
+                bloques, vistas, escritas = [], set(), {}
+                for espacio, almacen in memorias.items():
+                    for user_id, memoria in almacen.sesiones():
+                        mensajes = list(getattr(getattr(memoria, "chat_memory", None), "messages", None) or [])
+                        if not mensajes:
+                            continue
+                        clave = clave_de(espacio, user_id)
+                        vistas.add(clave)
+                        escritas[clave] = (memoria, len(mensajes))
+                        previo = disco.buscar(clave) if disco is not None else None
+                        anterior = self._escritas.get(clave)
+                        if (previo is not None and anterior is not None and anterior[0] is memoria
+                                and anterior[1] == len(mensajes) == previo[2]):
+                            # sin turnos nuevos desde la última instantánea: se copia el bloque tal cual
+                            bloques.append((clave, bytes(previo[0]), previo[1], previo[2]))
+                            continue
+                        pares = [(getattr(m, "type", "ai"), getattr(m, "content", "")) for m in mensajes]
+                        bloques.append((clave, codificar(clave, pares), ahora, len(mensajes)))
+
+                if disco is not None:
+                    for clave, bloque, ts, n in disco.bloques():
+                        if clave in vistas or ahora - ts > self.ttl:
+                            continue
+                        espacio, _, user_id = clave.partition("\x00")
+                        almacen = memorias.get(espacio)
+                        if almacen is not None and not almacen.conservar_guardada(user_id):
+                            continue
+                        bloques.append((clave, bloque, ts, n))
+            finally:
+                if disco is not None:
+                    disco.cerrar()
+
+            escribir(self.ruta, bloques)
+            self._escritas = escritas
+            nueva = Instantanea.abrir(self.ruta)
+            with self._lock:
+                anterior, self._snap, self._abierta = self._snap, nueva, True
+            for almacen in memorias.values():
+                almacen.instantanea_renovada(marcas[id(almacen)])
+            for almacen in indices.values():
+                almacen.instantanea_renovada(marcas[id(almacen)])
+            if anterior is not None:
+                anterior.retirar()
+            metrics.instantanea_duracion.observe(time.perf_counter() - inicio)
+            metrics.instantanea_sesiones.set(len(bloques))
+            return len(bloques)
+
+    # --- ciclo periódico ---
+    def _bucle(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.guardar()
+            except Exception as e:
+                print("❌ Error al escribir la instantánea de sesiones:", e)
+
+    def arrancar(self):
+        """Abre la instantánea (solo la cabecera) y lanza el hilo periódico"""
+        if not self.activo():
+            return
+        self._instantanea()
+        if self.intervalo > 0 and self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name="instantaneas", daemon=True)
+            self._hilo.start()
+
+    def detener(self) -> int:
+        """Última instantánea al apagar"""
+        self._detener.set()
+        return self.guardar()
+
+
+instantaneas = GestorInstantaneas()
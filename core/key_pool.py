@@ -0,0 +1,393 @@
+# core/key_pool.py
+import os
+import re
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from core import consumo, metrics, tracing
+
+load_dotenv()
+
+# ========================
+# 1. Descubrimiento de API keys
+# ========================
+def cargar_keys_groq() -> List[str]:
+    """
+    Reúne todas las API keys de Groq configuradas en el entorno:
+    GROQ_API_KEY, GROQ_API_KEY2, GROQ_API_KEY3, ... y GROQ_API_KEYS
+    (lista separada por comas). Se eliminan duplicados conservando el orden.
+    """
+    keys = []
+    candidatas = [os.getenv("GROQ_API_KEY")]
+    n = 2
+    while os.getenv(f"GROQ_API_KEY{n}"):
+        candidatas.append(os.getenv(f"GROQ_API_KEY{n}"))
+        n += 1
+    candidatas += (os.getenv("GROQ_API_KEYS") or "").split(",")
+
+    for key in candidatas:
+        key = (key or "").strip()
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+# ========================
+# 2. Lectura de cabeceras de rate limit
+# ========================
+_DURACION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+def parsear_duracion(valor: Optional[str]) -> Optional[float]:
+    """Convierte '2m59.56s', '7.66s', '120ms' o '30' a segundos"""
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    try:
+        return float(valor)
+    except ValueError:
+        pass
+    partes = _DURACION_RE.findall(valor)
+    if not partes:
+        return None
+    factores = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(numero) * factores[unidad] for numero, unidad in partes)
+
+
+def _entero(valor) -> Optional[int]:
+    try:
+        return int(float(valor))
+    except (TypeError, ValueError):
+        return None
+
+
+# ========================
+# 3. Estado por key
+# ========================
+class EstadoKey:
+    """Cuota conocida y cooldown de una API key"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.limite_requests: Optional[int] = None
+        self.limite_tokens: Optional[int] = None
+        self.restantes_requests: Optional[int] = None
+        self.restantes_tokens: Optional[int] = None
+        self.reset_requests_en = 0.0
+        self.reset_tokens_en = 0.0
+        self.cooldown_hasta = 0.0
+        self.en_vuelo = 0
+        self.llamadas = 0
+        self.errores_429 = 0
+
+    def _fraccion(self, restantes, limite, reset_en, ahora) -> float:
+        if restantes is None or ahora >= reset_en:
+            return 1.0
+        if not limite:
+            return 1.0 if restantes > 0 else 0.0
+        return max(0.0, restantes / limite)
+
+    def puntaje(self, ahora: float) -> float:
+        """Fracción de cuota disponible (0 = agotada, 1 = libre)"""
+        return min(
+            self._fraccion(self.restantes_requests, self.limite_requests, self.reset_requests_en, ahora),
+            self._fraccion(self.restantes_tokens, self.limite_tokens, self.reset_tokens_en, ahora),
+        )
+
+    def resumen(self, ahora: float) -> dict:
+        return {
+            "key": f"...{self.key[-4:]}",
+            "puntaje": round(self.puntaje(ahora), 3),
+            "restantes_requests": self.restantes_requests,
+            "restantes_tokens": self.restantes_tokens,
+            "cooldown_s": round(max(0.0, self.cooldown_hasta - ahora), 2),
+            "en_vuelo": self.en_vuelo,
+            "llamadas": self.llamadas,
+            "errores_429": self.errores_429,
+        }
+
+
+# ========================
+# 4. Pool de keys
+# ========================
+class KeyPool:
+    """
+    Reparte las llamadas de todos los agentes entre todas las API keys.
+    Elige la key con más cuota restante (según las cabeceras x-ratelimit-*
+    de cada respuesta) que no esté en cooldown por un 429.
+    """
+
+    COOLDOWN_POR_DEFECTO = 10.0
+
+    def __init__(self, keys: List[str], factory: Optional[Callable] = None, reloj: Callable[[], float] = time.monotonic):
+        if not keys:
+            raise ValueError("en el .env no hay una api valida")
+        self.keys = list(keys)
+        self.estados: Dict[str, EstadoKey] = {k: EstadoKey(k) for k in self.keys}
+        self.factory = factory or crear_cliente_groq
+        self.reloj = reloj
+        self._lock = threading.Lock()
+        self._turno = 0
+        self._clientes: Dict[tuple, object] = {}
+        self._perfiles: Dict[tuple, dict] = {}  # parámetros de cada pool.llm(...) declarado
+
+    # --- selección ---
+    def elegir(self) -> str:
+        with self._lock:
+            ahora = self.reloj()
+            n = len(self.keys)
+            # rotamos el punto de partida para desempatar en round-robin
+            orden = [self.keys[(self._turno + i) % n] for i in range(n)]
+            self._turno = (self._turno + 1) % n
+
+            disponibles = [self.estados[k] for k in orden if self.estados[k].cooldown_hasta <= ahora]
+            if disponibles:
+                elegido = max(disponibles, key=lambda e: (e.puntaje(ahora), -e.en_vuelo))
+            else:
+                # todas en cooldown: la que se libere antes
+                elegido = min(self.estados.values(), key=lambda e: e.cooldown_hasta)
+
+            elegido.en_vuelo += 1
+            elegido.llamadas += 1
+            # descuento optimista para que llamadas concurrentes se repartan
+            if elegido.restantes_requests is not None and elegido.restantes_requests > 0:
+                elegido.restantes_requests -= 1
+            return elegido.key
+
+    def liberar(self, key: str):
+        with self._lock:
+            estado = self.estados.get(key)
+            if estado and estado.en_vuelo > 0:
+                estado.en_vuelo -= 1
+
+    # --- retroalimentación ---
+    def registrar_cabeceras(self, key: str, headers):
+        """Actualiza la cuota de una key con las cabeceras de la respuesta"""
+        estado = self.estados.get(key)
+        if estado is None or headers is None:
+            return
+        get = headers.get
+        with self._lock:
+            ahora = self.reloj()
+            limite_req = _entero(get("x-ratelimit-limit-requests"))
+            limite_tok = _entero(get("x-ratelimit-limit-tokens"))
+            rest_req = _entero(get("x-ratelimit-remaining-requests"))
+            rest_tok = _entero(get("x-ratelimit-remaining-tokens"))
+            if limite_req is not None:
+                estado.limite_requests = limite_req
+            if limite_tok is not None:
+                estado.limite_tokens = limite_tok
+            if rest_req is not None:
+                estado.restantes_requests = rest_req
+                estado.reset_requests_en = ahora + (parsear_duracion(get("x-ratelimit-reset-requests")) or 60.0)
+            if rest_tok is not None:
+                estado.restantes_tokens = rest_tok
+                estado.reset_tokens_en = ahora + (parsear_duracion(get("x-ratelimit-reset-tokens")) or 60.0)
+
+    def registrar_429(self, key: str, retry_after: Optional[float] = None):
+        """Pone la key en cooldown tras un 429"""
+        estado = self.estados.get(key)
+        if estado is None:
+            return
+        with self._lock:
+            espera = retry_after if retry_after is not None else self.COOLDOWN_POR_DEFECTO
+            estado.cooldown_hasta = max(estado.cooldown_hasta, self.reloj() + espera)
+            estado.errores_429 += 1
+
+    def estado(self) -> List[dict]:
+        with self._lock:
+            ahora = self.reloj()
+            return [self.estados[k].resumen(ahora) for k in self.keys]
+
+    # --- clientes ---
+    def cliente(self, key: str, **params):
+        """Cliente LLM cacheado por (key, parámetros)"""
+        clave = (key, tuple(sorted(params.items())))
+        with self._lock:
+            cliente = self._clientes.get(clave)
+            if cliente is None:
+                cliente = self.factory(key, pool=self, **params)
+                self._clientes[clave] = cliente
+            return cliente
+
+    def llm(self, agente: str = "api", **params) -> "PooledLLM":
+        """LLM con la misma interfaz .invoke() de ChatGroq, respaldado por el pool"""
+        with self._lock:
+            self._perfiles[tuple(sorted(params.items()))] = params
+        return PooledLLM(self, agente=agente, **params)
+
+    def precalentar(self) -> int:
+        """
+        Crea de antemano los clientes de todas las combinaciones (key, modelo)
+        declaradas, para que el primer request no pague la construcción de
+        ChatGroq y del cliente httpx. Devuelve cuántos clientes hay en caché.
+        """
+        with self._lock:
+            perfiles = list(self._perfiles.values())
+        for key in self.keys:
+            for params in perfiles:
+                self.cliente(key, **params)
+        return len(self._clientes)
+
+
+# ========================
+# 5. LLM respaldado por el pool
+# ========================
+def es_rate_limit(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after_de(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    return parsear_duracion(headers.get("retry-after"))
+
+
+class PooledLLM:
+    """
+    Sustituto de ChatGroq: cada llamada toma la mejor key del pool y,
+    si recibe un 429, la pone en cooldown y reintenta con la siguiente.
+    """
+
+    def __init__(self, pool: KeyPool, agente: str = "api", **params):
+        self.pool = pool
+        self.agente = agente
+        self.params = params
+        self.model_name = params.get("model")
+
+    def invoke(self, entrada, **kwargs):
+        labels = {"agent": self.agente, "model": self.model_name}
+        consumo.libro.verificar(self.agente)
+        with tracing.span("groq.invoke", model=self.model_name) as s:
+            inicio = time.perf_counter()
+            try:
+                respuesta = self._invoke_rotando(entrada, **kwargs)
+            except Exception:
+                metrics.llm_errores.inc(**labels)
+                raise
+            duracion = time.perf_counter() - inicio
+            # sin streaming el primer token llega junto con la respuesta completa
+            tokens_prompt, tokens_completion = metrics.uso_tokens(respuesta)
+            self._registrar(labels, duracion, duracion, tokens_prompt, tokens_completion)
+            s.set(prompt_tokens=tokens_prompt, completion_tokens=tokens_completion)
+        return respuesta
+
+    def stream(self, entrada, **kwargs):
+        """
+        Igual que ChatGroq.stream(). La rotación de keys ante un 429 solo es
+        posible antes del primer chunk; si el consumidor deja de iterar, la
+        conexión se cierra y Groq deja de generar.
+        """
+        labels = {"agent": self.agente, "model": self.model_name}
+        consumo.libro.verificar(self.agente)
+        with tracing.span("groq.stream", model=self.model_name) as s:
+            inicio = time.perf_counter()
+            try:
+                key, chunks, primero = self._stream_rotando(entrada, **kwargs)
+            except Exception:
+                metrics.llm_errores.inc(**labels)
+                raise
+            if primero is None:
+                self.pool.liberar(key)
+                return
+            ttft = time.perf_counter() - inicio
+            n_chunks = 0
+            uso = None
+            try:
+                chunk = primero
+                while True:
+                    n_chunks += 1
+                    uso = getattr(chunk, "usage_metadata", None) or uso
+                    yield chunk
+                    chunk = next(chunks)
+            except StopIteration:
+                pass
+            finally:
+                cerrar = getattr(chunks, "close", None)
+                if cerrar is not None:
+                    cerrar()
+                self.pool.liberar(key)
+                tokens_prompt = int(uso.get("input_tokens", 0)) if uso else 0
+                tokens_completion = int(uso.get("output_tokens", 0)) if uso else n_chunks
+                self._registrar(labels, time.perf_counter() - inicio, ttft, tokens_prompt, tokens_completion)
+                s.set(ttft_ms=round(ttft * 1000, 2), prompt_tokens=tokens_prompt, completion_tokens=tokens_completion)
+
+    def _registrar(self, labels, duracion, ttft, tokens_prompt, tokens_completion):
+        metrics.llm_latencia.observe(duracion, **labels)
+        metrics.llm_ttft.observe(ttft, **labels)
+        metrics.llm_tokens_prompt.observe(tokens_prompt, **labels)
+        metrics.llm_tokens_completion.observe(tokens_completion, **labels)
+        # libro por usuario (el del contexto, ver core/consumo.py) para cuotas y facturación
+        consumo.libro.registrar(self.agente, self.model_name, tokens_prompt, tokens_completion)
+
+    def _stream_rotando(self, entrada, **kwargs):
+        """(key, iterador, primer chunk); la key queda tomada hasta que se libere"""
+        ultimo_error = None
+        for _ in range(len(self.pool.keys)):
+            key = self.pool.elegir()
+            chunks = iter(self.pool.cliente(key, **self.params).stream(entrada, **kwargs))
+            try:
+                return key, chunks, next(chunks)
+            except StopIteration:
+                return key, chunks, None
+            except Exception as e:
+                self.pool.liberar(key)
+                if not es_rate_limit(e):
+                    raise
+                print(f"⚠️ Key ...{key[-4:]} con rate limit, probando otra")
+                self.pool.registrar_429(key, retry_after_de(e))
+                ultimo_error = e
+        raise ultimo_error
+
+    def _invoke_rotando(self, entrada, **kwargs):
+        ultimo_error = None
+        for _ in range(len(self.pool.keys)):
+            key = self.pool.elegir()
+            try:
+                return self.pool.cliente(key, **self.params).invoke(entrada, **kwargs)
+            except Exception as e:
+                if not es_rate_limit(e):
+                    raise
+                print(f"⚠️ Key ...{key[-4:]} con rate limit, probando otra")
+                self.pool.registrar_429(key, retry_after_de(e))
+                ultimo_error = e
+            finally:
+                self.pool.liberar(key)
+        raise ultimo_error
+
+
+# ========================
+# 6. Fábrica de clientes Groq
+# ========================
+def crear_cliente_groq(key: str, pool: Optional[KeyPool] = None, **params):
+    """ChatGroq con un hook httpx que reporta las cabeceras de cuota al pool"""
+    import httpx
+    from langchain_groq import ChatGroq
+
+    hooks = {}
+    if pool is not None:
+        # el 429 lo gestiona PooledLLM al recibir la excepción
+        def _hook_respuesta(response):
+            pool.registrar_cabeceras(key, response.headers)
+        hooks = {"response": [_hook_respuesta]}
+
+    return ChatGroq(
+        api_key=key,
+        http_client=httpx.Client(event_hooks=hooks),
+        max_retries=0,  # los reintentos los hace el pool, rotando de key
+        **params,
+    )
+
+
+def _crear_pool() -> KeyPool:
+    if os.getenv("GLY_LLM_PROVIDER", "groq") == "fake":
+        from core.fake_llm import FakeGroqProvider
+        proveedor = FakeGroqProvider.desde_entorno()
+        return KeyPool(proveedor.keys, factory=proveedor.factory)
+    return KeyPool(cargar_keys_groq())
+
+
+# pool compartido por todos los agentes del proceso
+pool = _crear_pool()
@@ -0,0 +1,366 @@
+# core/metrics.py
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# ========================
+# 1. Tipos de métricas (formato de exposición de Prometheus)
+# ========================
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BUCKETS_TOKENS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres: Iterable[str], valores: Iterable, extra: str = "") -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+
+    def _clave(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.etiquetas)
+
+    def exponer(self) -> List[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+
+class Counter(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valores: Dict[tuple, float] = {}
+
+    def inc(self, valor: float = 1.0, **labels):
+        clave = self._clave(labels)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0.0) + valor
+
+    def valor(self, **labels) -> float:
+        return self._valores.get(self._clave(labels), 0.0)
+
+    def exponer(self) -> List[str]:
+        lineas = super().exponer()
+        with self._lock:
+            for clave, valor in sorted(self._valores.items()):
+                lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {valor}")
+        return lineas
+
+
+class Gauge(_Metrica):
+    """Gauge cuyo valor puede fijarse o calcularse al momento del scrape"""
+
+    tipo = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valores: Dict[tuple, float] = {}
+        self._funciones: Dict[tuple, Callable[[], float]] = {}
+
+    def set(self, valor: float, **labels):
+        with self._lock:
+            self._valores[self._clave(labels)] = valor
+
+    def set_funcion(self, funcion: Callable[[], float], **labels):
+        with self._lock:
+            self._funciones[self._clave(labels)] = funcion
+
+    def exponer(self) -> List[str]:
+        lineas = super().exponer()
+        with self._lock:
+            valores = dict(self._valores)
+            funciones = dict(self._funciones)
+        for clave, funcion in funciones.items():
+            try:
+                valores[clave] = float(funcion())
+            except Exception:
+                continue
+        for clave, valor in sorted(valores.items()):
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {valor}")
+        return lineas
+
+
+class Histogram(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (), buckets=BUCKETS_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, valor: float, **labels):
+        clave = self._clave(labels)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                # [conteos por bucket..., suma, total]
+                serie = self._series[clave] = [0] * len(self.buckets) + [0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    @contextmanager
+    def medir(self, **labels):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **labels)
+
+    def conteo(self, **labels) -> int:
+        serie = self._series.get(self._clave(labels))
+        return serie[-1] if serie else 0
+
+    def exponer(self) -> List[str]:
+        lineas = super().exponer()
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        inf = 'le="+Inf"'
+        for clave, serie in sorted(series.items()):
+            for i, limite in enumerate(self.buckets):
+                le = f'le="{limite}"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {serie[i]}")
+            lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, inf)} {serie[-1]}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {serie[-2]}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {serie[-1]}")
+        return lineas
+
+
+# ========================
+# 2. Registro
+# ========================
+class Registro:
+    def __init__(self):
+        self._metricas: Dict[str, _Metrica] = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, metrica: _Metrica) -> _Metrica:
+        with self._lock:
+            existente = self._metricas.get(metrica.nombre)
+            if existente is not None:
+                return existente
+            self._metricas[metrica.nombre] = metrica
+            return metrica
+
+    def counter(self, nombre, ayuda, etiquetas=()) -> Counter:
+        return self._registrar(Counter(nombre, ayuda, etiquetas))
+
+    def gauge(self, nombre, ayuda, etiquetas=()) -> Gauge:
+        return self._registrar(Gauge(nombre, ayuda, etiquetas))
+
+    def histogram(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_LATENCIA) -> Histogram:
+        return self._registrar(Histogram(nombre, ayuda, etiquetas, buckets))
+
+    def exponer(self) -> str:
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            lineas.extend(metrica.exponer())
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ========================
+# 3. Métricas del hot path (etiquetadas por agente: chat, chat1, chat2, auditor, plan)
+# ========================
+http_latencia = registro.histogram(
+    "gly_http_request_duration_seconds", "Latencia de los endpoints HTTP",
+    ("agent", "endpoint", "method", "status"),
+)
+http_errores = registro.counter(
+    "gly_http_errors_total", "Respuestas HTTP con status >= 500",
+    ("agent", "endpoint"),
+)
+llm_latencia = registro.histogram(
+    "gly_llm_request_duration_seconds", "Latencia de las llamadas al LLM",
+    ("agent", "model"),
+)
+llm_ttft = registro.histogram(
+    "gly_llm_time_to_first_token_seconds", "Tiempo hasta el primer token del LLM",
+    ("agent", "model"),
+)
+llm_tokens_prompt = registro.histogram(
+    "gly_llm_prompt_tokens", "Tokens de prompt por llamada",
+    ("agent", "model"), buckets=BUCKETS_TOKENS,
+)
+llm_tokens_completion = registro.histogram(
+    "gly_llm_completion_tokens", "Tokens de completion por llamada",
+    ("agent", "model"), buckets=BUCKETS_TOKENS,
+)
+llm_errores = registro.counter(
+    "gly_llm_errors_total", "Llamadas al LLM que terminaron en error",
+    ("agent", "model"),
+)
+fallbacks = registro.counter(
+    "gly_llm_fallback_total", "Activaciones del LLM de respaldo (Hugging Face)",
+    ("agent",),
+)
+persistencia_latencia = registro.histogram(
+    "gly_persistence_duration_seconds", "Tiempo de guardar_conversacion",
+    ("agent",),
+)
+memoria_sesiones = registro.gauge(
+    "gly_memory_store_sessions", "Sesiones (user_id) en memoria",
+    ("agent",),
+)
+memoria_mensajes = registro.gauge(
+    "gly_memory_store_messages", "Mensajes totales guardados en memoria",
+    ("agent",),
+)
+
+
+cascada_decisiones = registro.counter(
+    "gly_cascade_decisions_total", "Decisiones de ruteo de la cascada de modelos",
+    ("agent", "route", "reason"),
+)
+cascada_complejidad = registro.histogram(
+    "gly_cascade_complexity_score", "Puntaje del clasificador de complejidad",
+    ("agent",), buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+
+
+presupuesto_respuestas = registro.counter(
+    "gly_budget_responses_total",
+    "Respuestas por resultado del presupuesto (dentro, cortado_en_oracion, recortado)",
+    ("agent", "outcome"),
+)
+presupuesto_palabras = registro.histogram(
+    "gly_budget_response_words", "Palabras por respuesta tras aplicar el presupuesto",
+    ("agent",), buckets=(20, 40, 60, 80, 100, 120, 140, 180, 250, 400),
+)
+
+
+auditoria_secciones = registro.counter(
+    "gly_audit_sections_total", "Apartados de auditoría/plan por resultado (generado, reutilizado)",
+    ("agent", "result"),
+)
+
+
+admision_rechazos = registro.counter(
+    "gly_admission_rejected_total", "Requests rechazados por el control de admisión",
+    ("group", "reason"),
+)
+admision_espera = registro.histogram(
+    "gly_admission_wait_seconds", "Espera en la cola de admisión de los requests admitidos",
+    ("group",),
+)
+admision_en_curso = registro.gauge(
+    "gly_admission_in_flight", "Requests en curso por grupo de admisión",
+    ("group",),
+)
+
+
+turno_espera = registro.histogram(
+    "gly_turn_lock_wait_seconds", "Espera por el turno anterior de la misma sesión",
+    ("agent",),
+)
+
+
+idempotencia = registro.counter(
+    "gly_idempotency_requests_total",
+    "POST con Idempotency-Key por resultado (nueva, en_curso, repetida)",
+    ("result",),
+)
+
+
+local_lote = registro.histogram(
+    "gly_local_batch_size", "Secuencias decodificadas juntas por paso en el modelo local",
+    (), buckets=(1, 2, 4, 8, 16, 32),
+)
+local_espera = registro.histogram(
+    "gly_local_queue_wait_seconds", "Espera hasta entrar al lote del modelo local",
+)
+local_pendientes = registro.gauge(
+    "gly_local_queue_pending", "Peticiones esperando lugar en el lote del modelo local",
+)
+local_procesos = registro.gauge(
+    "gly_local_workers", "Procesos de inferencia local vivos",
+)
+local_reinicios = registro.counter(
+    "gly_local_worker_restarts_total", "Procesos de inferencia local reemplazados por motivo",
+    ("reason",),
+)
+
+
+instantanea_duracion = registro.histogram(
+    "gly_snapshot_write_seconds", "Duración de cada instantánea de sesiones",
+)
+instantanea_sesiones = registro.gauge(
+    "gly_snapshot_sessions", "Sesiones en la última instantánea escrita",
+)
+sesiones_restauradas = registro.counter(
+    "gly_sessions_restored_total", "Sesiones recuperadas de la instantánea al volver el usuario",
+    ("agent",),
+)
+
+
+transcripcion_bytes = registro.histogram(
+    "gly_transcript_member_read_bytes", "Bytes comprimidos leídos por miembro de segmento de transcripción",
+    (), buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576),
+)
+transcripcion_segmentos = registro.counter(
+    "gly_transcript_segments_total", "Segmentos de transcripción cerrados y compactados",
+    ("event",),
+)
+transcripcion_compactacion = registro.histogram(
+    "gly_transcript_compaction_seconds", "Duración de la compactación de una transcripción",
+)
+
+
+tokens_consumidos = registro.counter(
+    "gly_llm_tokens_total", "Tokens consumidos en Groq por agente, modelo y tipo (prompt, completion)",
+    ("agent", "model", "kind"),
+)
+cuota_rechazos = registro.counter(
+    "gly_quota_rejected_total", "Llamadas al LLM rechazadas por cuota diaria de tokens agotada",
+    ("agent",),
+)
+
+
+borradores = registro.counter(
+    "gly_drafts_total",
+    "Borradores de auditoría/plan por resultado (redactado, entregado, invalidado, postergado, cancelado, ...)",
+    ("agent", "result"),
+)
+borrador_duracion = registro.histogram(
+    "gly_draft_seconds", "Duración de la redacción de un borrador en segundo plano",
+    ("agent",),
+)
+
+
+def uso_tokens(respuesta) -> Tuple[int, int]:
+    """(prompt_tokens, completion_tokens) de un AIMessage de langchain"""
+    uso = getattr(respuesta, "usage_metadata", None) or {}
+    if uso:
+        return int(uso.get("input_tokens", 0)), int(uso.get("output_tokens", 0))
+    meta = (getattr(respuesta, "response_metadata", None) or {}).get("token_usage", {}) or {}
+    return int(meta.get("prompt_tokens", 0)), int(meta.get("completion_tokens", 0))
+
+
+def registrar_memoria(agente: str, usuarios):
+    """Expone el tamaño del AlmacenSesiones de un agente en cada scrape"""
+    memoria_sesiones.set_funcion(lambda: len(usuarios), agent=agente)
+    memoria_mensajes.set_funcion(
+        lambda: sum(len(m.chat_memory.messages) for m in usuarios.memorias()),
+        agent=agente,
+    )
@@ -0,0 +1,360 @@
+# core/personas.py
+import os
+import glob
+import json
+import string
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, TypedDict
+
+from langchain.memory import ConversationBufferMemory
+from langchain.prompts import PromptTemplate
+
+from core import borradores, consumo, emision, inferencia_local, metrics, tracing
+from core.cascada import MODELO_GRANDE, MODELO_PEQUENO, Cascada
+from core.instantaneas import instantaneas
+from core.key_pool import pool
+from core.presupuesto import Presupuesto
+from core.recuperacion import IndiceBM25, TOKENS_CHAT, componer_historial, recuperacion_activa
+from core.serializacion import delta_turno
+from core.sesiones import AlmacenSesiones
+from core.transcripciones import Transcripcion, transcripcion
+from core.turnos import turnos
+
+# ========================
+# 1. Configuración
+# ========================
+# GLY_PERSONAS_DIR: carpeta con personas declaradas en JSON (una por archivo).
+#   Se recargan sin reiniciar cuando cambia un archivo; una persona del
+#   directorio con el nombre de una de código (chat, chat1, chat2) la reemplaza.
+# GLY_PERSONAS_REVISION_S: cada cuánto se revisa la carpeta como máximo.
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRECTORIO = os.getenv("GLY_PERSONAS_DIR", os.path.join(RAIZ, "personas"))
+REVISION = float(os.getenv("GLY_PERSONAS_REVISION_S", "2"))
+
+
+class State(TypedDict):
+    mensaje: str
+    rol: str
+    historial: str
+    respuesta: str
+    user_id: str
+    delta: dict  # último intercambio y versión, leídos con el turno aún tomado
+
+
+# ========================
+# 2. Declaración de una persona
+# ========================
+class Persona:
+    """
+    Lo que distingue a un agente de chat de otro. El resto del turno
+    (memoria, recuperación, cascada, presupuesto, persistencia, métricas)
+    es el mismo código para todos.
+
+    - modelo / modelo_grande: los dos escalones de la cascada; `por_defecto`
+      es el que se usa con la cascada apagada ("pequeno" o "grande").
+    - ventana: intercambios recientes que ve el prompt; `recorte_lineas`
+      recorta el historial a esas líneas (0 = sin recorte salvo con recuperación).
+    - palabras: presupuesto de salida; por defecto el límite que declara el prompt.
+    - archivo: transcripción donde se guardan los intercambios (ver
+      core/transcripciones.py; el nombre es el del antiguo JSON temporal).
+      Varias personas pueden compartirla, p. ej. chat y chat1 para la auditoría.
+    - fallback_local: ante un error de Groq responde con el modelo local.
+    """
+
+    CAMPOS = ("nombre", "prompt", "modelo", "modelo_grande", "por_defecto", "temperatura", "ventana",
+              "recorte_lineas", "palabras", "archivo", "fallback_local", "rol")
+
+    def __init__(self, nombre: str, prompt: str, modelo: str = MODELO_PEQUENO, modelo_grande: str = MODELO_GRANDE,
+                 por_defecto: str = "pequeno", temperatura: float = 0.4, ventana: int = 2, recorte_lineas: int = 0,
+                 palabras: Optional[int] = None, archivo: str = "conversacion_temp.json",
+                 fallback_local: bool = False, rol: str = "auditor"):
+        if not nombre or not str(nombre).replace("_", "").replace("-", "").isalnum():
+            raise ValueError(f"nombre de persona inválido: {nombre!r}")
+        if por_defecto not in ("pequeno", "grande"):
+            raise ValueError("por_defecto debe ser 'pequeno' o 'grande'")
+        self.nombre = nombre
+        self.prompt = prompt.strip()
+        self.modelo = modelo
+        self.modelo_grande = modelo_grande
+        self.por_defecto = por_defecto
+        self.temperatura = float(temperatura)
+        self.ventana = int(ventana)
+        self.recorte_lineas = int(recorte_lineas)
+        self.palabras = palabras
+        self.archivo = archivo
+        self.fallback_local = bool(fallback_local)
+        self.rol = rol
+        self.variables = sorted({campo for _, campo, _, _ in string.Formatter().parse(self.prompt) if campo})
+        desconocidas = set(self.variables) - {"rol", "mensaje", "historial", "fecha"}
+        if desconocidas:
+            raise ValueError(f"variables desconocidas en el prompt: {sorted(desconocidas)}")
+
+    @classmethod
+    def desde_dict(cls, datos: dict) -> "Persona":
+        desconocidos = set(datos) - set(cls.CAMPOS)
+        if desconocidos:
+            raise ValueError(f"campos desconocidos: {sorted(desconocidos)}")
+        datos = dict(datos)
+        # en JSON el prompt puede escribirse como lista de líneas
+        if isinstance(datos.get("prompt"), list):
+            datos["prompt"] = "\n".join(datos["prompt"])
+        return cls(**datos)
+
+    def a_dict(self) -> dict:
+        return {campo: getattr(self, campo) for campo in self.CAMPOS if campo != "prompt"}
+
+
+# ========================
+# 3. Agente: el turno de una persona
+# ========================
+class Agente:
+    """
+    Una persona ya construida: prompt compilado, LLMs del pool compartido,
+    presupuesto y cascada. La memoria y el índice de recuperación viven en
+    el motor, así que reconstruir el agente (recarga en caliente) no pierde
+    las sesiones abiertas.
+    """
+
+    def __init__(self, persona: Persona, usuarios: AlmacenSesiones, indices: AlmacenSesiones,
+                 persistencia: Transcripcion):
+        self.persona = persona
+        self.nombre = persona.nombre
+        self.usuarios = usuarios
+        self.indices = indices
+        self.persistencia = persistencia
+        self.prompt = PromptTemplate(input_variables=persona.variables, template=persona.prompt)
+        self.presupuesto = Presupuesto(self.nombre, persona.prompt, persona.palabras)
+        pequeno = pool.llm(agente=self.nombre, model=persona.modelo, temperature=persona.temperatura)
+        grande = pool.llm(agente=self.nombre, model=persona.modelo_grande, temperature=persona.temperatura)
+        self.cascada = Cascada(
+            self.nombre,
+            pequeno=self.presupuesto.envolver(pequeno),
+            grande=self.presupuesto.envolver(grande),
+            por_defecto=persona.por_defecto,
+        )
+
+    def _fallback(self, texto_prompt: str) -> str:
+        try:
+            return inferencia_local.generar(texto_prompt, max_nuevos=150)
+        except Exception as e:
+            print("❌ Error fallback Hugging Face:", e)
+            return "Lo siento, no pude generar la respuesta."
+
+    def _turno(self, state: State) -> State:
+        persona = self.persona
+        uid = state.get("user_id", "default")
+        memory = self.usuarios.obtener(uid)
+        with tracing.span("memoria.cargar"):
+            historial = memory.load_memory_variables({}).get("historial", "")
+
+        with tracing.span("prompt.formatear"):
+            recuperacion = recuperacion_activa(self.nombre)
+            # con recuperación el prompt ve una ventana fija y los turnos viejos llegan por BM25
+            max_lineas = 2 * persona.ventana if recuperacion else persona.recorte_lineas
+            if historial and max_lineas:
+                lineas = historial.strip().split("\n")
+                if len(lineas) > max_lineas:  # cada intercambio ≈ 2 líneas
+                    historial = "\n".join(lineas[-max_lineas:])
+
+            historial_prompt = historial
+            if recuperacion:
+                with tracing.span("recuperacion") as s:
+                    indice = self.indices.obtener(uid)
+                    docs = indice.seleccionar(state["mensaje"], TOKENS_CHAT, excluir_ultimos=persona.ventana)
+                    historial_prompt = componer_historial(indice.texto(docs), historial)
+                    s.set(recuperados=len(docs))
+
+            valores = {"rol": state["rol"], "mensaje": state["mensaje"], "historial": historial_prompt}
+            if "fecha" in persona.variables:
+                valores["fecha"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            texto_prompt = self.prompt.format(**{v: valores[v] for v in persona.variables})
+
+        with tracing.span("llm", agent=self.nombre) as s:
+            try:
+                respuesta = self.cascada.invoke(texto_prompt, mensaje=state["mensaje"], historial=historial).content
+            except Exception as e:
+                if not persona.fallback_local:
+                    raise
+                print("❌ Error en Groq LLM:", e)
+                metrics.fallbacks.inc(agent=self.nombre)
+                s.set(fallback=True)
+                emision.reiniciar()
+                respuesta = self._fallback(texto_prompt)
+
+        # guardar en memoria
+        with tracing.span("memoria.guardar"):
+            memory.save_context({"mensaje": state["mensaje"]}, {"respuesta": respuesta})
+            if recuperacion:
+                self.indices.obtener(uid).agregar(state["mensaje"], respuesta)
+
+        # guardar en la transcripción para los auditores
+        with tracing.span("persistencia"), metrics.persistencia_latencia.medir(agent=self.nombre):
+            self.persistencia.guardar(state["mensaje"], respuesta, state.get("user_id"))
+
+        state["respuesta"] = respuesta
+        state["historial"] = historial
+        # dentro del turno: otro turno de la misma sesión no puede colarse en el delta
+        state["delta"] = delta_turno(memory)
+        return state
+
+    def turno(self, state: State) -> State:
+        # un turno a la vez por sesión (memoria + transcripción); usuarios distintos corren en paralelo
+        # la cuota se revisa antes de esperar el turno: un usuario sin cuota no hace cola
+        # un turno nuevo cancela el borrador de auditoría/plan del usuario; al terminar
+        # se reprograma para cuando la sesión vuelva a quedar inactiva
+        borradores.actividad(self.persona.archivo, state.get("user_id"))
+        try:
+            with consumo.usuario(state.get("user_id"), agente=self.nombre), \
+                    turnos.turno((self.nombre, state.get("user_id", "default")), agente=self.nombre):
+                return self._turno(state)
+        finally:
+            borradores.actividad(self.persona.archivo, state.get("user_id"))
+
+
+# ========================
+# 4. Motor de personas
+# ========================
+def _nueva_memoria():
+    return ConversationBufferMemory(
+        memory_key="historial",
+        input_key="mensaje",
+        output_key="respuesta",
+    )
+
+
+class MotorPersonas:
+    """
+    Registro de agentes por nombre. Las personas de código (agent/chat.py,
+    agent/chat1.py, agent2/chat.py) se registran al importar su módulo; las
+    del directorio se cargan y recargan al cambiar su archivo, revisado a lo
+    sumo cada `revision` segundos al pedir un agente. Un archivo inválido se
+    informa y se conserva la versión anterior; si se borra, la persona vuelve
+    a su definición de código o desaparece.
+    """
+
+    def __init__(self, directorio: str = DIRECTORIO, revision: float = REVISION):
+        self.directorio = directorio
+        self.revision = revision
+        self._lock = threading.RLock()
+        self._agentes: Dict[str, Agente] = {}
+        self._de_codigo: Dict[str, Persona] = {}
+        self._archivos: Dict[str, tuple] = {}  # ruta -> (mtime, nombre)
+        self._usuarios: Dict[str, AlmacenSesiones] = {}
+        self._indices: Dict[str, AlmacenSesiones] = {}
+        self._revisado = 0.0
+
+    # --- almacenes compartidos ---
+    def usuarios(self, nombre: str) -> AlmacenSesiones:
+        with self._lock:
+            almacen = self._usuarios.get(nombre)
+            if almacen is None:
+                almacen = self._usuarios[nombre] = AlmacenSesiones(_nueva_memoria)
+                metrics.registrar_memoria(nombre, almacen)
+                instantaneas.registrar(nombre, almacen)
+            return almacen
+
+    def indices(self, nombre: str) -> AlmacenSesiones:
+        # índice BM25 de todos los turnos del usuario (GLY_RECUPERACION), mismo ciclo de vida que la memoria
+        with self._lock:
+            almacen = self._indices.get(nombre)
+            if almacen is None:
+                almacen = self._indices[nombre] = AlmacenSesiones(IndiceBM25)
+                instantaneas.registrar_indices(nombre, almacen, IndiceBM25.desde)
+            return almacen
+
+    def persistencia(self, archivo: str) -> Transcripcion:
+        # personas con el mismo `archivo` comparten transcripción (y auditor)
+        return transcripcion(archivo)
+
+    # --- registro ---
+    def _construir(self, persona: Persona) -> Agente:
+        return Agente(
+            persona,
+            self.usuarios(persona.nombre),
+            self.indices(persona.nombre),
+            self.persistencia(persona.archivo),
+        )
+
+    def registrar(self, persona: Persona) -> Agente:
+        """Persona declarada en código; una del directorio con el mismo nombre tiene prioridad"""
+        with self._lock:
+            self._de_codigo[persona.nombre] = persona
+            sobrescrita = any(nombre == persona.nombre for _, nombre in self._archivos.values())
+            if not sobrescrita:
+                self._agentes[persona.nombre] = self._construir(persona)
+            return self._agentes[persona.nombre]
+
+    def obtener(self, nombre: str) -> Agente:
+        self.revisar()
+        with self._lock:
+            agente = self._agentes.get(nombre)
+        if agente is None:
+            raise KeyError(nombre)
+        return agente
+
+    def existe(self, nombre: str) -> bool:
+        with self._lock:
+            return nombre in self._agentes
+
+    def describir(self) -> List[dict]:
+        self.revisar()
+        with self._lock:
+            origen = {nombre: ruta for ruta, (_, nombre) in self._archivos.items()}
+            return [
+                dict(agente.persona.a_dict(), origen=origen.get(nombre, "codigo"))
+                for nombre, agente in sorted(self._agentes.items())
+            ]
+
+    # --- recarga en caliente ---
+    def revisar(self, forzar: bool = False) -> List[str]:
+        """Aplica los cambios del directorio; devuelve las personas cargadas, recargadas o quitadas"""
+        ahora = time.monotonic()
+        if not forzar and ahora - self._revisado < self.revision:
+            return []
+        with self._lock:
+            self._revisado = ahora
+            cambios = []
+            rutas = set(glob.glob(os.path.join(self.directorio, "*.json")))
+            for ruta in sorted(rutas):
+                try:
+                    mtime = os.path.getmtime(ruta)
+                except OSError:
+                    continue
+                previo = self._archivos.get(ruta)
+                if previo is not None and previo[0] == mtime:
+                    continue
+                try:
+                    with open(ruta, "r", encoding="utf-8") as f:
+                        persona = Persona.desde_dict(json.load(f))
+                    agente = self._construir(persona)
+                except Exception as e:
+                    print(f"❌ Persona inválida en {ruta}: {e}")
+                    # se marca como vista para no reintentar en cada request hasta que cambie
+                    self._archivos[ruta] = (mtime, previo[1] if previo else None)
+                    continue
+                if previo is not None and previo[1] not in (None, persona.nombre):
+                    self._quitar(previo[1])
+                self._archivos[ruta] = (mtime, persona.nombre)
+                self._agentes[persona.nombre] = agente
+                cambios.append(persona.nombre)
+                print(f"✅ Persona '{persona.nombre}' cargada desde {os.path.basename(ruta)}")
+
+            for ruta in set(self._archivos) - rutas:
+                _, nombre = self._archivos.pop(ruta)
+                if nombre is not None:
+                    self._quitar(nombre)
+                    cambios.append(nombre)
+            return cambios
+
+    def _quitar(self, nombre: str):
+        """La persona de un archivo borrado vuelve a su versión de código, si la hay"""
+        base = self._de_codigo.get(nombre)
+        if base is not None:
+            self._agentes[nombre] = self._construir(base)
+        else:
+            self._agentes.pop(nombre, None)
+
+
+motor = MotorPersonas()
@@ -0,0 +1,125 @@
+# core/presupuesto.py
+import re
+from typing import Optional
+
+from core import emision, metrics, tracing
+
+# ========================
+# 1. Límite de palabras declarado en el prompt
+# ========================
+# "Respuesta máxima: 100 palabras", "maximo de 140 palabras", "Máx. 80 palabras por turno"
+_LIMITE_RE = re.compile(r"m[aá]x(?:im[oa])?\.?\s*(?:de|:)?\s*(\d+)\s*palabras", re.I)
+
+# tokens por palabra en español para los modelos Llama (estimación conservadora)
+TOKENS_POR_PALABRA = 1.6
+# margen para que el corte lo haga el fin de oración y no max_tokens
+HOLGURA = 1.3
+
+_FIN_ORACION = re.compile(r"[.!?…][\"'»)\]]*\s*$")
+_ULTIMO_FIN = re.compile(r"[.!?…][\"'»)\]]*(?=\s|$)")
+
+
+def limite_palabras(prompt: str) -> Optional[int]:
+    """Primer límite de palabras que aparece en el texto del prompt"""
+    encontrado = _LIMITE_RE.search(prompt or "")
+    return int(encontrado.group(1)) if encontrado else None
+
+
+def max_tokens_para(palabras: int) -> int:
+    return int(palabras * TOKENS_POR_PALABRA * HOLGURA)
+
+
+def recortar_a_oracion(texto: str) -> str:
+    """Recorta hasta el último fin de oración, si deja al menos la mitad del texto"""
+    fines = list(_ULTIMO_FIN.finditer(texto))
+    if not fines:
+        return texto
+    corte = fines[-1].end()
+    if corte < len(texto) * 0.5:
+        return texto
+    return texto[:corte].rstrip()
+
+
+# ========================
+# 2. Controlador de presupuesto por agente
+# ========================
+class _Mensaje:
+    """Resultado con la misma forma que el AIMessage de langchain (.content)"""
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class Presupuesto:
+    """
+    Fija max_tokens a partir del límite de palabras del prompt del agente y
+    genera por streaming: una vez superado el límite, corta en el siguiente
+    fin de oración en lugar de esperar (y pagar) tokens que se descartarían.
+    Si aun así el modelo llega a max_tokens a mitad de frase, la respuesta
+    se recorta hasta la última oración completa.
+    """
+
+    def __init__(self, agente: str, prompt: str, palabras: Optional[int] = None):
+        self.agente = agente
+        self.palabras = palabras or limite_palabras(prompt)
+        self.max_tokens = max_tokens_para(self.palabras) if self.palabras else None
+
+    def envolver(self, llm) -> "LLMConPresupuesto":
+        return LLMConPresupuesto(self, llm)
+
+
+class LLMConPresupuesto:
+    """LLM con interfaz .invoke() que aplica el Presupuesto del agente"""
+
+    def __init__(self, presupuesto: Presupuesto, llm):
+        self.presupuesto = presupuesto
+        self.llm = llm
+        self.model_name = getattr(llm, "model_name", None)
+
+    def invoke(self, entrada, **kwargs):
+        p = self.presupuesto
+        if not p.palabras:
+            return self.llm.invoke(entrada, **kwargs)
+
+        kwargs.setdefault("max_tokens", p.max_tokens)
+        partes = []
+        # conteo incremental: palabras ya vistas, si el último chunk quedó a mitad de
+        # palabra y la cola del texto (basta para ver un fin de oración)
+        palabras = 0
+        a_medias = False
+        cola = ""
+        resultado = "dentro"
+        with tracing.span("presupuesto", palabras_max=p.palabras, max_tokens=p.max_tokens) as s:
+            chunks = self.llm.stream(entrada, **kwargs)
+            try:
+                for chunk in chunks:
+                    fragmento = getattr(chunk, "content", "") or ""
+                    if not fragmento:
+                        continue
+                    partes.append(fragmento)
+                    emision.emitir(fragmento)
+                    # Groq emite subpalabras: un chunk que sigue a otro sin espacio continúa su palabra
+                    n = len(fragmento.split())
+                    if n and a_medias and not fragmento[0].isspace():
+                        n -= 1
+                    palabras += n
+                    a_medias = not fragmento[-1].isspace()
+                    cola = (cola + fragmento)[-16:]
+                    if palabras >= p.palabras and _FIN_ORACION.search(cola):
+                        resultado = "cortado_en_oracion"
+                        break
+            finally:
+                cerrar = getattr(chunks, "close", None)
+                if cerrar is not None:
+                    cerrar()
+
+            texto = "".join(partes).strip()
+            if resultado == "dentro" and texto and not _FIN_ORACION.search(texto):
+                # terminó por max_tokens a mitad de frase
+                texto = recortar_a_oracion(texto)
+                resultado = "recortado"
+            s.set(resultado=resultado, palabras=len(texto.split()))
+
+        metrics.presupuesto_respuestas.inc(agent=p.agente, outcome=resultado)
+        metrics.presupuesto_palabras.observe(len(texto.split()), agent=p.agente)
+        return _Mensaje(texto)
@@ -0,0 +1,184 @@
+# core/recuperacion.py
+import os
+import re
+import math
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.presupuesto import TOKENS_POR_PALABRA
+
+# ========================
+# 1. Configuración
+# ========================
+# GLY_RECUPERACION: agentes que arman el contexto con el índice local, separados
+# por comas ("chat,chat1,chat2,auditor,plan") o "all".
+# GLY_RECUPERACION_TOKENS: presupuesto de tokens de turnos anteriores en los chats.
+# GLY_RECUPERACION_TOKENS_DOCUMENTO: presupuesto de historial por apartado en auditor/plan.
+TOKENS_CHAT = int(os.getenv("GLY_RECUPERACION_TOKENS", "300"))
+TOKENS_DOCUMENTO = int(os.getenv("GLY_RECUPERACION_TOKENS_DOCUMENTO", "2500"))
+
+
+def recuperacion_activa(agente: str) -> bool:
+    valor = os.getenv("GLY_RECUPERACION", "").strip().lower()
+    if valor in ("all", "1", "true", "todos"):
+        return True
+    return agente in {a.strip() for a in valor.split(",") if a.strip()}
+
+
+# ========================
+# 2. Tokenizador
+# ========================
+_PALABRA = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun bien cada como con contra cual cuales
+cuando de del desde donde dos el ella ellas ello ellos en entre era eran es esa esas ese eso esos esta estaba
+estan estar estas este esto estos fue fueron ha hay hace hacer han has hasta la las le les lo los mas me mi mis
+mucho muy nada ni no nos nosotros o os otra otro para pero poco por porque que quien se sea ser si sin sobre
+solo son su sus tambien te tener tengo ti tiene tienen todo todos tu tus un una unas uno unos usted ustedes
+ya yo
+""".split())
+
+
+def _normalizar(texto: str) -> str:
+    """Minúsculas y sin tildes ("facturación" -> "facturacion")"""
+    descompuesto = unicodedata.normalize("NFKD", (texto or "").lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def terminos(texto: str) -> List[str]:
+    """Términos indexables: sin stopwords y con un recorte simple de plurales"""
+    resultado = []
+    for palabra in _PALABRA.findall(_normalizar(texto)):
+        if len(palabra) < 2 or palabra in STOPWORDS:
+            continue
+        if len(palabra) > 4 and palabra.endswith("es"):
+            palabra = palabra[:-2]
+        elif len(palabra) > 3 and palabra.endswith("s"):
+            palabra = palabra[:-1]
+        resultado.append(palabra)
+    return resultado
+
+
+def estimar_tokens(texto: str) -> int:
+    return int(len((texto or "").split()) * TOKENS_POR_PALABRA) + 1
+
+
+# ========================
+# 3. Índice BM25 de intercambios
+# ========================
+class IndiceBM25:
+    """
+    Índice invertido en memoria sobre los intercambios de un usuario.
+    Agregar un intercambio cuesta O(términos del intercambio) y buscar solo
+    recorre las listas de los términos de la consulta.
+    """
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._largos: List[int] = []
+        self._intercambios: List[Tuple[str, str]] = []
+        self._total = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde(cls, conversacion: Iterable[dict]) -> "IndiceBM25":
+        indice = cls()
+        for intercambio in conversacion:
+            indice.agregar(intercambio.get("user", ""), intercambio.get("ai", ""))
+        return indice
+
+    def agregar(self, usuario: str, ai: str) -> int:
+        tokens = terminos(f"{usuario} {ai}")
+        with self._lock:
+            doc = len(self._intercambios)
+            self._intercambios.append((usuario, ai))
+            self._largos.append(len(tokens))
+            self._total += len(tokens)
+            for termino in tokens:
+                lista = self._postings.setdefault(termino, {})
+                lista[doc] = lista.get(doc, 0) + 1
+            return doc
+
+    def __len__(self) -> int:
+        return len(self._intercambios)
+
+    def buscar(self, consulta: str, candidatos: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """(índice, puntaje) ordenado de mayor a menor"""
+        permitidos = set(candidatos) if candidatos is not None else None
+        with self._lock:
+            n = len(self._intercambios)
+            if not n:
+                return []
+            promedio = (self._total / n) or 1.0
+            puntajes: Dict[int, float] = {}
+            for termino in set(terminos(consulta)):
+                lista = self._postings.get(termino)
+                if not lista:
+                    continue
+                idf = math.log(1 + (n - len(lista) + 0.5) / (len(lista) + 0.5))
+                for doc, tf in lista.items():
+                    if permitidos is not None and doc not in permitidos:
+                        continue
+                    norma = tf + self.K1 * (1 - self.B + self.B * self._largos[doc] / promedio)
+                    puntajes[doc] = puntajes.get(doc, 0.0) + idf * tf * (self.K1 + 1) / norma
+        return sorted(puntajes.items(), key=lambda p: (-p[1], -p[0]))
+
+    def costo(self, doc: int) -> int:
+        usuario, ai = self._intercambios[doc]
+        return estimar_tokens(usuario) + estimar_tokens(ai)
+
+    def seleccionar(self, consulta: str, presupuesto_tokens: int,
+                    candidatos: Optional[Iterable[int]] = None, excluir_ultimos: int = 0,
+                    rellenar: bool = False) -> List[int]:
+        """
+        Intercambios más relevantes para la consulta que caben en el presupuesto,
+        en orden cronológico. `excluir_ultimos` deja fuera los turnos que ya
+        trae la memoria de ventana del agente; con `rellenar` el presupuesto
+        sobrante se completa con los turnos más recientes.
+        """
+        limite = len(self._intercambios) - excluir_ultimos
+        if candidatos is None:
+            candidatos = range(max(0, limite))
+        else:
+            candidatos = [c for c in candidatos if c < limite]
+        elegidos, usados = [], 0
+        for doc, _ in self.buscar(consulta, candidatos):
+            costo = self.costo(doc)
+            if usados + costo > presupuesto_tokens:
+                continue
+            elegidos.append(doc)
+            usados += costo
+        if rellenar:
+            tomados = set(elegidos)
+            for doc in sorted(candidatos, reverse=True):
+                if doc in tomados:
+                    continue
+                costo = self.costo(doc)
+                if usados + costo > presupuesto_tokens:
+                    break
+                elegidos.append(doc)
+                usados += costo
+        return sorted(elegidos)
+
+    def texto(self, docs: Iterable[int]) -> str:
+        """Mismo formato que ConversationBufferMemory (Human:/AI:)"""
+        lineas = []
+        for doc in docs:
+            usuario, ai = self._intercambios[doc]
+            lineas.append(f"Human: {usuario}\nAI: {ai}")
+        return "\n".join(lineas)
+
+
+# ========================
+# 4. Contexto para los agentes de chat
+# ========================
+def componer_historial(relevantes: str, historial: str) -> str:
+    """Antepone los turnos anteriores recuperados a la ventana de memoria"""
+    if not relevantes:
+        return historial
+    return f"[Turnos anteriores relevantes]\n{relevantes}\n[Turnos recientes]\n{historial}"
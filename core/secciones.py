@@ -0,0 +1,148 @@
+# core/secciones.py
+import os
+import re
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from core import metrics, tracing
+from core.auditorias import SeccionAuditada, VersionAuditoria, huella, rangos
+from core.recuperacion import IndiceBM25, TOKENS_DOCUMENTO, recuperacion_activa
+
+# ========================
+# 1. Configuración
+# ========================
+# GLY_DOCUMENTO_MODO: "secciones" genera auditoría/plan por apartados en paralelo,
+# "completo" (por defecto) mantiene una sola generación secuencial.
+# GLY_SECCIONES_CONCURRENCIA: máximo de apartados generándose a la vez por documento.
+CONCURRENCIA = int(os.getenv("GLY_SECCIONES_CONCURRENCIA", "9"))
+
+
+def modo_secciones() -> bool:
+    return os.getenv("GLY_DOCUMENTO_MODO", "completo").strip().lower() == "secciones"
+
+
+# ========================
+# 2. Generador de documentos por secciones
+# ========================
+class DocumentoPorSecciones:
+    """
+    Genera cada apartado de un documento en paralelo con un mismo contexto
+    pre-calculado (historial + fecha). El prompt de cada apartado comparte
+    el prefijo y solo cambia al final, en la instrucción del apartado.
+    Los apartados se ensamblan en orden; en streaming se emite cada uno en
+    cuanto él y todos los anteriores están listos.
+
+    Con la conversación y la versión previa del usuario (re-auditoría), cada
+    apartado se alimenta solo de los intercambios que le corresponden según
+    `dependencias` (regex sobre el mensaje del usuario; sin entrada = todos)
+    y se reutiliza tal cual si la huella de esos intercambios no cambió.
+    Con GLY_RECUPERACION activa para el agente, esos intercambios se acotan
+    además a los más relevantes para el apartado según un índice BM25,
+    dentro de un presupuesto fijo de tokens.
+    """
+
+    def __init__(self, agente: str, llm, plantilla, secciones: List[Tuple[str, str]],
+                 fallback: Optional[Callable[[str], str]] = None,
+                 dependencias: Optional[Dict[str, str]] = None,
+                 formatear: Optional[Callable[[list], str]] = None):
+        self.agente = agente
+        self.llm = llm
+        self.plantilla = plantilla
+        self.secciones = secciones
+        self.fallback = fallback
+        self.dependencias = {t: re.compile(r, re.I) for t, r in (dependencias or {}).items()}
+        self.formatear = formatear
+
+    def _indice(self) -> str:
+        return "\n".join(f"{i}. {titulo}" for i, (titulo, _) in enumerate(self.secciones, start=1))
+
+    def _entradas(self, titulo: str, conversacion: list) -> List[int]:
+        """Índices de los intercambios que alimentan el apartado"""
+        patron = self.dependencias.get(titulo)
+        todos = list(range(len(conversacion)))
+        if patron is None:
+            return todos
+        indices = [i for i in todos if patron.search(conversacion[i].get("user", "") or "")]
+        # sin coincidencias el apartado se redacta con todo el historial
+        return indices or todos
+
+    def _generar_seccion(self, numero: int, titulo: str, instruccion: str, contexto: dict) -> Tuple[str, bool]:
+        """(texto, ok): ok=False si se usó el fallback, para no reutilizarlo luego"""
+        texto_prompt = self.plantilla.format(
+            indice=self._indice(),
+            numero=numero,
+            titulo=titulo,
+            instruccion=instruccion,
+            **contexto,
+        )
+        with tracing.span("seccion", numero=numero, titulo=titulo) as s:
+            try:
+                respuesta = self.llm.invoke(texto_prompt)
+                return (respuesta.content if hasattr(respuesta, "content") else str(respuesta)).strip(), True
+            except Exception as e:
+                print(f"❌ Error en Groq LLM (apartado {numero}):", e)
+                if self.fallback is None:
+                    raise
+                metrics.fallbacks.inc(agent=self.agente)
+                s.set(fallback=True)
+                return self.fallback(texto_prompt).strip(), False
+
+    def _plan(self, contexto: dict, conversacion: Optional[list], previa: Optional[VersionAuditoria]):
+        """Por apartado: (contexto propio, rangos, huella, texto reutilizable o None)"""
+        plan = []
+        indice = None
+        if conversacion is not None and recuperacion_activa(self.agente):
+            indice = IndiceBM25.desde(conversacion)
+        for numero, (titulo, instruccion) in enumerate(self.secciones, start=1):
+            if conversacion is None:
+                plan.append((contexto, [], "", None))
+                continue
+            indices = self._entradas(titulo, conversacion)
+            if indice is not None:
+                indices = indice.seleccionar(f"{titulo} {instruccion}", TOKENS_DOCUMENTO, candidatos=indices, rellenar=True)
+            extra = contexto.get("fecha", "") if "fecha" in instruccion.lower() else ""
+            firma = huella(conversacion, indices, extra)
+            propio = contexto
+            if len(indices) < len(conversacion) and self.formatear is not None:
+                propio = dict(contexto, historial=self.formatear([conversacion[i] for i in indices]))
+            anterior = previa.seccion(numero) if previa is not None and previa.modo == "secciones" else None
+            reutilizable = anterior.texto if anterior is not None and anterior.huella == firma else None
+            plan.append((propio, rangos(indices), firma, reutilizable))
+        return plan
+
+    def generar_secciones(self, contexto: dict, conversacion: Optional[list] = None,
+                          previa: Optional[VersionAuditoria] = None) -> Iterator[SeccionAuditada]:
+        """Emite los apartados en orden, regenerando solo los que cambiaron respecto a `previa`"""
+        plan = self._plan(contexto, conversacion, previa)
+        pendientes = [n for n, (_, _, _, reutilizable) in enumerate(plan, start=1) if reutilizable is None]
+        workers = max(1, min(CONCURRENCIA, len(pendientes) or 1))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"gly-{self.agente}") as pool:
+            futuros = {
+                # copiamos el contexto para que los spans cuelguen del request
+                n: pool.submit(contextvars.copy_context().run, self._generar_seccion,
+                               n, self.secciones[n - 1][0], self.secciones[n - 1][1], plan[n - 1][0])
+                for n in pendientes
+            }
+            try:
+                for numero, (_, rango, firma, reutilizable) in enumerate(plan, start=1):
+                    titulo = self.secciones[numero - 1][0]
+                    if reutilizable is not None:
+                        metrics.auditoria_secciones.inc(agent=self.agente, result="reutilizado")
+                        yield SeccionAuditada(titulo, reutilizable, rango, firma)
+                        continue
+                    texto, ok = futuros[numero].result()
+                    metrics.auditoria_secciones.inc(agent=self.agente, result="generado")
+                    yield SeccionAuditada(titulo, texto, rango, firma if ok else "")
+            finally:
+                # si el cliente corta el stream no se lanzan los apartados pendientes
+                for futuro in futuros.values():
+                    futuro.cancel()
+
+    def generar_stream(self, contexto: dict) -> Iterator[str]:
+        """Emite los apartados en orden a medida que se completan"""
+        for seccion in self.generar_secciones(contexto):
+            yield seccion.texto
+
+    def generar(self, contexto: dict) -> str:
+        return "\n\n".join(self.generar_stream(contexto))
@@ -0,0 +1,69 @@
+# core/serializacion.py
+import json
+
+# ========================
+# 1. JSON rápido
+# ========================
+# dumps() para los frames de WebSocket y RespuestaJSON para las respuestas HTTP
+# grandes (historial completo y paginado de memoria).
+# orjson es opcional: si no está instalado se usa el json de la biblioteca estándar
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj) -> str:
+    """JSON compacto como str"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class RespuestaJSON(JSONResponse):
+    """JSONResponse que serializa con orjson cuando está instalado"""
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return super().render(content)
+
+
+# ========================
+# 2. Historial paginado por cursor
+# ========================
+def mensajes_de(memoria) -> list:
+    return getattr(getattr(memoria, "chat_memory", None), "messages", None) or []
+
+
+def _mensaje(m) -> dict:
+    return {"rol": getattr(m, "type", ""), "contenido": getattr(m, "content", "")}
+
+
+def pagina_historial(memoria, antes: int = None, limite: int = 50) -> dict:
+    """
+    Página de mensajes en orden cronológico que termina justo antes del cursor
+    `antes` (por defecto, los más recientes). `siguiente` es el cursor de la
+    página anterior (None al llegar al inicio) y `version` el total de mensajes.
+    """
+    mensajes = mensajes_de(memoria)
+    total = len(mensajes)
+    fin = total if antes is None else max(0, min(antes, total))
+    inicio = max(0, fin - max(1, limite))
+    return {
+        "mensajes": [_mensaje(m) for m in mensajes[inicio:fin]],
+        "siguiente": inicio if inicio > 0 else None,
+        "version": total,
+    }
+
+
+def delta_turno(memoria) -> dict:
+    """
+    Solo el último intercambio y la versión (total de mensajes) tras el turno.
+    Se llama con el turno de la sesión tomado (Agente._turno); leída después,
+    un turno concurrente del mismo usuario podría colarse en el delta.
+    """
+    mensajes = mensajes_de(memoria)
+    return {"intercambio": [_mensaje(m) for m in mensajes[-2:]], "version": len(mensajes)}
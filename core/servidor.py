@@ -0,0 +1,207 @@
+# core/servidor.py
+import os
+import time
+import signal
+import asyncio
+import threading
+import traceback
+import importlib.util
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from core.turnos import turnos
+
+# ========================
+# 1. Configuración del proceso
+# ========================
+# GLY_HOST / GLY_PORT (o PORT): dirección de escucha.
+# GLY_WORKERS: procesos de uvicorn (1 por defecto). Las sesiones viven en la
+#   memoria de cada proceso: con más de uno, el balanceador debe enrutar
+#   siempre el mismo user_id al mismo worker.
+# GLY_DRENADO_S: segundos de gracia tras SIGTERM para terminar los turnos en curso.
+# GLY_BAJA_S: segundos entre el SIGTERM y el cierre del listener, con /ready
+#   ya en 503, para que el balanceador saque al proceso antes de que deje de aceptar.
+# GLY_RECARGA=1: modo desarrollo (recarga al cambiar archivos, un solo proceso).
+HOST = os.getenv("GLY_HOST", "0.0.0.0")
+PORT = int(os.getenv("GLY_PORT", os.getenv("PORT", "8000")))
+WORKERS = max(1, int(os.getenv("GLY_WORKERS", "1")))
+DRENADO = float(os.getenv("GLY_DRENADO_S", "30"))
+BAJA = float(os.getenv("GLY_BAJA_S", "5"))
+RECARGA = os.getenv("GLY_RECARGA", "0").strip().lower() in ("1", "true", "si", "sí")
+
+
+def _disponible(modulo: str) -> bool:
+    return importlib.util.find_spec(modulo) is not None
+
+
+def opciones_uvicorn() -> dict:
+    """uvloop y httptools si están instalados; si no, asyncio y h11"""
+    opciones = {
+        "host": HOST,
+        "port": PORT,
+        "loop": "uvloop" if _disponible("uvloop") else "asyncio",
+        "http": "httptools" if _disponible("httptools") else "h11",
+        "lifespan": "on",
+        # uvicorn deja de aceptar conexiones y espera a los requests abiertos
+        "timeout_graceful_shutdown": DRENADO,
+    }
+    if RECARGA:
+        opciones["reload"] = True
+    else:
+        opciones["workers"] = WORKERS
+    return opciones
+
+
+def ejecutar(app, ruta_app: str):
+    """
+    Arranca uvicorn. Con un solo worker se le pasa la app ya importada (y con
+    los agentes ya construidos) en lugar de la ruta, que la importaría por
+    segunda vez; con varios workers o recarga uvicorn necesita la ruta y cada
+    proceso importa y precalienta su propia copia antes de declararse listo.
+    """
+    import uvicorn
+
+    opciones = opciones_uvicorn()
+    multiproceso = RECARGA or WORKERS > 1
+    print(
+        f"🚀 uvicorn en {HOST}:{PORT} | workers={1 if RECARGA else WORKERS} "
+        f"loop={opciones['loop']} http={opciones['http']} recarga={RECARGA} drenado={DRENADO}s"
+    )
+    uvicorn.run(ruta_app if multiproceso else app, **opciones)
+
+
+# ========================
+# 2. Estado de arranque y apagado
+# ========================
+class EstadoServidor:
+    """
+    Vida del proceso para las sondas: vivo desde que escucha, listo cuando
+    terminaron los pasos de precalentamiento, y drenando desde el SIGTERM.
+    Los turnos en curso se cuentan con la tabla de cerrojos de core/turnos.py:
+    cada turno de chat y cada auditoría/plan (incluida su persistencia en el
+    JSON) tiene su entrada mientras corre.
+    """
+
+    def __init__(self):
+        self._pasos: List[Tuple[str, Callable]] = []
+        self._cierre: List[Tuple[str, Callable]] = []
+        self.pasos: Dict[str, str] = {}
+        self.listo = False
+        self.drenando = False
+        self.inicio = time.monotonic()
+
+    def al_arrancar(self, nombre: str, funcion: Callable):
+        """Registra un paso de precalentamiento; debe lanzar si el proceso no puede atender"""
+        self._pasos.append((nombre, funcion))
+        self.pasos[nombre] = "pendiente"
+
+    def precalentar(self) -> bool:
+        for nombre, funcion in self._pasos:
+            inicio = time.perf_counter()
+            try:
+                funcion()
+                self.pasos[nombre] = f"ok ({time.perf_counter() - inicio:.2f}s)"
+            except Exception as e:
+                print(f"❌ Falló el precalentamiento '{nombre}':")
+                print(traceback.format_exc())
+                self.pasos[nombre] = f"error: {e}"
+        self.listo = all(v.startswith("ok") for v in self.pasos.values())
+        return self.listo
+
+    def al_apagar(self, nombre: str, funcion: Callable):
+        """Registra un paso de cierre; corre después del drenado, con los turnos ya terminados"""
+        self._cierre.append((nombre, funcion))
+
+    def apagar(self):
+        for nombre, funcion in self._cierre:
+            try:
+                funcion()
+            except Exception:
+                print(f"❌ Falló el paso de cierre '{nombre}':")
+                print(traceback.format_exc())
+
+    async def drenar(self, plazo: float) -> int:
+        """Espera a que terminen los turnos en curso; devuelve cuántos quedaron"""
+        limite = time.monotonic() + plazo
+        while len(turnos) and time.monotonic() < limite:
+            await asyncio.sleep(0.05)
+        return len(turnos)
+
+    def salud(self) -> dict:
+        return {"status": "ok", "pid": os.getpid(), "uptime_s": round(time.monotonic() - self.inicio, 1)}
+
+    def preparacion(self) -> dict:
+        return {
+            "listo": self.listo and not self.drenando,
+            "drenando": self.drenando,
+            "pasos": dict(self.pasos),
+            "turnos_en_curso": len(turnos),
+        }
+
+
+estado = EstadoServidor()
+
+
+# ========================
+# 3. Señales: drenando desde el SIGTERM
+# ========================
+def instalar_senales(estado: EstadoServidor = estado, baja: float = BAJA):
+    """
+    Envuelve el manejador de SIGTERM/SIGINT que uvicorn instaló en el worker:
+    marca `drenando` en cuanto llega la señal, así /ready da 503 mientras
+    todavía entra tráfico, y con SIGTERM demora `baja` segundos el cierre del
+    listener. Una segunda señal apaga sin esperar. Se llama desde el lifespan,
+    que corre en el hilo principal del worker después de que uvicorn puso sus
+    manejadores (y los restaura al salir).
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return  # p. ej. TestClient: no hay señales que envolver
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previo = signal.getsignal(sig)
+        if not callable(previo) or getattr(previo, "_gly_drenado", False):
+            continue
+
+        def manejador(signum, frame, previo=previo):
+            if not estado.drenando:
+                estado.drenando = True
+                if signum == signal.SIGTERM and baja > 0:
+                    print(f"🛑 SIGTERM: /ready en 503, cierre del listener en {baja}s")
+                    threading.Timer(baja, previo, (signum, frame)).start()
+                    return
+            previo(signum, frame)
+
+        manejador._gly_drenado = True
+        signal.signal(sig, manejador)
+
+
+# ========================
+# 4. Lifespan de FastAPI
+# ========================
+def ciclo_de_vida(estado: EstadoServidor = estado, drenado: float = DRENADO):
+    """
+    Al arrancar lanza el precalentamiento en segundo plano: /health responde
+    enseguida y /ready da 503 hasta que termine; desde el SIGTERM vuelve a dar
+    503 (ver instalar_senales). Al apagar (después de que
+    uvicorn cerró las conexiones) espera a los turnos que siguen en el
+    threadpool, p. ej. los de un WebSocket cerrado o un cliente que se fue,
+    para no cortar una llamada al LLM ni una escritura del JSON a medias.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app):
+        instalar_senales(estado)
+        tarea = asyncio.create_task(run_in_threadpool(estado.precalentar))
+        try:
+            yield
+        finally:
+            estado.drenando = True
+            pendientes = await estado.drenar(drenado)
+            if pendientes:
+                print(f"❌ Apagado con {pendientes} turno(s) sin terminar tras {drenado}s de drenado")
+            if not tarea.done():
+                tarea.cancel()
+            await run_in_threadpool(estado.apagar)
+
+    return lifespan
@@ -0,0 +1,168 @@
+# core/sesiones.py
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# ========================
+# 1. Almacén de sesiones con generaciones
+# ========================
+class _Entrada:
+    __slots__ = ("memoria", "gen_global", "gen_usuario")
+
+    def __init__(self, memoria, gen_global: int, gen_usuario: int):
+        self.memoria = memoria
+        self.gen_global = gen_global
+        self.gen_usuario = gen_usuario
+
+
+class AlmacenSesiones:
+    """
+    Memorias de conversación por user_id con reinicio O(1).
+
+    Cada entrada queda sellada con la generación global y la del usuario
+    vigentes al crearla. Reiniciar solo incrementa un contador: las entradas
+    con un sello viejo se consideran vacías y se reemplazan la próxima vez que
+    el usuario vuelve, o las recoge poco a poco un barrido incremental que
+    revisa unas pocas entradas en cada acceso. Así un reset nunca recorre a
+    todos los usuarios ni bloquea al resto del tráfico.
+
+    Con `restaurar_con` (ver core/instantaneas.py) un usuario sin sesión en
+    memoria recupera la que tenía en la última instantánea, la primera vez
+    que vuelve. Los reinicios también valen para esas sesiones aún no
+    restauradas.
+    """
+
+    BARRIDO_POR_ACCESO = 2
+
+    def __init__(self, factory: Callable[[], object]):
+        self.factory = factory
+        self._sesiones: Dict[str, _Entrada] = {}
+        self._gen_global = 0
+        self._gen_usuario: Dict[str, int] = {}
+        self._cola_barrido: deque = deque()
+        self._lock = threading.Lock()
+        self._restaurar: Optional[Callable[[str], object]] = None
+        self._gen_restaurable = 0
+        self._sin_restaurar: Dict[str, int] = {}
+        self._reinicios = 0
+
+    def _vigente(self, user_id: str, entrada: _Entrada) -> bool:
+        return (
+            entrada.gen_global == self._gen_global
+            and entrada.gen_usuario == self._gen_usuario.get(user_id, 0)
+        )
+
+    def obtener(self, user_id: str):
+        """Memoria del usuario; crea una nueva si no existe o fue reiniciada"""
+        with self._lock:
+            entrada = self._sesiones.get(user_id)
+            if entrada is None or not self._vigente(user_id, entrada):
+                memoria = None
+                if entrada is None:
+                    self._cola_barrido.append(user_id)
+                    if self._restaurable(user_id):
+                        memoria = self._restaurar(user_id)
+                if memoria is None:
+                    memoria = self.factory()
+                entrada = _Entrada(memoria, self._gen_global, self._gen_usuario.get(user_id, 0))
+                self._sesiones[user_id] = entrada
+            self._barrer(self.BARRIDO_POR_ACCESO)
+            return entrada.memoria
+
+    def existe(self, user_id: str) -> bool:
+        with self._lock:
+            entrada = self._sesiones.get(user_id)
+            return entrada is not None and self._vigente(user_id, entrada)
+
+    # --- reinicios ---
+    def reset_global(self) -> int:
+        """Invalida todas las sesiones en O(1)"""
+        with self._lock:
+            self._gen_global += 1
+            return self._gen_global
+
+    def reset_usuario(self, user_id: str) -> bool:
+        """Invalida la sesión de un usuario en O(1); False si no tenía sesión"""
+        with self._lock:
+            if self._restaurar is not None:
+                self._reinicios += 1
+                self._sin_restaurar[user_id] = self._reinicios
+            if user_id not in self._sesiones:
+                return False
+            self._gen_usuario[user_id] = self._gen_usuario.get(user_id, 0) + 1
+            return True
+
+    # --- restauración desde instantáneas ---
+    def _restaurable(self, user_id: str) -> bool:
+        return (
+            self._restaurar is not None
+            and self._gen_global == self._gen_restaurable
+            and user_id not in self._sin_restaurar
+        )
+
+    def restaurar_con(self, funcion: Callable[[str], object]):
+        """`funcion(user_id)` devuelve la sesión guardada o None"""
+        with self._lock:
+            self._restaurar = funcion
+            self._gen_restaurable = self._gen_global
+            self._sin_restaurar.clear()
+
+    def marca(self) -> Tuple[int, int]:
+        """Generación y reinicios vistos antes de leer las sesiones para una instantánea"""
+        with self._lock:
+            return self._gen_global, self._reinicios
+
+    def instantanea_renovada(self, marca: Tuple[int, int]):
+        """
+        La nueva instantánea ya refleja los reinicios anteriores a `marca`:
+        vuelve a restaurar desde ella. Los posteriores siguen valiendo.
+        """
+        gen, reinicios = marca
+        with self._lock:
+            self._gen_restaurable = gen
+            self._sin_restaurar = {u: n for u, n in self._sin_restaurar.items() if n > reinicios}
+
+    def conservar_guardada(self, user_id: str) -> bool:
+        """Si la sesión guardada de un usuario que no está en memoria sigue valiendo"""
+        with self._lock:
+            return user_id not in self._sesiones and self._restaurable(user_id)
+
+    def sesiones(self) -> List[Tuple[str, object]]:
+        """(user_id, memoria) vigentes (copia)"""
+        with self._lock:
+            return [(u, e.memoria) for u, e in self._sesiones.items() if self._vigente(u, e)]
+
+    # --- recolección perezosa ---
+    def _barrer(self, cantidad: int):
+        """Revisa hasta `cantidad` entradas y libera las obsoletas (con lock tomado)"""
+        for _ in range(min(cantidad, len(self._cola_barrido))):
+            user_id = self._cola_barrido.popleft()
+            entrada = self._sesiones.get(user_id)
+            if entrada is None:
+                continue
+            if self._vigente(user_id, entrada):
+                self._cola_barrido.append(user_id)
+            else:
+                del self._sesiones[user_id]
+                self._gen_usuario.pop(user_id, None)
+
+    def barrer(self, cantidad: Optional[int] = None) -> int:
+        """Barrido explícito (p. ej. desde una tarea periódica); devuelve entradas restantes"""
+        with self._lock:
+            self._barrer(len(self._cola_barrido) if cantidad is None else cantidad)
+            return len(self._sesiones)
+
+    # --- inspección ---
+    def memorias(self) -> Iterator:
+        """Memorias vigentes (copia, segura frente a escrituras concurrentes)"""
+        with self._lock:
+            vigentes = [e.memoria for u, e in self._sesiones.items() if self._vigente(u, e)]
+        return iter(vigentes)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(1 for u, e in self._sesiones.items() if self._vigente(u, e))
+
+    @property
+    def generacion(self) -> int:
+        return self._gen_global
@@ -0,0 +1,242 @@
+# core/tracing.py
+import os
+import json
+import atexit
+import time
+import uuid
+import queue
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import List, Optional
+
+# ========================
+# 1. Configuración
+# ========================
+# GLY_TRACE_SAMPLE: fracción de requests trazados (0 = apagado, 1 = todos)
+# GLY_TRACE_EXPORT: "file" (JSONL local) u "otlp" (colector OTLP/HTTP JSON)
+# GLY_TRACE_FILE:   ruta del JSONL cuando se exporta a archivo
+# GLY_OTLP_ENDPOINT: p. ej. http://localhost:4318/v1/traces
+SAMPLE_RATE = float(os.getenv("GLY_TRACE_SAMPLE", "0"))
+EXPORTADOR = os.getenv("GLY_TRACE_EXPORT", "file")
+TRACE_FILE = os.getenv("GLY_TRACE_FILE", "trazas.jsonl")
+OTLP_ENDPOINT = os.getenv("GLY_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+SERVICE_NAME = "glynne-llm-api"
+
+# ========================
+# 2. Span
+# ========================
+class Span:
+    __slots__ = ("nombre", "trace_id", "span_id", "parent_id", "request_id", "inicio_ns", "fin_ns", "atributos", "error")
+
+    def __init__(self, nombre: str, trace_id: str, parent_id: Optional[str], request_id: str, atributos: dict):
+        self.nombre = nombre
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.request_id = request_id
+        self.inicio_ns = time.time_ns()
+        self.fin_ns = 0
+        self.atributos = atributos
+        self.error = None
+
+    def set(self, **atributos):
+        self.atributos.update(atributos)
+
+    @property
+    def duracion_ms(self) -> float:
+        return (self.fin_ns - self.inicio_ns) / 1e6
+
+    def a_dict(self) -> dict:
+        return {
+            "name": self.nombre,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "request_id": self.request_id,
+            "start_ns": self.inicio_ns,
+            "end_ns": self.fin_ns,
+            "duration_ms": round(self.duracion_ms, 3),
+            "attributes": self.atributos,
+            "error": self.error,
+        }
+
+
+class _SpanNulo:
+    """Span que no registra nada: se usa cuando el request no está muestreado"""
+
+    def set(self, **atributos):
+        pass
+
+
+_SPAN_NULO = _SpanNulo()
+
+# span activo del request actual (None = request no muestreado)
+_span_actual: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("gly_span_actual", default=None)
+_request_id: contextvars.ContextVar[str] = contextvars.ContextVar("gly_request_id", default="")
+
+
+def request_id_actual() -> str:
+    return _request_id.get()
+
+
+# ========================
+# 3. API de trazado
+# ========================
+@contextmanager
+def traza(nombre: str, request_id: Optional[str] = None, **atributos):
+    """
+    Abre el span raíz de un request. Decide el muestreo una sola vez; si el
+    request no entra en la muestra, todos los spans internos son no-ops.
+    """
+    request_id = request_id or uuid.uuid4().hex
+    token_rid = _request_id.set(request_id)
+    if SAMPLE_RATE <= 0 or random.random() >= SAMPLE_RATE:
+        try:
+            yield _SPAN_NULO
+        finally:
+            _request_id.reset(token_rid)
+        return
+
+    raiz = Span(nombre, uuid.uuid4().hex, None, request_id, atributos)
+    token_span = _span_actual.set(raiz)
+    try:
+        yield raiz
+    except Exception as e:
+        raiz.error = repr(e)
+        raise
+    finally:
+        raiz.fin_ns = time.time_ns()
+        _span_actual.reset(token_span)
+        _request_id.reset(token_rid)
+        exportador.exportar(raiz)
+
+
+@contextmanager
+def span(nombre: str, **atributos):
+    """Span hijo del span activo; no-op si no hay traza muestreada"""
+    padre = _span_actual.get()
+    if padre is None:
+        yield _SPAN_NULO
+        return
+
+    actual = Span(nombre, padre.trace_id, padre.span_id, padre.request_id, atributos)
+    token = _span_actual.set(actual)
+    try:
+        yield actual
+    except Exception as e:
+        actual.error = repr(e)
+        raise
+    finally:
+        actual.fin_ns = time.time_ns()
+        _span_actual.reset(token)
+        exportador.exportar(actual)
+
+
+# ========================
+# 4. Exportadores (hilo en segundo plano, por lotes)
+# ========================
+class Exportador:
+    TAMANO_LOTE = 256
+    INTERVALO = 1.0
+
+    def __init__(self, destino: str):
+        self.destino = destino
+        self._cola: "queue.Queue[Span]" = queue.Queue(maxsize=10000)
+        self._hilo = None
+        self._lock = threading.Lock()
+        # se toma mientras un lote sale de la cola y se envía, para que
+        # vaciar() al apagar no pierda el lote que tiene el hilo en mano
+        self._lock_envio = threading.Lock()
+        self.descartados = 0
+
+    def exportar(self, span_: Span):
+        self._arrancar()
+        try:
+            self._cola.put_nowait(span_)
+        except queue.Full:
+            # nunca bloqueamos el request por la telemetría
+            self.descartados += 1
+
+    def _arrancar(self):
+        if self._hilo is not None:
+            return
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name="gly-trace-export", daemon=True)
+                self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            time.sleep(self.INTERVALO)
+            try:
+                self.vaciar(timeout=5.0)
+            except Exception as e:
+                print("❌ Error exportando spans:", e)
+
+    def vaciar(self, timeout: float = 2.0):
+        """Exporta de inmediato los spans pendientes (útil al apagar el servidor)"""
+        with self._lock_envio:
+            while True:
+                lote = []
+                while len(lote) < self.TAMANO_LOTE:
+                    try:
+                        lote.append(self._cola.get_nowait())
+                    except queue.Empty:
+                        break
+                if not lote:
+                    return
+                self._enviar(lote, timeout=timeout)
+
+    def _enviar(self, lote: List[Span], timeout: float = 5.0):
+        if self.destino == "otlp":
+            self._enviar_otlp(lote, timeout)
+        else:
+            self._enviar_archivo(lote)
+
+    def _enviar_archivo(self, lote: List[Span]):
+        with open(TRACE_FILE, "a", encoding="utf-8") as f:
+            for s in lote:
+                f.write(json.dumps(s.a_dict(), ensure_ascii=False) + "\n")
+
+    def _enviar_otlp(self, lote: List[Span], timeout: float):
+        import requests
+
+        def _valor(v):
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+
+        spans = []
+        for s in lote:
+            atributos = dict(s.atributos, request_id=s.request_id)
+            otlp = {
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "name": s.nombre,
+                "kind": 2 if s.parent_id is None else 1,
+                "startTimeUnixNano": str(s.inicio_ns),
+                "endTimeUnixNano": str(s.fin_ns),
+                "attributes": [{"key": k, "value": _valor(v)} for k, v in atributos.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            }
+            if s.parent_id:
+                otlp["parentSpanId"] = s.parent_id
+            spans.append(otlp)
+
+        cuerpo = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": "core.tracing"}, "spans": spans}],
+            }]
+        }
+        requests.post(OTLP_ENDPOINT, json=cuerpo, timeout=timeout)
+
+
+exportador = Exportador(EXPORTADOR)
+atexit.register(exportador.vaciar)
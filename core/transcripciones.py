@@ -0,0 +1,528 @@
+# core/transcripciones.py
+import os
+import json
+import time
+import gzip
+import hashlib
+import threading
+import importlib.util
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core import metrics
+from core.turnos import bloqueo_archivo
+
+# ========================
+# 1. Configuración
+# ========================
+# GLY_TRANSCRIPCIONES_DIR: carpeta raíz; cada transcripción (antes un JSON
+#   suelto, p. ej. conversacion_temp.json) vive en una subcarpeta con su nombre.
+# GLY_TRANSCRIPCIONES_SHARDS: particiones por hash del user_id.
+# GLY_SEGMENTO_KB: tamaño a partir del cual el segmento abierto se cierra y comprime.
+# GLY_TRANSCRIPCIONES_RETENCION_D: días que se conservan los intercambios ya auditados.
+# GLY_COMPACTACION_S: segundos entre compactaciones (0 = solo bajo demanda).
+DIRECTORIO = os.getenv("GLY_TRANSCRIPCIONES_DIR", "transcripciones")
+SHARDS = max(1, int(os.getenv("GLY_TRANSCRIPCIONES_SHARDS", "64")))
+SEGMENTO = int(os.getenv("GLY_SEGMENTO_KB", "256")) * 1024
+RETENCION = float(os.getenv("GLY_TRANSCRIPCIONES_RETENCION_D", "7")) * 86400
+COMPACTACION = float(os.getenv("GLY_COMPACTACION_S", "3600"))
+
+ABIERTO = "abierto.jsonl"
+INDICE = "indice.jsonl"
+CURSORES = "cursores.json"
+PODADOS = "podados.json"
+MIGRADO = "migrado.json"
+
+# zstd si está instalado; si no, gzip de la biblioteca estándar
+if importlib.util.find_spec("zstandard") is not None:
+    import zstandard
+
+    EXTENSION = ".zst"
+    _compresor = zstandard.ZstdCompressor(level=6)
+
+    def _comprimir(datos: bytes) -> bytes:
+        return _compresor.compress(datos)
+else:
+    EXTENSION = ".gz"
+
+    def _comprimir(datos: bytes) -> bytes:
+        return gzip.compress(datos, compresslevel=6, mtime=0)
+
+
+def _descomprimir(nombre: str, datos: bytes) -> bytes:
+    if nombre.endswith(".zst"):
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(datos)
+    return gzip.decompress(datos)
+
+
+def _clave(user_id: Optional[str]) -> str:
+    # los intercambios sin user_id (anteriores al etiquetado) van a la clave vacía
+    return "" if user_id is None else str(user_id)
+
+
+def _shard(clave: str) -> str:
+    h = int.from_bytes(hashlib.blake2b(clave.encode("utf-8"), digest_size=4).digest(), "little")
+    return f"{h % SHARDS:02x}"
+
+
+def _intercambio(registro: dict) -> dict:
+    intercambio = {"user": registro.get("user", ""), "ai": registro.get("ai", "")}
+    if registro.get("user_id") is not None:
+        intercambio["user_id"] = registro["user_id"]
+    intercambio["ts"] = registro.get("ts", 0)
+    return intercambio
+
+
+# ========================
+# 2. Una partición
+# ========================
+class _Shard:
+    """
+    Los intercambios de los usuarios cuyo hash cae en esta partición:
+
+      abierto.jsonl      segmento abierto, una línea JSON compacta por intercambio
+      000001.gz ...      segmentos cerrados; dentro, un miembro comprimido por usuario
+      indice.jsonl       por miembro: segmento, usuario, offset, largo, cantidad y rango de fechas
+      cursores.json      cuántos intercambios de cada usuario ya consumió el auditor
+      podados.json       cuántos consumidos se descartaron al compactar (posición absoluta = cursor + podados)
+
+    Leer la historia de un usuario descomprime solo sus miembros (un seek por
+    segmento) más el segmento abierto, que nunca pasa de GLY_SEGMENTO_KB.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self.abierto = os.path.join(ruta, ABIERTO)
+        self._indice: Optional[Dict[str, List[dict]]] = None
+        self._indice_mtime = None
+
+    # --- archivos auxiliares ---
+    def _leer_json(self, nombre: str, defecto):
+        try:
+            with open(os.path.join(self.ruta, nombre), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return defecto
+
+    def _escribir_atomico(self, nombre: str, datos: bytes):
+        destino = os.path.join(self.ruta, nombre)
+        temporal = destino + ".tmp"
+        with open(temporal, "wb") as f:
+            f.write(datos)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, destino)
+
+    def cursores(self) -> Dict[str, int]:
+        return self._leer_json(CURSORES, {})
+
+    def _guardar_cursores(self, cursores: Dict[str, int]):
+        datos = {c: n for c, n in cursores.items() if n > 0}
+        self._escribir_atomico(CURSORES, json.dumps(datos, ensure_ascii=False).encode("utf-8"))
+
+    def podados(self) -> Dict[str, int]:
+        return self._leer_json(PODADOS, {})
+
+    def indice(self) -> Dict[str, List[dict]]:
+        """Miembros por usuario, en orden; se relee solo si el archivo cambió"""
+        ruta = os.path.join(self.ruta, INDICE)
+        try:
+            mtime = os.stat(ruta).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if self._indice is None or mtime != self._indice_mtime:
+            por_usuario: Dict[str, List[dict]] = {}
+            with open(ruta, "r", encoding="utf-8") as f:
+                for linea in f:
+                    if linea.strip():
+                        entrada = json.loads(linea)
+                        por_usuario.setdefault(entrada["u"], []).append(entrada)
+            self._indice, self._indice_mtime = por_usuario, mtime
+        return self._indice
+
+    def _segmentos(self) -> List[str]:
+        return sorted(n for n in os.listdir(self.ruta) if n.endswith((".gz", ".zst")) and n[:6].isdigit())
+
+    # --- lectura ---
+    def _abiertos(self, claves: Optional[set] = None) -> List[Tuple[str, dict]]:
+        registros = []
+        try:
+            with open(self.abierto, "r", encoding="utf-8") as f:
+                for linea in f:
+                    if not linea.strip():
+                        continue
+                    try:
+                        registro = json.loads(linea)
+                    except json.JSONDecodeError:
+                        continue  # línea a medio escribir por un proceso que murió
+                    clave = _clave(registro.get("user_id"))
+                    if claves is None or clave in claves:
+                        registros.append((clave, registro))
+        except FileNotFoundError:
+            pass
+        return registros
+
+    def _miembro(self, entrada: dict) -> List[dict]:
+        with open(os.path.join(self.ruta, entrada["s"]), "rb") as f:
+            f.seek(entrada["o"])
+            datos = f.read(entrada["l"])
+        metrics.transcripcion_bytes.observe(len(datos))
+        return [json.loads(linea) for linea in _descomprimir(entrada["s"], datos).decode("utf-8").splitlines() if linea]
+
+    def historia(self, clave: str, desde: float = 0, hasta: Optional[float] = None,
+                 saltar: int = 0) -> List[dict]:
+        """
+        Intercambios de un usuario en orden, sin los primeros `saltar`; los
+        miembros fuera de [desde, hasta] o ya saltados no se leen.
+        """
+        resultado = []
+        for entrada in self.indice().get(clave, []):
+            if saltar >= entrada["n"]:
+                saltar -= entrada["n"]
+                continue
+            if entrada["t1"] < desde or (hasta is not None and entrada["t0"] > hasta):
+                saltar = 0
+                continue
+            registros = self._miembro(entrada)[saltar:]
+            saltar = 0
+            resultado.extend(registros)
+        abiertos = [r for _, r in self._abiertos({clave})]
+        resultado.extend(abiertos[saltar:])
+        return [r for r in resultado if desde <= r.get("ts", 0) and (hasta is None or r.get("ts", 0) <= hasta)]
+
+    def contar(self, clave: str) -> int:
+        """Intercambios guardados de un usuario (sin los podados), sin descomprimir"""
+        return sum(e["n"] for e in self.indice().get(clave, [])) + len(self._abiertos({clave}))
+
+    def usuarios(self) -> set:
+        claves = set(self.indice())
+        claves.update(c for c, _ in self._abiertos())
+        return claves
+
+    # --- escritura ---
+    def agregar(self, registros: Iterable[dict]):
+        os.makedirs(self.ruta, exist_ok=True)
+        with open(self.abierto, "a", encoding="utf-8") as f:
+            for registro in registros:
+                f.write(json.dumps(registro, ensure_ascii=False, separators=(",", ":")) + "\n")
+        if os.path.getsize(self.abierto) >= SEGMENTO:
+            self.cerrar_segmento()
+
+    def _escribir_segmento(self, por_usuario: Dict[str, List[dict]]) -> List[dict]:
+        """Escribe un segmento nuevo con un miembro comprimido por usuario; devuelve sus entradas de índice"""
+        segmentos = self._segmentos()
+        numero = int(segmentos[-1][:6]) + 1 if segmentos else 1
+        nombre = f"{numero:06d}{EXTENSION}"
+        entradas, partes, offset = [], [], 0
+        for clave, registros in por_usuario.items():
+            if not registros:
+                continue
+            texto = "\n".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) for r in registros)
+            miembro = _comprimir(texto.encode("utf-8"))
+            partes.append(miembro)
+            marcas = [r.get("ts", 0) for r in registros]
+            entradas.append({"s": nombre, "u": clave, "o": offset, "l": len(miembro),
+                             "n": len(registros), "t0": min(marcas), "t1": max(marcas)})
+            offset += len(miembro)
+        if entradas:
+            self._escribir_atomico(nombre, b"".join(partes))
+        return entradas
+
+    def cerrar_segmento(self):
+        """El segmento abierto pasa a un segmento comprimido e indexado"""
+        por_usuario: Dict[str, List[dict]] = {}
+        for clave, registro in self._abiertos():
+            por_usuario.setdefault(clave, []).append(registro)
+        entradas = self._escribir_segmento(por_usuario)
+        if entradas:
+            with open(os.path.join(self.ruta, INDICE), "a", encoding="utf-8") as f:
+                for entrada in entradas:
+                    f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        open(self.abierto, "w").close()
+        metrics.transcripcion_segmentos.inc(event="cerrado")
+
+    def compactar(self, ahora: float):
+        """
+        Reescribe los segmentos cerrados en uno solo, sin los intercambios ya
+        consumidos que superaron la retención; los cursores se corrigen en
+        la misma medida.
+        """
+        segmentos = self._segmentos()
+        if len(segmentos) < 2 and not self.indice():
+            return
+        cursores = self.cursores()
+        podados = self.podados()
+        por_usuario: Dict[str, List[dict]] = {}
+        for clave, entradas in self.indice().items():
+            registros = []
+            for entrada in entradas:
+                registros.extend(self._miembro(entrada))
+            consumidos = cursores.get(clave, 0)
+            descartar = 0
+            while (descartar < min(consumidos, len(registros))
+                   and ahora - registros[descartar].get("ts", 0) > RETENCION):
+                descartar += 1
+            if descartar:
+                cursores[clave] = consumidos - descartar
+                podados[clave] = podados.get(clave, 0) + descartar
+            por_usuario[clave] = registros[descartar:]
+        if len(segmentos) < 2 and not any(cursores.get(c, 0) != n for c, n in self.cursores().items()):
+            return  # un solo segmento y nada vencido: no hay nada que ganar
+        entradas = self._escribir_segmento(por_usuario)
+        indice = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entradas)
+        self._escribir_atomico(INDICE, indice.encode("utf-8"))
+        self._escribir_atomico(PODADOS, json.dumps(podados, ensure_ascii=False).encode("utf-8"))
+        self._guardar_cursores(cursores)
+        vigente = entradas[0]["s"] if entradas else None
+        for nombre in segmentos:
+            if nombre != vigente:
+                os.remove(os.path.join(self.ruta, nombre))
+        metrics.transcripcion_segmentos.inc(len(segmentos), event="compactado")
+
+
+class Pendientes(list):
+    """
+    Intercambios pendientes más la posición absoluta de cada cursor al
+    leerlos: `consumir` avanza desde esa posición y no suma a ciegas, así dos
+    auditorías que leyeron los mismos intercambios sin user_id (con cerrojos
+    de usuario distintos) no saltan intercambios que nadie auditó.
+    """
+
+    def __init__(self, intercambios: Iterable[dict], leidos: Dict[str, int]):
+        super().__init__(intercambios)
+        self.leidos = leidos
+
+
+# ========================
+# 3. Transcripción particionada
+# ========================
+class Transcripcion:
+    """
+    Reemplaza al JSON temporal compartido (conversacion_temp.json): los chats
+    agregan intercambios, los auditores leen los pendientes de un usuario y
+    marcan como consumidos los que auditaron. Nada se reescribe al agregar
+    ni al consumir; la compactación periódica poda lo consumido y vencido.
+    """
+
+    def __init__(self, nombre: str, raiz: str = DIRECTORIO):
+        self.nombre = nombre
+        base = os.path.splitext(os.path.basename(nombre))[0]
+        self.ruta = os.path.join(raiz, base)
+        self._shards: Dict[str, _Shard] = {}
+        self._lock = threading.Lock()
+
+    def _shard_de(self, clave: str) -> _Shard:
+        nombre = _shard(clave)
+        with self._lock:
+            shard = self._shards.get(nombre)
+            if shard is None:
+                shard = self._shards[nombre] = _Shard(os.path.join(self.ruta, nombre))
+            return shard
+
+    def _todos(self) -> List[_Shard]:
+        if not os.path.isdir(self.ruta):
+            return []
+        return [self._shard_de_nombre(n) for n in sorted(os.listdir(self.ruta))
+                if os.path.isdir(os.path.join(self.ruta, n))]
+
+    def _shard_de_nombre(self, nombre: str) -> _Shard:
+        with self._lock:
+            shard = self._shards.get(nombre)
+            if shard is None:
+                shard = self._shards[nombre] = _Shard(os.path.join(self.ruta, nombre))
+            return shard
+
+    def _bloqueo(self, shard: _Shard):
+        # exclusión entre hilos y workers por partición: usuarios de otras particiones no esperan
+        os.makedirs(shard.ruta, exist_ok=True)
+        return bloqueo_archivo(shard.abierto)
+
+    def existe(self) -> bool:
+        return os.path.isdir(self.ruta)
+
+    def asegurar(self):
+        os.makedirs(self.ruta, exist_ok=True)
+        self.migrar(self.nombre)
+
+    # --- escritura ---
+    def guardar(self, user_msg: str, ai_resp: str, user_id: Optional[str] = None):
+        registro = {"user": user_msg, "ai": ai_resp}
+        if user_id is not None:
+            # permite auditar por usuario
+            registro["user_id"] = user_id
+        registro["ts"] = round(time.time(), 3)
+        shard = self._shard_de(_clave(user_id))
+        with self._bloqueo(shard):
+            shard.agregar([registro])
+
+    def importar(self, intercambios: Iterable[dict]):
+        """Carga masiva (migración del JSON viejo), agrupada por partición"""
+        por_shard: Dict[str, List[dict]] = {}
+        ahora = round(time.time(), 3)
+        for c in intercambios:
+            if isinstance(c, dict):
+                registro = dict(c)
+                registro.setdefault("ts", ahora)
+                por_shard.setdefault(_shard(_clave(c.get("user_id"))), []).append(registro)
+        for nombre, registros in por_shard.items():
+            shard = self._shard_de_nombre(nombre)
+            with self._bloqueo(shard):
+                shard.agregar(registros)
+
+    def migrar(self, ruta_json: str):
+        """
+        Importa una sola vez un JSON temporal del formato anterior. El archivo
+        original queda donde está (puede estar versionado en git); la
+        migración se registra en migrado.json dentro de la transcripción.
+        """
+        marca = os.path.join(self.ruta, MIGRADO)
+        if os.path.exists(marca) or not os.path.isfile(ruta_json):
+            return
+        with bloqueo_archivo(marca):
+            if os.path.exists(marca):
+                return
+            try:
+                with open(ruta_json, "rb") as f:
+                    crudo = f.read()
+                datos = json.loads(crudo.decode("utf-8"))
+            except (OSError, ValueError):
+                crudo, datos = b"", []
+            if not isinstance(datos, list):
+                datos = []
+            self.importar(datos)
+            registro = {
+                "origen": os.path.abspath(ruta_json),
+                "sha1": hashlib.sha1(crudo).hexdigest(),
+                "intercambios": len(datos),
+                "ts": round(time.time(), 3),
+            }
+            with open(marca, "w", encoding="utf-8") as f:
+                json.dump(registro, f, ensure_ascii=False)
+            print(f"✅ {ruta_json} migrado a {self.ruta} ({len(datos)} intercambios)")
+
+    # --- lectura y consumo (auditores) ---
+    def pendientes(self, user_id: Optional[str] = None) -> Pendientes:
+        """
+        Intercambios aún no auditados: los del usuario más los sin user_id,
+        o los de todos si user_id es None; en orden de llegada.
+        """
+        if user_id is None:
+            claves_por_shard = [(s, s.usuarios()) for s in self._todos()]
+        else:
+            claves = {_clave(user_id), ""}
+            por_nombre: Dict[str, set] = {}
+            for clave in claves:
+                por_nombre.setdefault(_shard(clave), set()).add(clave)
+            claves_por_shard = [(self._shard_de_nombre(n), c) for n, c in por_nombre.items()]
+        resultado = []
+        leidos: Dict[str, int] = {}
+        for shard, claves in claves_por_shard:
+            if not os.path.isdir(shard.ruta):
+                continue
+            with self._bloqueo(shard):
+                cursores, podados = shard.cursores(), shard.podados()
+                for clave in claves:
+                    leidos[clave] = cursores.get(clave, 0) + podados.get(clave, 0)
+                    resultado.extend(shard.historia(clave, saltar=cursores.get(clave, 0)))
+        resultado.sort(key=lambda r: r.get("ts", 0))
+        return Pendientes((_intercambio(r) for r in resultado), leidos)
+
+    def consumir(self, intercambios: Iterable[dict]):
+        """
+        Marca como auditados los intercambios devueltos por `pendientes`: cada
+        cursor queda en (posición leída + consumidos), o donde esté si otra
+        auditoría ya lo llevó más lejos.
+        """
+        leidos = getattr(intercambios, "leidos", None)
+        por_clave: Dict[str, int] = {}
+        for c in intercambios:
+            clave = _clave(c.get("user_id"))
+            por_clave[clave] = por_clave.get(clave, 0) + 1
+        por_shard: Dict[str, Dict[str, int]] = {}
+        for clave, n in por_clave.items():
+            por_shard.setdefault(_shard(clave), {})[clave] = n
+        for nombre, cuentas in por_shard.items():
+            shard = self._shard_de_nombre(nombre)
+            with self._bloqueo(shard):
+                cursores, podados = shard.cursores(), shard.podados()
+                for clave, n in cuentas.items():
+                    actual = cursores.get(clave, 0) + podados.get(clave, 0)
+                    # sin posición leída (lista armada a mano) se avanza desde el cursor actual
+                    desde = leidos.get(clave, actual) if leidos is not None else actual
+                    # nunca más allá de lo guardado (p. ej. si hubo un /reset durante la auditoría)
+                    cursores[clave] = min(max(actual, desde + n) - podados.get(clave, 0), shard.contar(clave))
+                shard._guardar_cursores(cursores)
+
+    def historia(self, user_id: Optional[str], desde: float = 0, hasta: Optional[float] = None) -> List[dict]:
+        """Todos los intercambios guardados del usuario (auditados o no) en un rango de fechas"""
+        clave = _clave(user_id)
+        shard = self._shard_de(clave)
+        if not os.path.isdir(shard.ruta):
+            return []
+        with self._bloqueo(shard):
+            return [_intercambio(r) for r in shard.historia(clave, desde, hasta)]
+
+    def vaciar(self):
+        """Borra toda la transcripción (endpoint /reset)"""
+        for shard in self._todos():
+            with self._bloqueo(shard):
+                for nombre in os.listdir(shard.ruta):
+                    if not nombre.endswith(".lock"):
+                        os.remove(os.path.join(shard.ruta, nombre))
+                shard._indice = None
+
+    # --- mantenimiento ---
+    def compactar(self, cerrar_abiertos: bool = False):
+        ahora = time.time()
+        for shard in self._todos():
+            with self._bloqueo(shard):
+                if cerrar_abiertos and os.path.exists(shard.abierto) and os.path.getsize(shard.abierto):
+                    shard.cerrar_segmento()
+                shard.compactar(ahora)
+
+
+# ========================
+# 4. Registro y compactación periódica
+# ========================
+_transcripciones: Dict[str, Transcripcion] = {}
+_registro_lock = threading.Lock()
+_hilo: Optional[threading.Thread] = None
+
+
+def transcripcion(nombre: str) -> Transcripcion:
+    """Transcripción compartida por nombre (el del antiguo archivo JSON)"""
+    with _registro_lock:
+        t = _transcripciones.get(nombre)
+        if t is None:
+            t = _transcripciones[nombre] = Transcripcion(nombre)
+            t.asegurar()
+        return t
+
+
+def compactar_todas(cerrar_abiertos: bool = False):
+    with _registro_lock:
+        todas = list(_transcripciones.values())
+    for t in todas:
+        inicio = time.perf_counter()
+        try:
+            t.compactar(cerrar_abiertos)
+        except Exception as e:
+            print(f"❌ Error al compactar la transcripción {t.nombre}:", e)
+        metrics.transcripcion_compactacion.observe(time.perf_counter() - inicio)
+
+
+def _bucle():
+    while True:
+        time.sleep(COMPACTACION)
+        compactar_todas()
+
+
+def arrancar_compactacion():
+    """Hilo de compactación periódica (paso de arranque del servidor)"""
+    global _hilo
+    if COMPACTACION > 0 and _hilo is None:
+        _hilo = threading.Thread(target=_bucle, name="compactacion", daemon=True)
+        _hilo.start()
@@ -0,0 +1,92 @@
+# core/turnos.py
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Hashable
+
+from core import metrics, tracing
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo exclusión entre hilos del mismo proceso
+    fcntl = None
+
+# ========================
+# 1. Tabla de cerrojos por clave
+# ========================
+class _Cerrojo:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.refs = 0
+
+
+class TablaCerrojos:
+    """
+    Un cerrojo por clave (p. ej. ("chat", user_id)), creado al primer uso y
+    liberado cuando nadie lo tiene ni lo espera: la tabla solo crece con las
+    sesiones activas. El lock de la tabla se toma un instante para contar
+    referencias; los turnos de usuarios distintos nunca se esperan entre sí.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cerrojos: Dict[Hashable, _Cerrojo] = {}
+
+    @contextmanager
+    def turno(self, clave: Hashable, agente: str = "api"):
+        with self._lock:
+            cerrojo = self._cerrojos.get(clave)
+            if cerrojo is None:
+                cerrojo = self._cerrojos[clave] = _Cerrojo()
+            cerrojo.refs += 1
+        try:
+            inicio = time.perf_counter()
+            with tracing.span("turno.espera"):
+                cerrojo.lock.acquire()
+            metrics.turno_espera.observe(time.perf_counter() - inicio, agent=agente)
+            try:
+                yield
+            finally:
+                cerrojo.lock.release()
+        finally:
+            with self._lock:
+                cerrojo.refs -= 1
+                if cerrojo.refs == 0:
+                    del self._cerrojos[clave]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._cerrojos)
+
+
+turnos = TablaCerrojos()
+
+# ========================
+# 2. Exclusión sobre archivos compartidos
+# ========================
+_locks_archivo: Dict[str, threading.Lock] = {}
+_locks_archivo_lock = threading.Lock()
+
+
+@contextmanager
+def bloqueo_archivo(ruta: str):
+    """
+    Exclusión para leer-modificar-escribir un archivo compartido: lock por
+    ruta entre hilos y flock sobre "<ruta>.lock" entre procesos (varios
+    workers). El lock vive en un archivo aparte para que borrar o reescribir
+    el archivo de datos no lo invalide.
+    """
+    with _locks_archivo_lock:
+        lock = _locks_archivo.setdefault(ruta, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        with open(ruta + ".lock", "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
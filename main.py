@@ -1,19 +1,31 @@
 # main.py
-import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 import os
-import json
+import time
 import traceback
 
 # ========================
 # 1. Importaciones de agentes
 # ========================
-from agent.chat import agente_node, get_memory, State, TEMP_JSON_PATH
-from agent.chat1 import agente_node as agente_node_alt, get_memory as get_memory_alt
-from agent.auditor import generar_auditoria as auditor_llm
+from agent.chat import agente_node, get_memory, State, TEMP_JSON_PATH, usuarios, indices
+from agent.chat1 import agente_node as agente_node_alt, get_memory as get_memory_alt, usuarios as usuarios_alt, indices as indices_alt
+from agent.auditor import generar_auditoria as auditor_llm, generar_auditoria_stream as auditor_llm_stream, auditorias
+from core.key_pool import pool
+from core import metrics, tracing
+from core.canal import CanalChat
+from core.serializacion import RespuestaJSON, delta_turno, pagina_historial
+from core.admision import AdmisionASGI, crear_limites
+from core.idempotencia import IdempotenciaASGI
+from core import inferencia_local, servidor
+from core.personas import motor as motor_personas
+from core.instantaneas import instantaneas
+from core import borradores, consumo, transcripciones
+from core.transcripciones import transcripcion
+from core.consumo import CuotaExcedida
 
 # ========================
 # 2. Inicialización FastAPI
@@ -21,9 +33,57 @@ from agent.auditor import generar_auditoria as auditor_llm
 app = FastAPI(
     title="GLYNNE LLM API",
     description="API para interactuar con los agentes de GLY-AI (LangGraph, Auditoría, Chat1)",
-    version="2.0"
+    version="2.0",
+    # precalentamiento al arrancar y drenado de turnos al apagar (core/servidor.py)
+    lifespan=servidor.ciclo_de_vida(),
 )
 
+# ========================
+# 2a. Cuota diaria de tokens agotada (core/consumo.py)
+# ========================
+@app.exception_handler(CuotaExcedida)
+async def cuota_excedida(request: Request, error: CuotaExcedida):
+    return JSONResponse(
+        {"detail": str(error), "limite": error.limite, "usados": error.usados},
+        status_code=429,
+        headers={"Retry-After": str(max(1, int(error.reintentar)))},
+    )
+
+# ========================
+# 2b. Control de admisión por grupo de rutas (core/admision.py)
+# ========================
+# chat y auditoría/plan tienen cupos separados: un pico de auditorías no
+# deja sin hilos a los turnos de chat. Se registra antes que CORS para quedar
+# por dentro y que los 429/503 también lleven las cabeceras CORS.
+GRUPO_POR_RUTA = {
+    "/chat": "chat",
+    "/chat1": "chat",
+    "/chat2": "chat",
+    "/generar_auditoria": "documento",
+    "/generar_auditoria/json": "documento",
+    "/generar_auditoria/stream": "documento",
+    "/generar_plan": "documento",
+    "/generar_plan/json": "documento",
+    "/generar_plan/stream": "documento",
+}
+# turnos de las personas declaradas en configuración: POST /persona/{nombre}/chat
+PREFIJOS_ADMISION = {"/persona/": "chat"}
+limites_admision = crear_limites()
+
+def _chat_ocupado() -> bool:
+    """Los borradores de auditoría/plan ceden ante el chat: con cola o el cupo a media carga se postergan"""
+    chat = limites_admision["chat"]
+    return bool(chat._esperando) or chat.en_curso >= chat.concurrencia * borradores.CHAT_OCUPADO
+
+borradores.programador.ocupado_con(_chat_ocupado)
+app.add_middleware(AdmisionASGI, rutas=GRUPO_POR_RUTA, limites=limites_admision, prefijos=PREFIJOS_ADMISION)
+
+# ========================
+# 2c. Idempotency-Key en los POST (core/idempotencia.py)
+# ========================
+# por fuera de la admisión: un duplicado que espera al original no ocupa cupo
+app.add_middleware(IdempotenciaASGI)
+
 # ========================
 # 3. Middleware CORS
 # ========================
@@ -38,8 +98,62 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Request-ID", "Idempotent-Replayed"],
 )
 
+# ========================
+# 3b. Middleware de métricas y trazas (latencia y errores por endpoint y agente)
+# ========================
+AGENTE_POR_RUTA = {
+    "/chat": "chat",
+    "/user/{user_id}/memory": "chat",
+    "/reset": "chat",
+    "/user/{user_id}/reset": "chat",
+    "/chat1": "chat1",
+    "/chat2": "chat2",
+    "/user2/{user_id}/memory": "chat2",
+    "/reset2": "chat2",
+    "/user2/{user_id}/reset": "chat2",
+    "/generar_auditoria": "auditor",
+    "/generar_auditoria/json": "auditor",
+    "/generar_auditoria/stream": "auditor",
+    "/user/{user_id}/auditorias": "auditor",
+    "/generar_plan": "plan",
+    "/generar_plan/json": "plan",
+    "/generar_plan/stream": "plan",
+    "/user2/{user_id}/planes": "plan",
+}
+
+@app.middleware("http")
+async def medir_requests(request: Request, call_next):
+    inicio = time.perf_counter()
+    status = 500
+    request_id = request.headers.get("x-request-id")
+    with tracing.traza(f"{request.method} {request.url.path}", request_id=request_id) as raiz:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            response.headers["X-Request-ID"] = tracing.request_id_actual()
+            return response
+        finally:
+            route = request.scope.get("route")
+            endpoint = getattr(route, "path", None)
+            # las rutas no registradas (404) se agrupan para no disparar la cardinalidad
+            if endpoint is None:
+                endpoint = "desconocido"
+            agente = AGENTE_POR_RUTA.get(endpoint, "api")
+            if endpoint.startswith("/persona/{nombre}"):
+                # solo personas registradas, para acotar la cardinalidad de la etiqueta
+                nombre = request.path_params.get("nombre", "")
+                agente = nombre if motor_personas.existe(nombre) else "api"
+            metrics.http_latencia.observe(
+                time.perf_counter() - inicio,
+                agent=agente, endpoint=endpoint, method=request.method, status=status,
+            )
+            if status >= 500:
+                metrics.http_errores.inc(agent=agente, endpoint=endpoint)
+            raiz.set(agent=agente, endpoint=endpoint, status=status)
+
 # ========================
 # 4. Modelos de datos
 # ========================
@@ -47,15 +161,33 @@ class ChatRequest(BaseModel):
     mensaje: str
     rol: Optional[str] = "auditor"
     user_id: str  # obligatorio
+    delta: Optional[bool] = False  # True: solo el intercambio nuevo + version, sin historial
 
 class ChatResponse(BaseModel):
     respuesta: str
-    historial: dict
+    historial: Optional[dict] = None
+    intercambio: Optional[list] = None
+    version: Optional[int] = None
+
+class PaginaHistorial(BaseModel):
+    user_id: str
+    mensajes: List[dict]
+    siguiente: Optional[int] = None  # cursor `antes` de la página anterior
+    version: int
+
+def _respuesta_chat(request: ChatRequest, result: State, memory) -> ChatResponse:
+    """Historial completo (por defecto) o solo el delta del turno"""
+    respuesta = result.get("respuesta", "")
+    if request.delta:
+        # el delta se calcula dentro del turno (core/personas.py); leerlo aquí dejaría colar otro turno
+        return ChatResponse(respuesta=respuesta, **(result.get("delta") or delta_turno(memory)))
+    memoria = memory.load_memory_variables({})
+    return ChatResponse(respuesta=respuesta, historial=memoria if memoria is not None else {})
 
 # ========================
 # 5. Endpoints Chat principal (agent/chat.py)
 # ========================
-@app.post("/chat", response_model=ChatResponse)
+@app.post("/chat", response_model=ChatResponse, response_model_exclude_none=True)
 def chat(request: ChatRequest):
     """Chat principal basado en agent/chat.py"""
     if not request.user_id:
@@ -71,9 +203,10 @@ def chat(request: ChatRequest):
 
     try:
         result = agente_node(state)
-        memoria = get_memory(request.user_id).load_memory_variables({})
-        return ChatResponse(respuesta=result.get("respuesta", ""), historial=memoria)
+        return _respuesta_chat(request, result, get_memory(request.user_id))
 
+    except CuotaExcedida:
+        raise
     except Exception as e:
         print("❌ Error en /chat endpoint:")
         print(traceback.format_exc())
@@ -82,7 +215,7 @@ def chat(request: ChatRequest):
 # ========================
 # 6. Endpoints Chat alternativo (agent/chat1.py) - CORREGIDO
 # ========================
-@app.post("/chat1", response_model=ChatResponse)
+@app.post("/chat1", response_model=ChatResponse, response_model_exclude_none=True)
 def chat1(request: ChatRequest):
     """Chat alternativo basado en agent/chat1.py (proceso separado)"""
     if not request.user_id:
@@ -105,13 +238,11 @@ def chat1(request: ChatRequest):
         # Llamada al agente
         result = agente_node_alt(state)
 
-        # Obtener historial seguro
-        memoria = memory.load_memory_variables({})
-        if memoria is None:
-            memoria = {}
-
-        return ChatResponse(respuesta=result.get("respuesta", ""), historial=memoria)
+        # Obtener historial seguro (o solo el delta)
+        return _respuesta_chat(request, result, memory)
 
+    except CuotaExcedida:
+        raise
     except Exception as e:
         print("❌ Error en /chat1 endpoint:")
         print(traceback.format_exc())
@@ -120,9 +251,12 @@ def chat1(request: ChatRequest):
 # ========================
 # 7. Endpoint para obtener memoria por usuario
 # ========================
-@app.get("/user/{user_id}/memory")
-def get_user_memory(user_id: str):
+@app.get("/user/{user_id}/memory", response_class=RespuestaJSON)
+def get_user_memory(user_id: str, limite: Optional[int] = None, antes: Optional[int] = None):
+    """Con `limite` devuelve una página de mensajes; `antes` es el cursor de la página previa"""
     try:
+        if limite is not None:
+            return PaginaHistorial(user_id=user_id, **pagina_historial(get_memory(user_id), antes, limite))
         memoria = get_memory(user_id).load_memory_variables({})
         return {"user_id": user_id, "historial": memoria}
     except Exception as e:
@@ -135,21 +269,13 @@ def get_user_memory(user_id: str):
 # ========================
 @app.get("/reset")
 def reset_conversacion():
-    """Elimina el JSON temporal y reinicia memoria"""
+    """Vacía la transcripción y reinicia memoria"""
     try:
-        if os.path.exists(TEMP_JSON_PATH):
-            os.remove(TEMP_JSON_PATH)
-        with open(TEMP_JSON_PATH, "w", encoding="utf-8") as f:
-            json.dump([], f)
-
-        # Reiniciar memorias de ambos agentes
-        for get_mem_func in [get_memory, get_memory_alt]:
-            try:
-                usuarios = get_mem_func.__defaults__[0] if get_mem_func.__defaults__ else {}
-                for user_id in list(usuarios.keys()):
-                    get_mem_func(user_id).clear()
-            except Exception:
-                pass
+        transcripcion(TEMP_JSON_PATH).vaciar()
+
+        # Reiniciar memorias de ambos agentes: O(1), las sesiones viejas se liberan de forma perezosa
+        for almacen in [usuarios, usuarios_alt, indices, indices_alt]:
+            almacen.reset_global()
 
         return {"status": "ok", "message": "Conversaciones temporales reiniciadas"}
     except Exception as e:
@@ -157,6 +283,17 @@ def reset_conversacion():
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
+# ========================
+# 8b. Endpoint reset de la sesión de un usuario
+# ========================
+@app.post("/user/{user_id}/reset")
+def reset_usuario(user_id: str):
+    """Reinicia la memoria de un usuario en chat y chat1 sin tocar la transcripción compartida"""
+    reiniciado = [almacen.reset_usuario(user_id) for almacen in [usuarios, usuarios_alt]]
+    for almacen in [indices, indices_alt]:
+        almacen.reset_usuario(user_id)
+    return {"status": "ok", "user_id": user_id, "reiniciado": any(reiniciado)}
+
 # ========================
 # 9. Endpoint Auditoría
 # ========================
@@ -164,15 +301,17 @@ def reset_conversacion():
 def generar_auditoria(user_id: str):
     """Genera auditoría llamando al agente de auditoría"""
     try:
-        if not os.path.exists(TEMP_JSON_PATH):
+        if not transcripcion(TEMP_JSON_PATH).existe():
             raise HTTPException(status_code=404, detail="No hay conversación para generar auditoría")
 
-        resultado = auditor_llm()
+        resultado = auditor_llm(user_id=user_id)
         return {
             "mensaje": "✅ Auditoría generada correctamente",
             "auditoria": resultado
         }
 
+    except CuotaExcedida:
+        raise
     except Exception as e:
         print("❌ Error en /generar_auditoria endpoint:")
         print(traceback.format_exc())
@@ -183,32 +322,52 @@ def generar_auditoria(user_id: str):
 # ========================
 @app.get("/generar_auditoria/json")
 def generar_auditoria_json():
-    """Devuelve la auditoría directamente en formato JSON"""
+    """Devuelve la auditoría directamente en formato JSON (solo lectura: no marca intercambios como auditados)"""
     try:
-        if not os.path.exists(TEMP_JSON_PATH):
+        if not transcripcion(TEMP_JSON_PATH).existe():
             raise HTTPException(status_code=404, detail="No hay conversación para generar auditoría")
 
-        resultado = auditor_llm()
-        with open(TEMP_JSON_PATH, "w", encoding="utf-8") as f:
-            json.dump(resultado, f, ensure_ascii=False, indent=4)
-
+        # sin user_id lee los pendientes de todos: solo lectura, no consume el backlog de nadie
+        resultado = auditor_llm(confirmar=False)
         return resultado
 
+    except CuotaExcedida:
+        raise
     except Exception as e:
         print("❌ Error en /generar_auditoria/json endpoint:")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
     
+# ========================
+# 10b. Endpoint Auditoría en streaming por apartados
+# ========================
+@app.post("/generar_auditoria/stream")
+def generar_auditoria_stream(user_id: str):
+    """Genera los apartados de la auditoría en paralelo y los envía en orden a medida que terminan"""
+    if not transcripcion(TEMP_JSON_PATH).existe():
+        raise HTTPException(status_code=404, detail="No hay conversación para generar auditoría")
+    # la cuota se revisa antes de abrir el stream: con el 200 ya enviado no se puede responder 429
+    consumo.libro.verificar("auditor", user_id)
+    return StreamingResponse(auditor_llm_stream(user_id=user_id), media_type="text/plain; charset=utf-8")
+
+# ========================
+# 10c. Versiones de auditoría de un usuario
+# ========================
+@app.get("/user/{user_id}/auditorias")
+def versiones_auditoria(user_id: str):
+    """Versiones guardadas y qué rangos del historial alimentaron cada apartado"""
+    return {"user_id": user_id, "versiones": auditorias.versiones(user_id)}
+
 # ========================
 # 12. Importaciones de agentes secundarios (agent2)
 # ========================
-from agent2.chat import agente_node as agente2_node, get_memory as get_memory2, State as State2, TEMP_JSON_PATH as TEMP_JSON_PATH2
-from agent2.auditor import generar_auditoria as auditor_llm2
+from agent2.chat import agente_node as agente2_node, get_memory as get_memory2, State as State2, TEMP_JSON_PATH as TEMP_JSON_PATH2, usuarios2, indices2
+from agent2.auditor import generar_auditoria as auditor_llm2, generar_auditoria_stream as auditor_llm2_stream, auditorias as auditorias2
 
 # ========================
 # 13. Endpoints Chat principal (agent2/chat.py)
 # ========================
-@app.post("/chat2", response_model=ChatResponse)
+@app.post("/chat2", response_model=ChatResponse, response_model_exclude_none=True)
 def chat2(request: ChatRequest):
     """Chat principal basado en agent2/chat.py"""
     if not request.user_id:
@@ -224,9 +383,10 @@ def chat2(request: ChatRequest):
 
     try:
         result = agente2_node(state)
-        memoria = get_memory2(request.user_id).load_memory_variables({})
-        return ChatResponse(respuesta=result.get("respuesta", ""), historial=memoria)
+        return _respuesta_chat(request, result, get_memory2(request.user_id))
 
+    except CuotaExcedida:
+        raise
     except Exception as e:
         print("❌ Error en /chat2 endpoint:")
         print(traceback.format_exc())
@@ -236,10 +396,12 @@ def chat2(request: ChatRequest):
 # ========================
 # 14. Endpoint para obtener memoria (agent2)
 # ========================
-@app.get("/user2/{user_id}/memory")
-def get_user2_memory(user_id: str):
-    """Obtiene la memoria del usuario en agent2"""
+@app.get("/user2/{user_id}/memory", response_class=RespuestaJSON)
+def get_user2_memory(user_id: str, limite: Optional[int] = None, antes: Optional[int] = None):
+    """Obtiene la memoria del usuario en agent2 (paginada con `limite` y el cursor `antes`)"""
     try:
+        if limite is not None:
+            return PaginaHistorial(user_id=user_id, **pagina_historial(get_memory2(user_id), antes, limite))
         memoria = get_memory2(user_id).load_memory_variables({})
         return {"user_id": user_id, "historial": memoria}
     except Exception as e:
@@ -253,20 +415,13 @@ def get_user2_memory(user_id: str):
 # ========================
 @app.get("/reset2")
 def reset_conversacion2():
-    """Elimina el JSON temporal y reinicia memoria en agent2"""
+    """Vacía la transcripción y reinicia memoria en agent2"""
     try:
-        if os.path.exists(TEMP_JSON_PATH2):
-            os.remove(TEMP_JSON_PATH2)
-        with open(TEMP_JSON_PATH2, "w", encoding="utf-8") as f:
-            json.dump([], f)
+        transcripcion(TEMP_JSON_PATH2).vaciar()
 
-        # Reiniciar memorias del agente 2
-        try:
-            usuarios = get_memory2.__defaults__[0] if get_memory2.__defaults__ else {}
-            for user_id in list(usuarios.keys()):
-                get_memory2(user_id).clear()
-        except Exception:
-            pass
+        # Reiniciar memorias del agente 2 (O(1))
+        usuarios2.reset_global()
+        indices2.reset_global()
 
         return {"status": "ok", "message": "Conversaciones agent2 reiniciadas"}
     except Exception as e:
@@ -275,6 +430,16 @@ def reset_conversacion2():
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 
+# ========================
+# 15b. Endpoint reset de la sesión de un usuario (agent2)
+# ========================
+@app.post("/user2/{user_id}/reset")
+def reset_usuario2(user_id: str):
+    """Reinicia la memoria de un usuario en agent2 sin tocar la transcripción compartida"""
+    indices2.reset_usuario(user_id)
+    return {"status": "ok", "user_id": user_id, "reiniciado": usuarios2.reset_usuario(user_id)}
+
+
 # ========================
 # 16. Endpoint Documento Estratégico (agent2)
 # ========================
@@ -282,15 +447,17 @@ def reset_conversacion2():
 def generar_plan(user_id: str):
     """Genera el plan estratégico personalizado basado en agent2/auditor.py"""
     try:
-        if not os.path.exists(TEMP_JSON_PATH2):
+        if not transcripcion(TEMP_JSON_PATH2).existe():
             raise HTTPException(status_code=404, detail="No hay conversación para generar el plan")
 
-        resultado = auditor_llm2()
+        resultado = auditor_llm2(user_id=user_id)
         return {
             "mensaje": "✅ Plan estratégico generado correctamente",
             "plan": resultado
         }
 
+    except CuotaExcedida:
+        raise
     except Exception as e:
         print("❌ Error en /generar_plan endpoint:")
         print(traceback.format_exc())
@@ -302,26 +469,214 @@ def generar_plan(user_id: str):
 # ========================
 @app.get("/generar_plan/json")
 def generar_plan_json():
-    """Devuelve el plan estratégico directamente en formato JSON"""
+    """Devuelve el plan estratégico directamente en formato JSON (solo lectura: no marca intercambios como auditados)"""
     try:
-        if not os.path.exists(TEMP_JSON_PATH2):
+        if not transcripcion(TEMP_JSON_PATH2).existe():
             raise HTTPException(status_code=404, detail="No hay conversación para generar el plan")
 
-        resultado = auditor_llm2()
-        with open(TEMP_JSON_PATH2, "w", encoding="utf-8") as f:
-            json.dump(resultado, f, ensure_ascii=False, indent=4)
-
+        # sin user_id lee los pendientes de todos: solo lectura, no consume el backlog de nadie
+        resultado = auditor_llm2(confirmar=False)
         return resultado
 
+    except CuotaExcedida:
+        raise
     except Exception as e:
         print("❌ Error en /generar_plan/json endpoint:")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 
+# ========================
+# 17b. Endpoint Documento Estratégico en streaming por apartados (agent2)
+# ========================
+@app.post("/generar_plan/stream")
+def generar_plan_stream(user_id: str):
+    """Genera los apartados del plan en paralelo y los envía en orden a medida que terminan"""
+    if not transcripcion(TEMP_JSON_PATH2).existe():
+        raise HTTPException(status_code=404, detail="No hay conversación para generar el plan")
+    consumo.libro.verificar("plan", user_id)
+    return StreamingResponse(auditor_llm2_stream(user_id=user_id), media_type="text/plain; charset=utf-8")
+
+# ========================
+# 17c. Versiones del plan de un usuario (agent2)
+# ========================
+@app.get("/user2/{user_id}/planes")
+def versiones_plan(user_id: str):
+    """Versiones guardadas y qué rangos del historial alimentaron cada apartado"""
+    return {"user_id": user_id, "versiones": auditorias2.versiones(user_id)}
+
+
+# ========================
+# 18. Estado del pool de API keys de Groq
+# ========================
+@app.get("/estado/keys")
+def estado_keys():
+    """Cuota restante, cooldown y uso de cada API key del pool"""
+    return {"keys": pool.estado()}
+
+
+# ========================
+# 18b. Estado del control de admisión
+# ========================
+@app.get("/estado/admision")
+def estado_admision():
+    """Cupo, requests en curso y en espera por grupo de rutas"""
+    return {grupo: limite.estado() for grupo, limite in limites_admision.items()}
+
+
+# ========================
+# 18c. Consumo de tokens por usuario, agente y modelo (core/consumo.py)
+# ========================
+@app.get("/user/{user_id}/consumo")
+def consumo_usuario(user_id: str, dias: int = 7):
+    """Tokens del usuario por día, agente y modelo, y estado de su cuota diaria"""
+    return consumo.libro.usuario(user_id, dias)
+
+@app.get("/consumo")
+def consumo_resumen(dias: int = 1, top: int = 20):
+    """Totales por agente y modelo y usuarios que más consumen"""
+    return consumo.libro.resumen(dias, top)
+
+
+# ========================
+# 18d. Borradores de auditoría/plan en segundo plano
+# ========================
+@app.get("/estado/borradores")
+def estado_borradores():
+    """Plazos de inactividad programados, borradores redactándose y listos por agente"""
+    return borradores.estado()
+
+
+# ========================
+# 19. Métricas en formato Prometheus
+# ========================
+@app.get("/metrics")
+def metricas():
+    """Histogramas de latencia, tokens, persistencia y tamaño de memoria por agente"""
+    return Response(content=metrics.registro.exponer(), media_type=metrics.CONTENT_TYPE)
+
+
+# ========================
+# 20. Canal WebSocket por agente (una conexión por sesión, ver core/canal.py)
+# ========================
+@app.websocket("/ws/chat")
+async def ws_chat(websocket: WebSocket):
+    await CanalChat(websocket, "chat", agente_node, get_memory).atender()
+
+@app.websocket("/ws/chat1")
+async def ws_chat1(websocket: WebSocket):
+    await CanalChat(websocket, "chat1", agente_node_alt, get_memory_alt).atender()
+
+@app.websocket("/ws/chat2")
+async def ws_chat2(websocket: WebSocket):
+    await CanalChat(websocket, "chat2", agente2_node, get_memory2).atender()
+
+
+# ========================
+# 20b. Personas declaradas en configuración (core/personas.py)
+# ========================
+# chat, chat1 y chat2 son personas de código con sus rutas históricas; las de
+# personas/*.json se cargan y recargan en caliente y se sirven por nombre.
+def _agente_persona(nombre: str):
+    try:
+        return motor_personas.obtener(nombre)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No existe la persona '{nombre}'")
+
+@app.get("/personas")
+def listar_personas():
+    """Personas disponibles y su configuración (sin el texto del prompt)"""
+    return {"personas": motor_personas.describir()}
+
+@app.post("/personas/recargar")
+def recargar_personas():
+    """Relee personas/*.json sin esperar a la revisión periódica"""
+    return {"status": "ok", "cambios": motor_personas.revisar(forzar=True)}
+
+@app.post("/persona/{nombre}/chat", response_model=ChatResponse, response_model_exclude_none=True)
+def chat_persona(nombre: str, request: ChatRequest):
+    """Turno de chat con cualquier persona registrada"""
+    agente = _agente_persona(nombre)
+    if not request.user_id:
+        raise HTTPException(status_code=400, detail="user_id es obligatorio")
+
+    state: State = {
+        "mensaje": request.mensaje,
+        "rol": request.rol,
+        "historial": "",
+        "respuesta": "",
+        "user_id": request.user_id
+    }
+
+    try:
+        result = agente.turno(state)
+        return _respuesta_chat(request, result, agente.usuarios.obtener(request.user_id))
+
+    except CuotaExcedida:
+        raise
+    except Exception as e:
+        print(f"❌ Error en /persona/{nombre}/chat endpoint:")
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+@app.get("/persona/{nombre}/user/{user_id}/memory", response_class=RespuestaJSON)
+def memoria_persona(nombre: str, user_id: str, limite: int = 50, antes: Optional[int] = None):
+    """Historial paginado de un usuario con una persona"""
+    agente = _agente_persona(nombre)
+    return PaginaHistorial(user_id=user_id, **pagina_historial(agente.usuarios.obtener(user_id), antes, limite))
+
+@app.websocket("/ws/persona/{nombre}")
+async def ws_persona(websocket: WebSocket, nombre: str):
+    if not motor_personas.existe(nombre):
+        await websocket.close(code=1008)
+        return
+    await CanalChat(
+        websocket, nombre,
+        lambda state: motor_personas.obtener(nombre).turno(state),
+        lambda user_id: motor_personas.usuarios(nombre).obtener(user_id),
+    ).atender()
+
+
+# ========================
+# 21. Sondas de vida y preparación
+# ========================
+def _persistencia_escribible():
+    for archivo in (TEMP_JSON_PATH, TEMP_JSON_PATH2):
+        carpeta = transcripcion(archivo).ruta
+        if not os.access(carpeta, os.W_OK):
+            raise PermissionError(f"sin permiso de escritura en {carpeta}")
+
+servidor.estado.al_arrancar("clientes_llm", pool.precalentar)
+servidor.estado.al_arrancar("persistencia", _persistencia_escribible)
+if inferencia_local.PRECARGAR:
+    # el fallback en CPU queda cargado antes de la primera caída de Groq
+    servidor.estado.al_arrancar("modelo_local", inferencia_local.precargar)
+# reinicio en caliente: las sesiones vuelven perezosamente de la última instantánea
+# (GLY_INSTANTANEA) y se guarda una final con los turnos ya drenados
+servidor.estado.al_arrancar("instantaneas", instantaneas.arrancar)
+servidor.estado.al_arrancar("compactacion", transcripciones.arrancar_compactacion)
+servidor.estado.al_arrancar("consumo", consumo.libro.arrancar)
+servidor.estado.al_apagar("consumo", consumo.libro.volcar)
+servidor.estado.al_apagar("instantaneas", instantaneas.detener)
+
+@app.get("/health")
+def salud():
+    """Liveness: el proceso responde"""
+    return servidor.estado.salud()
+
+@app.get("/ready")
+def preparacion():
+    """Readiness: 503 mientras precalienta, si un paso falló o durante el drenado"""
+    detalle = servidor.estado.preparacion()
+    if not detalle["listo"]:
+        return JSONResponse(detalle, status_code=503)
+    return detalle
+
+
 # ========================
 # 11. Entrypoint Uvicorn
 # ========================
+# Producción: GLY_WORKERS, GLY_DRENADO_S, GLY_HOST/GLY_PORT; desarrollo: GLY_RECARGA=1
 if __name__ == "__main__":
     print("🚀 Servidor GLYNNE API corriendo con soporte para múltiples agentes")
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    servidor.ejecutar(app, "main:app")
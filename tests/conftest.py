@@ -0,0 +1,48 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+# el pool compartido (core/key_pool.py) se crea al importar: sin keys de Groq
+# en el entorno, las pruebas usan el proveedor falso y un libro de consumo temporal
+os.environ.setdefault("GLY_LLM_PROVIDER", "fake")
+os.environ.setdefault("GLY_CONSUMO_DIR", tempfile.mkdtemp(prefix="gly-consumo-"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+import socket
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def servidor_real():
+    """
+    servidor_real(app) -> URL base de un uvicorn de verdad en un hilo, para lo
+    que TestClient no reproduce (el event loop compartido entre requests).
+    """
+    import uvicorn
+
+    servidores = []
+
+    def arrancar(app) -> str:
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        servidor = uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan="off"))
+        hilo = threading.Thread(target=servidor.run, kwargs={"sockets": [sock]}, daemon=True)
+        hilo.start()
+        servidores.append((servidor, hilo))
+        limite = time.monotonic() + 5
+        while not servidor.started:
+            if time.monotonic() > limite:
+                raise RuntimeError("uvicorn no arrancó")
+            time.sleep(0.01)
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+    yield arrancar
+    for servidor, hilo in servidores:
+        servidor.should_exit = True
+        hilo.join(5)
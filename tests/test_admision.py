@@ -0,0 +1,84 @@
+# tests/test_admision.py
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core.admision import AdmisionASGI, Limite, Rechazo
+
+
+def test_cola_llena_da_429_con_retry_after():
+    async def escenario():
+        limite = Limite("chat", concurrencia=1, cola=1, espera=5.0)
+        await limite.adquirir()  # ocupa el único cupo
+        en_cola = asyncio.ensure_future(limite.adquirir())
+        await asyncio.sleep(0)
+        assert limite.estado()["esperando"] == 1
+
+        with pytest.raises(Rechazo) as rechazo:
+            await limite.adquirir()
+        assert (rechazo.value.status, rechazo.value.motivo) == (429, "cola_llena")
+        assert rechazo.value.retry_after >= 1
+
+        # al liberar, el cupo pasa directo al que esperaba
+        limite.liberar()
+        await en_cola
+        assert limite.en_curso == 1
+        limite.liberar()
+        assert limite.estado()["en_curso"] == limite.estado()["esperando"] == 0
+
+    asyncio.run(escenario())
+
+
+def test_espera_estimada_mayor_al_plazo_da_503_sin_encolar():
+    async def escenario():
+        # servicio medio de 1s con un cupo: el primero en cola esperaría ~1s > 0.5s
+        limite = Limite("documento", concurrencia=1, cola=10, espera=0.5)
+        await limite.adquirir()
+        with pytest.raises(Rechazo) as rechazo:
+            await limite.adquirir()
+        assert (rechazo.value.status, rechazo.value.motivo) == (503, "espera_estimada")
+        assert limite.estado()["esperando"] == 0
+
+    asyncio.run(escenario())
+
+
+def test_plazo_vencido_en_cola_da_503():
+    async def escenario():
+        limite = Limite("chat", concurrencia=1, cola=10, espera=0.05)
+        limite._servicio = 0.01  # servicio medio bajo: la estimación deja encolar
+        limite.en_curso = 1
+        with pytest.raises(Rechazo) as rechazo:
+            await limite.adquirir()
+        assert (rechazo.value.status, rechazo.value.motivo) == (503, "plazo_vencido")
+        assert limite.estado()["esperando"] == 0
+
+    asyncio.run(escenario())
+
+
+def test_middleware_responde_429_con_cabecera_retry_after():
+    app = FastAPI()
+
+    @app.post("/chat")
+    def chat():
+        return {"ok": True}
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    limite = Limite("chat", concurrencia=1, cola=0, espera=5.0)
+    app.add_middleware(AdmisionASGI, rutas={"/chat": "chat"}, limites={"chat": limite})
+    cliente = TestClient(app)
+
+    assert cliente.post("/chat").status_code == 200
+    assert limite.en_curso == 0  # el cupo se devuelve al terminar la respuesta
+
+    limite.en_curso = 1  # cupo ocupado por otro request, sin cola
+    respuesta = cliente.post("/chat")
+    assert respuesta.status_code == 429
+    assert int(respuesta.headers["retry-after"]) >= 1
+    assert respuesta.json()["motivo"] == "cola_llena"
+    # las rutas fuera de la admisión no se ven afectadas
+    assert cliente.get("/health").status_code == 200
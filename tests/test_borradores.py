@@ -0,0 +1,112 @@
+# tests/test_borradores.py
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from core import borradores
+from core.borradores import Borradores, huella_pendientes
+
+
+@pytest.fixture(autouse=True)
+def inactividad_corta(monkeypatch):
+    monkeypatch.setattr(borradores, "INACTIVIDAD", 0.05)
+
+
+def _esperar(condicion, plazo: float = 5.0):
+    limite = time.monotonic() + plazo
+    while not condicion():
+        if time.monotonic() > limite:
+            raise AssertionError("la condición no se cumplió a tiempo")
+        time.sleep(0.01)
+
+
+class Auditor:
+    """Las tres funciones que aporta un auditor, sobre una lista en memoria"""
+
+    def __init__(self):
+        self.intercambios = {"u1": [{"user": f"m{i}", "ai": "ok", "ts": i} for i in range(3)]}
+        self.redacciones = 0
+        self.cancelaciones = 0
+        self.pausa = None  # Event: la redacción espera hasta que se active
+        self.empezada = threading.Event()
+        self.terminada = threading.Event()
+
+    def leer(self, user_id):
+        return list(self.intercambios.get(user_id, []))
+
+    def clave(self, user_id, nuevos, modo):
+        return (user_id, huella_pendientes(nuevos), modo or "completo")
+
+    def redactar(self, user_id, nuevos, modo, seguir):
+        self.empezada.set()
+        try:
+            if self.pausa is not None:
+                self.pausa.wait(5)
+            if not seguir():
+                self.cancelaciones += 1
+                return None
+            self.redacciones += 1
+            return f"auditoría de {len(nuevos)}", [SimpleNamespace(huella="h")], modo or "completo"
+        finally:
+            self.terminada.set()
+
+    def borradores(self) -> Borradores:
+        return Borradores(f"test-{id(self)}", self.leer, self.clave, self.redactar)
+
+
+def test_borrador_se_entrega_solo_para_la_misma_entrada():
+    auditor = Auditor()
+    b = auditor.borradores()
+    b.actividad("u1")
+    _esperar(lambda: "u1" in b._listos)
+
+    nuevos = auditor.leer("u1")
+    assert b.tomar("u1", nuevos + [{"user": "otro", "ai": "ok", "ts": 9}], None) is None  # entrada distinta
+
+    b.actividad("u1")
+    _esperar(lambda: "u1" in b._listos)
+    borrador = b.tomar("u1", nuevos, None)
+    assert borrador is not None and borrador.texto == "auditoría de 3"
+    assert b.tomar("u1", nuevos, None) is None  # se consume al entregarlo
+
+
+def test_turno_nuevo_invalida_el_borrador_listo():
+    auditor = Auditor()
+    b = auditor.borradores()
+    b.actividad("u1")
+    _esperar(lambda: "u1" in b._listos)
+
+    b.actividad("u1")  # el usuario volvió a escribir
+
+    assert "u1" not in b._listos
+    assert b.tomar("u1", auditor.leer("u1"), None) is None
+
+
+def test_turno_nuevo_cancela_la_redaccion_en_curso():
+    auditor = Auditor()
+    auditor.pausa = threading.Event()
+    b = auditor.borradores()
+    b.actividad("u1")
+    assert auditor.empezada.wait(5)  # venció la inactividad: la redacción espera en `pausa`
+
+    b.actividad("u1")
+    auditor.pausa.set()
+    assert auditor.terminada.wait(5)
+
+    assert auditor.cancelaciones == 1
+    # el turno reprogramó la redacción: el borrador que queda es el de la entrada vigente
+    _esperar(lambda: "u1" in b._listos)
+    assert auditor.redacciones == 1
+
+
+def test_sin_intercambios_suficientes_no_redacta():
+    auditor = Auditor()
+    auditor.intercambios["u1"] = auditor.intercambios["u1"][:1]
+    b = auditor.borradores()
+    b.actividad("u1")
+    time.sleep(0.3)
+
+    assert auditor.redacciones == 0
+    assert "u1" not in b._listos
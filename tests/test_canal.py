@@ -0,0 +1,54 @@
+# tests/test_canal.py
+from types import SimpleNamespace
+
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+
+from core.canal import CanalChat
+
+
+class Memoria:
+    def __init__(self):
+        self.chat_memory = SimpleNamespace(messages=[])
+
+    def load_memory_variables(self, _):
+        return {"historial": f"{len(self.chat_memory.messages)} mensajes"}
+
+
+def _app():
+    app = FastAPI()
+    memorias = {}
+
+    def memoria(user_id):
+        return memorias.setdefault(user_id, Memoria())
+
+    def nodo(state):
+        memoria(state["user_id"]).chat_memory.messages += ["humano", "ia"]
+        state["respuesta"] = "eco: " + state["mensaje"]
+        return state
+
+    @app.websocket("/ws")
+    async def ws(websocket: WebSocket):
+        await CanalChat(websocket, "test", nodo, memoria).atender()
+
+    return app
+
+
+def test_turno_por_websocket():
+    with TestClient(_app()).websocket_connect("/ws?user_id=u1") as ws:
+        assert ws.receive_json() == {"tipo": "listo", "user_id": "u1", "mensajes": 0}
+        ws.send_json({"tipo": "mensaje", "mensaje": "hola"})
+        fin = ws.receive_json()
+        assert fin == {"tipo": "fin", "respuesta": "eco: hola", "mensajes": 2}
+
+
+def test_frame_invalido_responde_error_y_sigue_abierto():
+    with TestClient(_app()).websocket_connect("/ws?user_id=u1") as ws:
+        ws.receive_json()
+        ws.send_text("esto no es json")
+        assert ws.receive_json() == {"tipo": "error", "detalle": "JSON inválido"}
+        ws.send_bytes(b"\x00\x01")
+        assert ws.receive_json() == {"tipo": "error", "detalle": "JSON inválido"}
+
+        ws.send_json({"tipo": "historial"})
+        assert ws.receive_json() == {"tipo": "historial", "historial": {"historial": "0 mensajes"}}
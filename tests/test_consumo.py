@@ -0,0 +1,79 @@
+# tests/test_consumo.py
+import importlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+from core import consumo
+from core.consumo import CuotaExcedida, LibroConsumo
+
+
+@pytest.fixture
+def libro(tmp_path, monkeypatch):
+    """Libro propio con cuota de 100 tokens por día, en lugar del compartido"""
+    nuevo = LibroConsumo(directorio=str(tmp_path / "consumo"), cuota_dia=100, cuotas="")
+    monkeypatch.setattr(consumo, "libro", nuevo)
+    return nuevo
+
+
+def test_cuota_agotada_rechaza_el_siguiente_turno(libro):
+    with consumo.usuario("u1", agente="chat"):
+        libro.registrar("chat", "fake", 60, 50)
+
+    with pytest.raises(CuotaExcedida) as error:
+        with consumo.usuario("u1", agente="chat"):
+            pass
+    assert (error.value.usados, error.value.limite) == (110, 100)
+    assert error.value.reintentar > 0
+    # la cuota es por usuario
+    with consumo.usuario("u2", agente="chat"):
+        pass
+
+
+def test_cuota_agotada_responde_429_con_retry_after(libro, tmp_path, monkeypatch):
+    # main.py importa los agentes: transcripciones y demás archivos relativos van a tmp_path
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("HUGGINGFACE_API_KEY2", "test")
+    main = importlib.import_module("main")
+    cliente = TestClient(main.app)
+    libro.registrar("chat", "fake", 100, 0, user_id="u1")
+
+    respuesta = cliente.post("/chat", json={"mensaje": "hola", "rol": "usuario", "user_id": "u1"})
+
+    assert respuesta.status_code == 429
+    assert int(respuesta.headers["retry-after"]) >= 1
+    assert respuesta.json()["limite"] == 100
+
+
+def test_gasto_de_borrador_no_cuenta_hasta_trasladarlo(libro):
+    with consumo.usuario("u1"), consumo.especulativo() as gasto:
+        libro.registrar("auditor", "fake", 100, 50)
+
+    datos = libro.usuario("u1")
+    assert datos["cuota"]["usados_hoy"] == 0
+    assert [f["agent"] for f in datos["dias"][0]["detalle"]] == ["auditor:borrador"]
+    assert libro.resumen()["tokens_especulativos"] == 150
+    libro.verificar("chat", "u1")  # el borrador no agota la cuota
+
+    libro.trasladar(gasto, "u1")
+
+    datos = libro.usuario("u1")
+    assert datos["cuota"]["usados_hoy"] == 150
+    assert [(f["agent"], f["prompt"], f["completion"]) for f in datos["dias"][0]["detalle"]] == [("auditor", 100, 50)]
+    assert libro.resumen()["tokens_especulativos"] == 0
+    with pytest.raises(CuotaExcedida):
+        libro.verificar("chat", "u1")
+    libro.trasladar(gasto, "u1")  # un segundo traslado no duplica
+    assert libro.usuario("u1")["cuota"]["usados_hoy"] == 150
+
+
+def test_volcar_comparte_el_total_con_otro_worker(libro):
+    libro.registrar("chat", "fake", 30, 20, user_id="u1")
+    libro.volcar()
+
+    otro = LibroConsumo(directorio=libro.directorio, cuota_dia=100, cuotas="")
+    otro.registrar("chat", "fake", 10, 0, user_id="u1")
+    otro.volcar()
+    libro.volcar()
+
+    assert libro.usuario("u1")["cuota"]["usados_hoy"] == 60
@@ -0,0 +1,81 @@
+# tests/test_idempotencia.py
+import time
+import threading
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from core.idempotencia import IdempotenciaASGI
+
+
+def _app():
+    app = FastAPI()
+    app.state.llamadas = 0
+
+    @app.post("/eco")
+    def eco(datos: dict):
+        app.state.llamadas += 1
+        return {"llamada": app.state.llamadas, "datos": datos}
+
+    @app.post("/stream")
+    def stream():
+        app.state.llamadas += 1
+
+        def trozos():
+            for i in range(5):
+                time.sleep(0.1)
+                yield f"parte {i}\n"
+
+        return StreamingResponse(trozos(), media_type="text/plain")
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    app.add_middleware(IdempotenciaASGI)
+    return app
+
+
+def test_post_con_key_se_repite_sin_volver_a_ejecutar():
+    app = _app()
+    cliente = TestClient(app)
+    cabeceras = {"Idempotency-Key": "k1"}
+
+    primera = cliente.post("/eco", json={"a": 1}, headers=cabeceras)
+    segunda = cliente.post("/eco", json={"a": 1}, headers=cabeceras)
+
+    assert primera.json() == segunda.json() == {"llamada": 1, "datos": {"a": 1}}
+    assert segunda.headers["idempotent-replayed"] == "true"
+    assert app.state.llamadas == 1
+
+
+def test_misma_key_con_otro_cuerpo_da_422():
+    cliente = TestClient(_app())
+    cliente.post("/eco", json={"a": 1}, headers={"Idempotency-Key": "k1"})
+
+    assert cliente.post("/eco", json={"a": 2}, headers={"Idempotency-Key": "k1"}).status_code == 422
+
+
+def test_stream_con_key_no_bloquea_el_servidor(servidor_real):
+    app = _app()
+    url = servidor_real(app)
+    resultado = {}
+
+    def pedir_stream():
+        r = httpx.post(f"{url}/stream", headers={"Idempotency-Key": "s1"}, timeout=10)
+        resultado["texto"] = r.text
+
+    hilo = threading.Thread(target=pedir_stream)
+    hilo.start()
+    time.sleep(0.15)  # el stream está en curso y StreamingResponse escucha el disconnect
+
+    # con el receive() girando sin ceder, el event loop no atendería este request
+    assert httpx.get(f"{url}/health", timeout=2).json() == {"status": "ok"}
+    hilo.join(10)
+    assert resultado["texto"].count("parte") == 5
+
+    repetida = httpx.post(f"{url}/stream", headers={"Idempotency-Key": "s1"}, timeout=5)
+    assert repetida.text == resultado["texto"]
+    assert app.state.llamadas == 1
@@ -0,0 +1,84 @@
+# tests/test_inferencia_local.py
+import time
+
+import pytest
+
+from core.fake_llm import MotorLocalFalso
+from core.inferencia_local import ProgramadorLotes
+
+
+class MotorRegistrado(MotorLocalFalso):
+    """Motor falso que anota el tamaño de cada lote decodificado"""
+
+    def __init__(self, paso: float = 0.005):
+        super().__init__(paso=paso)
+        self.lotes = []
+
+    def decodificar(self, secuencias):
+        self.lotes.append(len(secuencias))
+        super().decodificar(secuencias)
+
+
+def _esperar(condicion, plazo: float = 5.0):
+    limite = time.monotonic() + plazo
+    while not condicion():
+        if time.monotonic() > limite:
+            raise AssertionError("la condición no se cumplió a tiempo")
+        time.sleep(0.005)
+
+
+def test_genera_max_nuevos_tokens():
+    programador = ProgramadorLotes(MotorRegistrado(), max_lote=4, espera=0)
+    assert len(programador.generar("hola mundo", max_nuevos=6, timeout=5).split()) == 6
+
+
+def test_lote_no_supera_max_lote():
+    motor = MotorRegistrado()
+    programador = ProgramadorLotes(motor, max_lote=2, espera=0.05)
+    secuencias = [programador.enviar("hola", max_nuevos=5) for _ in range(5)]
+
+    for sec in secuencias:
+        assert sec.listo.wait(5)
+        assert sec.error is None
+    assert max(motor.lotes) == 2
+
+
+def test_admite_secuencias_con_el_lote_en_marcha():
+    motor = MotorRegistrado()
+    programador = ProgramadorLotes(motor, max_lote=4, espera=0)
+    larga = programador.enviar("hola", max_nuevos=200)
+    _esperar(lambda: motor.pasos >= 3)
+
+    corta = programador.enviar("hola", max_nuevos=3)
+
+    # la corta entra al lote en el próximo paso: termina sin esperar a la larga
+    assert corta.listo.wait(5)
+    assert not larga.listo.is_set()
+    assert 2 in motor.lotes
+    larga.cancelada = True
+
+
+def test_secuencia_cancelada_sale_del_lote():
+    motor = MotorRegistrado()
+    programador = ProgramadorLotes(motor, max_lote=4, espera=0)
+    sec = programador.enviar("hola", max_nuevos=10_000)
+    _esperar(lambda: programador.activas == 1)
+
+    sec.cancelada = True
+
+    _esperar(lambda: programador.activas == 0)
+    pasos = motor.pasos
+    time.sleep(0.05)
+    assert motor.pasos == pasos  # sin secuencias activas no se decodifica
+    assert not sec.listo.is_set()
+
+
+def test_timeout_cancela_la_secuencia():
+    programador = ProgramadorLotes(MotorRegistrado(), max_lote=4, espera=0)
+
+    with pytest.raises(TimeoutError):
+        programador.generar("hola", max_nuevos=10_000, timeout=0.05)
+
+    _esperar(lambda: programador.activas == 0)
+    # el programador sigue atendiendo después de descartarla
+    assert programador.generar("hola", max_nuevos=2, timeout=5)
@@ -0,0 +1,79 @@
+# tests/test_instantaneas.py
+from langchain.memory import ConversationBufferMemory
+from langchain.schema import AIMessage, HumanMessage
+
+from core.instantaneas import GestorInstantaneas, Instantanea, clave_de, codificar, escribir
+from core.sesiones import AlmacenSesiones
+
+
+def _almacen():
+    return AlmacenSesiones(lambda: ConversationBufferMemory(memory_key="historial", input_key="mensaje"))
+
+
+def _arrancar(ruta):
+    """Un proceso nuevo: gestor y almacén vacíos sobre la misma instantánea"""
+    gestor = GestorInstantaneas(ruta=ruta, intervalo=0)
+    usuarios = _almacen()
+    gestor.registrar("chat", usuarios)
+    gestor.arrancar()
+    return gestor, usuarios
+
+
+def test_guardar_y_restaurar_tras_reiniciar(tmp_path):
+    ruta = str(tmp_path / "sesiones.snap")
+    gestor, usuarios = _arrancar(ruta)
+    usuarios.obtener("u1").chat_memory.messages = [HumanMessage(content="hola"), AIMessage(content="¿en qué te ayudo?")]
+    usuarios.obtener("u2").chat_memory.messages = [HumanMessage(content="otra sesión")]
+    usuarios.obtener("vacio")  # sin mensajes: no se guarda
+
+    assert gestor.guardar() == 2
+
+    _, restaurados = _arrancar(ruta)
+    mensajes = restaurados.obtener("u1").chat_memory.messages
+    assert [(m.type, m.content) for m in mensajes] == [("human", "hola"), ("ai", "¿en qué te ayudo?")]
+    assert len(restaurados.obtener("u2").chat_memory.messages) == 1
+    assert restaurados.obtener("nuevo").chat_memory.messages == []
+
+
+def test_reinicio_descarta_la_sesion_guardada(tmp_path):
+    ruta = str(tmp_path / "sesiones.snap")
+    gestor, usuarios = _arrancar(ruta)
+    usuarios.obtener("u1").chat_memory.messages = [HumanMessage(content="hola")]
+    gestor.guardar()
+
+    gestor, restaurados = _arrancar(ruta)
+    restaurados.reset_usuario("u1")  # antes de que vuelva: la guardada ya no vale
+    assert restaurados.obtener("u1").chat_memory.messages == []
+    assert gestor.guardar() == 0
+
+
+def test_instantanea_retirada_sigue_abierta_mientras_hay_lector(tmp_path):
+    ruta = str(tmp_path / "sesiones.snap")
+    clave = clave_de("chat", "u1")
+    escribir(ruta, [(clave, codificar(clave, [("human", "hola")]), 0, 1)])
+    snap = Instantanea(ruta)
+
+    snap.tomar()
+    snap.retirar()  # reemplazada por una más nueva con un lector en curso
+    assert not snap._mapa.closed
+    assert snap.mensajes(clave) == [("human", "hola")]
+
+    snap.soltar()
+    assert snap._mapa.closed
+
+
+def test_guardar_no_cierra_la_instantanea_de_un_lector(tmp_path):
+    ruta = str(tmp_path / "sesiones.snap")
+    gestor, usuarios = _arrancar(ruta)
+    usuarios.obtener("u1").chat_memory.messages = [HumanMessage(content="hola")]
+    gestor.guardar()
+    lectura = gestor._instantanea()
+    lectura.tomar()
+
+    usuarios.obtener("u1").chat_memory.messages.append(AIMessage(content="respuesta"))
+    gestor.guardar()  # reemplaza la instantánea abierta
+
+    assert gestor._instantanea() is not lectura
+    assert lectura.mensajes(clave_de("chat", "u1")) == [("human", "hola")]
+    lectura.soltar()
+    assert lectura._mapa.closed
@@ -0,0 +1,100 @@
+# tests/test_key_pool.py
+import pytest
+
+from core.fake_llm import FakeGroqProvider, FakeRateLimitError
+from core.key_pool import KeyPool, PooledLLM
+
+
+class Reloj:
+    """Reloj manual para el cooldown del pool"""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self) -> float:
+        return self.ahora
+
+
+def _pool(keys, limite_requests=30):
+    proveedor = FakeGroqProvider(keys, limite_requests=limite_requests)
+    reloj = Reloj()
+    return proveedor, KeyPool(keys, factory=proveedor.factory, reloj=reloj), reloj
+
+
+def test_sin_cabeceras_rota_en_round_robin():
+    _, pool, _ = _pool(["k1", "k2", "k3"])
+    elegidas = []
+    for _ in range(6):
+        key = pool.elegir()
+        pool.liberar(key)
+        elegidas.append(key)
+    assert elegidas == ["k1", "k2", "k3", "k1", "k2", "k3"]
+
+
+def test_elige_la_key_con_mas_cuota_restante():
+    _, pool, _ = _pool(["k1", "k2"])
+    pool.registrar_cabeceras("k1", {
+        "x-ratelimit-limit-requests": "30",
+        "x-ratelimit-remaining-requests": "2",
+        "x-ratelimit-reset-requests": "40s",
+    })
+    for _ in range(4):
+        key = pool.elegir()
+        pool.liberar(key)
+        assert key == "k2"
+
+
+def test_invoke_rota_de_key_tras_un_429():
+    proveedor, pool, reloj = _pool(["k1", "k2"], limite_requests=1)
+    proveedor._consumir("k1")  # k1 sin cuota en el proveedor, el pool aún no lo sabe
+    llm = PooledLLM(pool, agente="test", model="fake")
+
+    respuesta = llm.invoke("hola")
+
+    assert respuesta.content
+    k1, k2 = pool.estados["k1"], pool.estados["k2"]
+    assert k1.errores_429 == 1
+    # el cooldown sale del retry-after del 429 (lo que falta de la ventana de 60s)
+    assert 0 < k1.cooldown_hasta - reloj.ahora <= 60
+    assert k2.llamadas == 1
+    assert k1.en_vuelo == k2.en_vuelo == 0
+
+
+def test_key_en_cooldown_no_se_elige_hasta_que_vence():
+    _, pool, reloj = _pool(["k1", "k2"])
+    pool.registrar_429("k1", retry_after=5)
+    for _ in range(4):
+        key = pool.elegir()
+        pool.liberar(key)
+        assert key == "k2"
+
+    reloj.ahora += 5
+    elegidas = set()
+    for _ in range(2):
+        key = pool.elegir()
+        pool.liberar(key)
+        elegidas.add(key)
+    assert elegidas == {"k1", "k2"}
+
+
+def test_todas_las_keys_con_429_propaga_el_error():
+    proveedor, pool, _ = _pool(["k1", "k2"], limite_requests=1)
+    proveedor._consumir("k1")
+    proveedor._consumir("k2")
+    llm = PooledLLM(pool, agente="test", model="fake")
+
+    with pytest.raises(FakeRateLimitError):
+        llm.invoke("hola")
+    assert pool.estados["k1"].errores_429 == pool.estados["k2"].errores_429 == 1
+
+
+def test_stream_rota_de_key_antes_del_primer_chunk():
+    proveedor, pool, _ = _pool(["k1", "k2"], limite_requests=1)
+    proveedor._consumir("k1")
+    llm = PooledLLM(pool, agente="test", model="fake")
+
+    texto = "".join(chunk.content for chunk in llm.stream("hola"))
+
+    assert texto
+    assert pool.estados["k1"].errores_429 == 1
+    assert pool.estados["k1"].en_vuelo == pool.estados["k2"].en_vuelo == 0
@@ -0,0 +1,75 @@
+# tests/test_presupuesto.py
+from core.fake_llm import FakeGroqProvider
+from core.key_pool import KeyPool, PooledLLM
+from core.presupuesto import Presupuesto, _FIN_ORACION
+
+PROMPT = "Respuesta máxima: 30 palabras."
+
+
+def _llm(tokens_salida: int):
+    proveedor = FakeGroqProvider(["k1"], limite_requests=1000, tokens_salida=tokens_salida)
+    pool = KeyPool(["k1"], factory=proveedor.factory)
+    return PooledLLM(pool, agente="test", model="fake")
+
+
+def test_corta_en_el_primer_fin_de_oracion_tras_el_limite():
+    presupuesto = Presupuesto("test", PROMPT)
+    # max_tokens holgado: el corte lo tiene que hacer el conteo de palabras, no el proveedor
+    presupuesto.max_tokens = 2000
+
+    texto = presupuesto.envolver(_llm(tokens_salida=500)).invoke("hola").content
+
+    palabras = len(texto.split())
+    # el stream falso emite subpalabras: contarlas por chunk nunca llegaría al límite
+    assert 30 <= palabras < 30 + 15  # a lo sumo una oración más (las de FRASES tienen < 15 palabras)
+    assert _FIN_ORACION.search(texto)
+
+
+def test_recorta_a_oracion_completa_si_llega_a_max_tokens():
+    presupuesto = Presupuesto("test", PROMPT)
+    presupuesto.max_tokens = 30  # corta a mitad de frase, antes del límite de palabras
+
+    texto = presupuesto.envolver(_llm(tokens_salida=500)).invoke("hola").content
+
+    assert texto
+    assert len(texto.split()) < 30
+    assert _FIN_ORACION.search(texto)
+
+
+def test_sin_limite_en_el_prompt_no_usa_streaming():
+    presupuesto = Presupuesto("test", "Responde de forma breve.")
+    assert presupuesto.palabras is None
+
+    texto = presupuesto.envolver(_llm(tokens_salida=20)).invoke("hola").content
+
+    assert texto.startswith("Respuesta simulada")
+
+
+class _Chunks:
+    """LLM que emite los chunks dados, para fijar cómo se parten las palabras"""
+
+    model_name = "fijo"
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def stream(self, entrada, **kwargs):
+        from core.fake_llm import FakeChunk
+        for chunk in self.chunks:
+            yield FakeChunk(chunk)
+
+
+def test_cuenta_palabras_partidas_entre_chunks():
+    presupuesto = Presupuesto("test", "Máximo 3 palabras.")
+    chunks = ["Ho", "la", " mun", "do", " cru", "el", ".", " Sobra", " esto."]
+
+    texto = presupuesto.envolver(_Chunks(chunks)).invoke("hola").content
+
+    assert texto == "Hola mundo cruel."
+
+
+def test_chunk_de_solo_espacio_separa_palabras():
+    presupuesto = Presupuesto("test", "Máximo 2 palabras.")
+    chunks = ["Uno", " ", "dos", ".", " Sobra."]
+
+    assert presupuesto.envolver(_Chunks(chunks)).invoke("hola").content == "Uno dos."
@@ -0,0 +1,78 @@
+# tests/test_transcripciones.py
+import time
+
+from core.transcripciones import RETENCION, Transcripcion
+
+
+def _transcripcion(tmp_path) -> Transcripcion:
+    return Transcripcion("conversacion_test.json", raiz=str(tmp_path))
+
+
+def _textos(intercambios):
+    return [c["user"] for c in intercambios]
+
+
+def test_pendientes_y_consumir_avanzan_el_cursor(tmp_path):
+    t = _transcripcion(tmp_path)
+    for i in range(3):
+        t.guardar(f"u1-{i}", "ok", "u1")
+    t.guardar("otro", "ok", "u2")
+
+    pendientes = t.pendientes("u1")
+    assert _textos(pendientes) == ["u1-0", "u1-1", "u1-2"]
+
+    t.consumir(pendientes)
+    assert t.pendientes("u1") == []
+    t.guardar("u1-3", "ok", "u1")
+    assert _textos(t.pendientes("u1")) == ["u1-3"]
+    assert _textos(t.pendientes("u2")) == ["otro"]  # otro usuario no se ve afectado
+
+
+def test_consumir_desde_la_posicion_leida_no_salta_intercambios(tmp_path):
+    t = _transcripcion(tmp_path)
+    t.guardar("sin usuario", "ok")  # clave compartida "" (visible para todos)
+
+    # dos auditorías de usuarios distintos leen el mismo intercambio sin user_id
+    de_a, de_b = t.pendientes("a"), t.pendientes("b")
+    assert _textos(de_a) == _textos(de_b) == ["sin usuario"]
+    t.consumir(de_a)
+    t.guardar("nuevo sin usuario", "ok")
+    t.consumir(de_b)  # ya consumido por a: no debe avanzar sobre el nuevo
+
+    assert _textos(t.pendientes("a")) == ["nuevo sin usuario"]
+
+
+def test_cursor_sobrevive_a_la_poda_de_compactar(tmp_path):
+    t = _transcripcion(tmp_path)
+    viejo = time.time() - RETENCION - 3600
+    t.importar([{"user": f"viejo-{i}", "ai": "ok", "user_id": "u1", "ts": viejo + i} for i in range(3)])
+    t.consumir(t.pendientes("u1"))
+    for i in range(2):
+        t.guardar(f"nuevo-{i}", "ok", "u1")
+
+    # se lee antes de la poda y se consume después
+    pendientes = t.pendientes("u1")
+    assert _textos(pendientes) == ["nuevo-0", "nuevo-1"]
+    t.compactar(cerrar_abiertos=True)  # los 3 viejos ya auditados superan la retención
+
+    shard = t._shard_de("u1")
+    assert shard.podados() == {"u1": 3}
+    assert shard.cursores().get("u1", 0) == 0
+    assert _textos(t.historia("u1")) == ["nuevo-0", "nuevo-1"]
+
+    t.consumir(pendientes)
+    assert shard.cursores()["u1"] == 2
+    assert t.pendientes("u1") == []
+    t.guardar("nuevo-2", "ok", "u1")
+    assert _textos(t.pendientes("u1")) == ["nuevo-2"]
+
+
+def test_consumir_no_pasa_de_lo_guardado(tmp_path):
+    t = _transcripcion(tmp_path)
+    t.guardar("hola", "ok", "u1")
+    pendientes = t.pendientes("u1")
+    t.vaciar()  # /reset durante la auditoría
+    t.consumir(pendientes)
+
+    t.guardar("después del reset", "ok", "u1")
+    assert _textos(t.pendientes("u1")) == ["después del reset"]
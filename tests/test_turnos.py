@@ -0,0 +1,91 @@
+# tests/test_turnos.py
+import os
+import time
+import threading
+
+from core.turnos import TablaCerrojos, bloqueo_archivo
+
+
+def _en_hilos(funcion, n: int):
+    hilos = [threading.Thread(target=funcion, args=(i,)) for i in range(n)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(5)
+        assert not hilo.is_alive()
+
+
+def test_turnos_de_un_usuario_no_se_solapan_y_la_tabla_queda_vacia():
+    tabla = TablaCerrojos()
+    eventos = []
+
+    def turno(i):
+        with tabla.turno(("chat", "u1")):
+            eventos.append(("entra", i))
+            time.sleep(0.01)
+            eventos.append(("sale", i))
+
+    _en_hilos(turno, 6)
+
+    # cada turno sale antes de que entre el siguiente
+    assert len(eventos) == 12
+    for entra, sale in zip(eventos[::2], eventos[1::2]):
+        assert entra[0] == "entra" and sale == ("sale", entra[1])
+    assert len(tabla) == 0
+
+
+def test_usuarios_distintos_no_se_esperan():
+    tabla = TablaCerrojos()
+    b_dentro = threading.Event()
+    resultado = {}
+
+    def usuario_a():
+        with tabla.turno(("chat", "a")):
+            # si el turno de b esperara al de a, esto vencería
+            resultado["a"] = b_dentro.wait(2)
+
+    def usuario_b():
+        with tabla.turno(("chat", "b")):
+            b_dentro.set()
+
+    hilo_a = threading.Thread(target=usuario_a)
+    hilo_a.start()
+    time.sleep(0.02)
+    usuario_b()
+    hilo_a.join(5)
+
+    assert resultado["a"] is True
+    assert len(tabla) == 0
+
+
+def test_excepcion_en_el_turno_libera_el_cerrojo():
+    tabla = TablaCerrojos()
+    try:
+        with tabla.turno(("chat", "u1")):
+            raise ValueError("fallo del agente")
+    except ValueError:
+        pass
+    assert len(tabla) == 0
+    with tabla.turno(("chat", "u1")):
+        pass
+
+
+def test_bloqueo_archivo_serializa_leer_modificar_escribir(tmp_path):
+    ruta = str(tmp_path / "contador.txt")
+    with open(ruta, "w") as f:
+        f.write("0")
+
+    def sumar(_):
+        for _ in range(20):
+            with bloqueo_archivo(ruta):
+                with open(ruta) as f:
+                    valor = int(f.read())
+                time.sleep(0.0005)
+                with open(ruta, "w") as f:
+                    f.write(str(valor + 1))
+
+    _en_hilos(sumar, 5)
+
+    with open(ruta) as f:
+        assert f.read() == "100"
+    assert os.path.exists(ruta + ".lock")